@@ -0,0 +1,500 @@
+"""Schlanke JSON-HTTP-Schnittstelle zum Üben, z.B. für mobile Apps.
+
+    python api.py --port 8503
+
+Ein asyncio-Server ohne Streamlit: ein Baustein-Tipp kostet hier keinen
+Skript-Rerun, der Client ordnet die Bausteine selbst und schickt nur das
+Ergebnis. Daten kommen aus derselben Ablage wie in der App (userdata.py,
+JSON oder SQLite), Verse samt Bausteinen aus verses.py.
+
+    POST /login   {"username", "password"}          -> {"token"}
+    GET  /texts   ?lang=DE&q=&page=0                -> private Texte, Seite der öffentlichen
+    GET  /verse   ?lang=DE&title=...&public=0&index= -> gemischte Bausteine + "challenge"
+    POST /submit  {"challenge", "order": [...]}      -> richtig/falsch (+ "award")
+    POST /award   {"award"}                         -> gutgeschriebene Punkte, neuer Stand
+    GET  /leaderboard ?window=week&lang=DE          -> Top-Liste (all, day, week, month)
+
+Der Server hält keinen Zustand pro Sitzung: Anmeldung, gemischte Reihenfolge
+und Punktanspruch stecken in HMAC-signierten Tokens, die der Client bei jeder
+Anfrage mitschickt (``Authorization: Bearer <token>``). Die Tokens sind nur
+signiert, darum steht in der Challenge nicht der Misch-Seed, sondern eine
+Nonce; den Seed leitet der Server per HMAC aus ihr ab
+(``TokenSigner.derive``), ein Client kann die Reihenfolge also nicht
+zurückrechnen. Jede Instanz
+mit demselben Schlüssel (``VERSER_API_SECRET``, sonst ``user_data/api_secret``)
+kann also jede Anfrage beantworten. Einzige Ausnahme: eingelöste Punkte.
+Der Punktanspruch wird aus dem Challenge-Token abgeleitet (gleiche Challenge,
+gleiche Nonce) und beim Einlösen in der gemeinsamen Ablage vermerkt
+(``userdata.spend_token``), bis die Challenge abläuft. Ein gelöster Vers zahlt
+so genau einmal aus, egal wie oft oder bei welcher Instanz die Challenge
+erneut eingereicht wird. Eine falsche Antwort verbraucht die Challenge
+ebenso und verrät den Text nicht; für einen neuen Versuch holt der Client den
+Vers neu (``GET /verse``).
+
+Blockierende Aufrufe (Dateien, SQLite, bcrypt) laufen im Thread-Pool der
+Event-Loop, alles andere direkt in der Loop.
+"""
+import argparse
+import asyncio
+import base64
+import binascii
+import collections
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import secrets
+import time
+import zlib
+from urllib.parse import parse_qsl, urlsplit
+
+import userdata
+from auth import AuthBusy, client_address, login_keys, login_limiter, needs_rehash, rehash_in_background, verify_password
+from practice import shuffle_chunks
+from leaderboard import ALL_LANGUAGES, WINDOWS
+from userdata import (
+    StorageError, get_leaderboard, get_library_index, get_points_ledger, get_windowed_leaderboard,
+    load_public_text, load_user_verses, save_progress, spend_token,
+)
+
+SECRET_FILE = os.path.join(userdata.USER_DATA_DIR, "api_secret")
+SESSION_TTL = 7 * 24 * 3600 # Sekunden
+VERSE_TTL = 3600
+AWARD_TTL = 300
+MAX_HEADER = 16 * 1024 # Bytes
+MAX_BODY = 64 * 1024
+IDLE_TIMEOUT = 30 # Sekunden bis eine ruhende Keep-Alive-Verbindung geschlossen wird
+LANGUAGE_RE = re.compile(r"[A-Z]{2}$")
+LEADERBOARD_SIZE = 10
+
+REASONS = {
+    200: "OK", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden", 404: "Not Found",
+    405: "Method Not Allowed", 409: "Conflict", 411: "Length Required", 413: "Payload Too Large",
+    429: "Too Many Requests", 500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+logger = logging.getLogger(__name__)
+
+Request = collections.namedtuple("Request", "method path query headers body client_ip")
+
+
+class ApiError(Exception):
+    """Fehlerantwort ``{"error": message}`` mit HTTP-Status."""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class TokenError(Exception):
+    pass
+
+
+# --- Tokens ---
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class TokenSigner:
+    """Signierte, ablaufende Tokens: ``base64(JSON).base64(HMAC-SHA256)``.
+
+    Der Inhalt ist nur signiert, nicht verschlüsselt; ``k`` unterscheidet die
+    Arten, damit z.B. ein Vers-Token nicht als Login gilt.
+    """
+
+    def __init__(self, secret, clock=time.time):
+        self._key = secret.encode("utf-8") if isinstance(secret, str) else secret
+        self._clock = clock
+
+    def _signature(self, body):
+        return hmac.new(self._key, body, hashlib.sha256).digest()
+
+    def derive(self, label, value):
+        """64-Bit-Zahl aus ``HMAC(Schlüssel, label:value)``, ohne Schlüssel nicht vorhersagbar."""
+        digest = hmac.new(self._key, f"{label}:{value}".encode("utf-8"), hashlib.sha256).digest()
+        return int.from_bytes(digest[:8], "big")
+
+    def sign(self, kind, claims, ttl):
+        payload = {**claims, "k": kind, "exp": int(self._clock()) + ttl}
+        body = _b64encode(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        return f"{body}.{_b64encode(self._signature(body.encode('ascii')))}"
+
+    def verify(self, token, kind):
+        """Inhalt des Tokens; ``TokenError``, wenn es gefälscht, abgelaufen oder von anderer Art ist."""
+        try:
+            body, signature = token.split(".")
+            valid = hmac.compare_digest(_b64decode(signature), self._signature(body.encode("ascii")))
+            claims = json.loads(_b64decode(body)) if valid else None
+        except (AttributeError, ValueError, UnicodeError, binascii.Error):
+            raise TokenError("Ungültiges Token.")
+        if not isinstance(claims, dict) or claims.get("k") != kind:
+            raise TokenError("Ungültiges Token.")
+        if claims.get("exp", 0) < self._clock():
+            raise TokenError("Token abgelaufen.")
+        return claims
+
+
+def load_secret(path=SECRET_FILE):
+    """``VERSER_API_SECRET`` oder ein beim ersten Start erzeugter Schlüssel im Datenordner.
+
+    Mehrere Instanzen auf demselben Datenordner teilen sich so den Schlüssel;
+    auf verschiedenen Rechnern muss er per Umgebungsvariable gesetzt werden.
+    """
+    secret = os.environ.get("VERSER_API_SECRET")
+    if secret:
+        return secret
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path, encoding="utf-8") as f:
+            secret = f.read().strip()
+        if secret:
+            return secret
+        raise RuntimeError(f"{path} ist leer.")
+    secret = secrets.token_hex(32)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(secret)
+    return secret
+
+
+def award_nonce(challenge):
+    """Nonce des Punktanspruchs: aus dem Challenge-Token, damit jede Challenge höchstens einmal auszahlt."""
+    return hashlib.sha256(challenge.encode("ascii")).hexdigest()[:32]
+
+
+# --- Üben ---
+
+def verse_checksum(verse):
+    return zlib.crc32(verse.get("text", "").encode("utf-8"))
+
+
+def load_text(username, language_code, title, public):
+    if public:
+        return load_public_text(language_code, title)
+    return load_user_verses(username, language_code).get(title)
+
+
+class ApiServer:
+
+    def __init__(self, signer, limiter=login_limiter):
+        self.signer = signer
+        self.limiter = limiter
+        self.routes = {
+            ("POST", "/login"): self.login,
+            ("GET", "/texts"): self.texts,
+            ("GET", "/verse"): self.verse,
+            ("POST", "/submit"): self.submit,
+            ("POST", "/award"): self.award,
+            ("GET", "/leaderboard"): self.leaderboard,
+        }
+
+    async def blocking(self, function, *args, **kwargs):
+        """Führt Speicherzugriffe u.ä. im Thread-Pool aus; ``StorageError`` wird zu 500."""
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(None, lambda: function(*args, **kwargs))
+        except StorageError as e:
+            raise ApiError(500, str(e))
+
+    # --- Hilfen für die Endpunkte ---
+
+    def authenticate(self, request):
+        header = request.headers.get("authorization", "")
+        scheme, _, token = header.partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            raise ApiError(401, "Anmeldung erforderlich.", {"WWW-Authenticate": "Bearer"})
+        try:
+            return self.signer.verify(token.strip(), "session")["u"]
+        except (TokenError, KeyError) as e:
+            raise ApiError(401, str(e), {"WWW-Authenticate": "Bearer"})
+
+    def claims(self, token, kind, username):
+        try:
+            claims = self.signer.verify(token, kind)
+        except TokenError as e:
+            raise ApiError(400, str(e))
+        if claims.get("u") != username:
+            raise ApiError(403, "Token gehört zu einem anderen Benutzer.")
+        return claims
+
+    @staticmethod
+    def json_body(request):
+        try:
+            body = json.loads(request.body or b"{}")
+        except (ValueError, UnicodeError):
+            raise ApiError(400, "Body ist kein gültiges JSON.")
+        if not isinstance(body, dict):
+            raise ApiError(400, "Body muss ein JSON-Objekt sein.")
+        return body
+
+    @staticmethod
+    def language(request):
+        lang = request.query.get("lang", "")
+        if not LANGUAGE_RE.match(lang):
+            raise ApiError(400, "Parameter lang fehlt oder ist ungültig (z.B. DE).")
+        return lang
+
+    @staticmethod
+    def integer(value, name):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ApiError(400, f"Parameter {name} muss eine Zahl sein.")
+
+    # --- Endpunkte ---
+
+    async def login(self, request):
+        body = self.json_body(request)
+        username, password = body.get("username"), body.get("password")
+        if not isinstance(username, str) or not isinstance(password, str):
+            raise ApiError(400, "username und password sind erforderlich.")
+        keys = login_keys(username, request.client_ip)
+        wait = self.limiter.retry_after(keys)
+        if wait:
+            raise ApiError(429, "Zu viele Fehlversuche.", {"Retry-After": str(int(wait) + 1)})
+        user_data = await self.blocking(userdata.get_user, username)
+        try:
+            valid = user_data is not None and await self.blocking(verify_password, user_data.get("password_hash", ""), password)
+        except AuthBusy as e:
+            raise ApiError(503, str(e), {"Retry-After": "5"})
+        if not valid:
+            self.limiter.failure(keys)
+            raise ApiError(401, "Ungültiger Benutzername oder Passwort.")
+        self.limiter.success(keys)
+        if needs_rehash(user_data["password_hash"]):
+            rehash_in_background(password, lambda password_hash: userdata.set_password_hash(username, password_hash))
+        return {"token": self.signer.sign("session", {"u": username}, SESSION_TTL), "expires_in": SESSION_TTL}
+
+    async def texts(self, request):
+        username = self.authenticate(request)
+        lang = self.language(request)
+        page = max(0, self.integer(request.query.get("page", 0), "page"))
+        private = await self.blocking(load_user_verses, username, lang)
+        index = await self.blocking(get_library_index, lang)
+        titles, total = index.search(request.query.get("q", ""), page)
+        return {
+            "private": [
+                {
+                    "title": title,
+                    "verses": len(details.get("verses", [])),
+                    "mode": details.get("mode", "linear"),
+                    "last_index": details.get("last_index", 0),
+                }
+                for title, details in private.items()
+            ],
+            "public": {"titles": titles, "total": total, "page": page},
+        }
+
+    async def verse(self, request):
+        username = self.authenticate(request)
+        lang = self.language(request)
+        title = request.query.get("title")
+        if not title:
+            raise ApiError(400, "Parameter title fehlt.")
+        public = request.query.get("public", "0").lower() in ("1", "true")
+        details = await self.blocking(load_text, username, lang, title, public)
+        if details is None:
+            raise ApiError(404, "Text nicht gefunden.")
+        verses = details.get("verses", [])
+        if "index" in request.query:
+            index = self.integer(request.query["index"], "index")
+        else:
+            index = details.get("last_index", 0) if not public else 0
+        if not 0 <= index < len(verses):
+            raise ApiError(404, "Vers nicht gefunden.")
+        verse = verses[index]
+        nonce = secrets.token_hex(16)
+        challenge = self.signer.sign("verse", {
+            "u": username, "l": lang, "t": title, "p": public, "i": index, "n": nonce, "c": verse_checksum(verse),
+        }, VERSE_TTL)
+        return {
+            "ref": verse.get("ref"),
+            "index": index,
+            "total": len(verses),
+            "points": verse.get("points", 0),
+            "chunks": shuffle_chunks(verse["chunks"], self.signer.derive("shuffle", nonce)),
+            "challenge": challenge,
+        }
+
+    async def submit(self, request):
+        username = self.authenticate(request)
+        body = self.json_body(request)
+        challenge = body.get("challenge")
+        claims = self.claims(challenge, "verse", username)
+        lang, title, public, index = claims["l"], claims["t"], claims["p"], claims["i"]
+        details = await self.blocking(load_text, username, lang, title, public)
+        verses = (details or {}).get("verses", [])
+        if index >= len(verses) or verse_checksum(verses[index]) != claims["c"]:
+            raise ApiError(409, "Der Text wurde inzwischen geändert. Bitte den Vers neu laden.")
+        verse = verses[index]
+        shuffled = shuffle_chunks(verse["chunks"], self.signer.derive("shuffle", claims["n"]))
+        order = body.get("order")
+        if (not isinstance(order, list) or not all(type(position) is int for position in order)
+                or sorted(order) != list(range(len(shuffled)))):
+            raise ApiError(400, f"order muss jede Position 0-{len(shuffled) - 1} genau einmal enthalten.")
+        correct = " ".join(shuffled[position] for position in order) == verse.get("text", "")
+        next_index = (index + 1) % len(verses)
+        result = {"correct": correct, "next_index": next_index}
+        if not correct:
+            # Sperrt den Punktanspruch dieser Challenge: kein Durchprobieren von Reihenfolgen
+            await self.blocking(spend_token, award_nonce(challenge), claims["exp"])
+            return result
+        result["text"] = verse.get("text", "")
+        if not public and details.get("mode", "linear") == "linear":
+            await self.blocking(save_progress, username, lang, title, last_index=next_index)
+        points = verse.get("points", 0)
+        if points:
+            # "x": bis dahin bleibt die Nonce gesperrt, die Challenge ist so lange gültig
+            award = {"u": username, "p": points, "l": lang, "n": award_nonce(challenge), "x": claims["exp"]}
+            result["award"] = self.signer.sign("award", award, AWARD_TTL)
+        return result
+
+    async def award(self, request):
+        username = self.authenticate(request)
+        claims = self.claims(self.json_body(request).get("award"), "award", username)
+        if not await self.blocking(spend_token, claims["n"], max(claims["exp"], claims.get("x", 0))):
+            raise ApiError(409, "Punkte wurden bereits gutgeschrieben.")
+        try:
+            balance = await self.blocking(get_points_ledger().award, username, claims["p"], lang=claims.get("l"))
+        except KeyError:
+            raise ApiError(404, "Benutzer nicht gefunden.")
+        return {"points": claims["p"], "balance": balance}
+
+    async def leaderboard(self, request):
+        username = self.authenticate(request)
+        window = request.query.get("window", "all")
+        if window != "all" and window not in WINDOWS:
+            raise ApiError(400, f"window muss einer der Werte all, {', '.join(WINDOWS)} sein.")
+        if window == "all":
+            board = await self.blocking(get_leaderboard)
+            top, rank = board.top(LEADERBOARD_SIZE), board.rank(username)
+        else:
+            lang = self.language(request) if "lang" in request.query else ALL_LANGUAGES
+            windowed = await self.blocking(get_windowed_leaderboard)
+            top, rank = windowed.top(window, LEADERBOARD_SIZE, lang), windowed.rank(window, username, lang)
+        return {"top": [{"username": name, "points": points} for name, points in top], "rank": rank}
+
+    # --- HTTP ---
+
+    async def dispatch(self, request):
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in self.routes):
+                raise ApiError(405, "Methode nicht erlaubt.")
+            raise ApiError(404, "Unbekannter Pfad.")
+        return await handler(request)
+
+    async def handle_connection(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        peer_ip = peer[0] if isinstance(peer, tuple) else None
+        try:
+            while True:
+                try:
+                    request, keep_alive = await asyncio.wait_for(read_request(reader, peer_ip), IDLE_TIMEOUT)
+                except ApiError as e:
+                    writer.write(encode_response(e.status, {"error": str(e)}, e.headers, keep_alive=False))
+                    break
+                if request is None:
+                    break
+                headers = {}
+                try:
+                    status, payload = 200, await self.dispatch(request)
+                except ApiError as e:
+                    status, payload, headers = e.status, {"error": str(e)}, e.headers
+                except Exception:
+                    logger.exception("Fehler bei %s %s", request.method, request.path)
+                    status, payload = 500, {"error": "Interner Fehler."}
+                writer.write(encode_response(status, payload, headers, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def read_request(reader, peer_ip=None):
+    """Liest eine HTTP/1.1-Anfrage: ``(Request, keep_alive)`` oder ``(None, False)`` bei Verbindungsende."""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None, False
+    except asyncio.LimitOverrunError:
+        raise ApiError(413, "Header zu groß.")
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ")
+    except ValueError:
+        raise ApiError(400, "Ungültige Anfragezeile.")
+    headers = {}
+    for line in lines[1:]:
+        name, separator, value = line.partition(":")
+        if separator:
+            headers[name.strip().lower()] = value.strip()
+    if "transfer-encoding" in headers:
+        raise ApiError(411, "Nur Anfragen mit Content-Length werden unterstützt.")
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise ApiError(400, "Ungültige Content-Length.")
+    if length > MAX_BODY or length < 0:
+        raise ApiError(413, "Body zu groß.")
+    try:
+        body = await reader.readexactly(length) if length else b""
+    except asyncio.IncompleteReadError:
+        raise ApiError(400, "Body unvollständig.")
+    connection = headers.get("connection", "").lower()
+    keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+    url = urlsplit(target)
+    # Hinter einem vertrauten Proxy zählt für das Login-Limit die ursprüngliche Adresse
+    client_ip = client_address(peer_ip, headers.get("x-forwarded-for"))
+    return Request(method, url.path, dict(parse_qsl(url.query)), headers, body, client_ip), keep_alive
+
+
+def encode_response(status, payload, headers=None, keep_alive=True):
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    lines = [
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+        "Content-Type: application/json; charset=utf-8",
+        f"Content-Length: {len(body)}",
+    ]
+    if not keep_alive:
+        lines.append("Connection: close")
+    lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+
+async def serve(host, port, reuse_port=False):
+    server = ApiServer(TokenSigner(load_secret()))
+    listener = await asyncio.start_server(server.handle_connection, host, port, limit=MAX_HEADER, reuse_port=reuse_port or None)
+    logger.info("API läuft auf %s", ", ".join(str(sock.getsockname()) for sock in listener.sockets))
+    async with listener:
+        await listener.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="JSON-HTTP-Schnittstelle zum Üben (asyncio).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8503)
+    parser.add_argument("--reuse-port", action="store_true",
+                        help="SO_REUSEPORT setzen, damit mehrere Prozesse denselben Port bedienen")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    try:
+        asyncio.run(serve(args.host, args.port, args.reuse_port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,31 @@
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
+import logging
+import math
 import os
-import json
 import random
-import math
-import bcrypt
 import re
-import time # Hinzugefügt für Auto-Advance
-from difflib import SequenceMatcher # Hinzugefügt für Fehlerhervorhebung
-from verses import parse_verses_from_text
+import secrets
+import time # Für Auto-Advance (Fälligkeitszeitpunkt, kein sleep mehr)
+from verses import parse_verses_from_text, VERSE_SCHEMA_VERSION
+from practice import PracticeState, derive_seed, highlight_errors
+from recall import highlight_recall, partial_points
+from srs import ReviewQueue, quality_for
+from library_index import LibraryIndex, PAGE_SIZE as LIBRARY_PAGE_SIZE
+from refs import RefIndex, parse_range
+from moderation import ModerationError, find_forbidden_content
+import metrics
+from metrics import span, timed
+from storage import io_counters, reset_io_counters
+import userdata
+from userdata import StorageError, get_points_ledger, get_leaderboard, get_windowed_leaderboard
+from leaderboard import ALL_LANGUAGES
+from auth import AuthBusy, hash_password, verify_password, needs_rehash, rehash_in_background, login_limiter, login_keys, client_address
 
 # --- Konstanten ---
-USER_DATA_DIR = "user_data"
-USERS_FILE = os.path.join(USER_DATA_DIR, "users.json")
-PUBLIC_VERSES_FILE = os.path.join(USER_DATA_DIR, "public_verses.json")
-MAX_CHUNKS = 8
 COLS_PER_ROW = 4
 LEADERBOARD_SIZE = 10
+LEADERBOARD_WINDOWS = {"Gesamt": None, "Heute": "day", "7 Tage": "week", "30 Tage": "month"} # Anzeige: Fenster
 BIBLE_FORMAT_HELP_URL = "https://bible.benkelm.de/frames.htm?listv.htm"
 AUTO_ADVANCE_DELAY = 2 # Sekunden Verzögerung für Auto-Advance
 
@@ -27,142 +37,121 @@ LANGUAGES = {
 }
 DEFAULT_LANGUAGE = "DE"
 PUBLIC_MARKER = "[P]" # Geändert von [Ö]
+# Benutzer mit Zugriff auf die Metrik-Seite, z.B. VERSER_ADMINS="anna,ben"
+ADMINS = {name.strip() for name in os.environ.get("VERSER_ADMINS", "").split(",") if name.strip()}
 
-# --- Hilfsfunktionen ---
+logger = logging.getLogger(__name__)
 
-os.makedirs(USER_DATA_DIR, exist_ok=True)
-
-# --- Passwort-Funktionen (unverändert) ---
-def hash_password(password):
-    # ... (wie zuvor) ...
-    pw_bytes = password.encode('utf-8')
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(pw_bytes, salt).decode('utf-8')
+# --- Hilfsfunktionen ---
 
-def verify_password(stored_hash, provided_password):
-    # ... (wie zuvor) ...
-    stored_hash_bytes = stored_hash.encode('utf-8')
-    provided_password_bytes = provided_password.encode('utf-8')
+# --- Passwort-Funktionen (bcrypt läuft in auth.py auf einem Thread-Pool) ---
+def client_ip():
+    """IP des Browsers für das Login-Limit (X-Forwarded-For nur hinter VERSER_TRUSTED_PROXIES)."""
     try:
-        return bcrypt.checkpw(provided_password_bytes, stored_hash_bytes)
-    except ValueError:
-        return False
+        return client_address(getattr(st.context, "ip_address", None), st.context.headers.get("X-Forwarded-For"))
+    except Exception:
+        return None
 
-# --- Benutzer Laden/Speichern (unverändert) ---
-def load_users():
-    # ... (wie zuvor) ...
-    if os.path.exists(USERS_FILE):
+def store_rehashed_password(username):
+    def store(password_hash):
         try:
-            with open(USERS_FILE, "r", encoding='utf-8') as f:
-                data = json.load(f)
-                for user, details in data.items():
-                    if 'points' not in details or not isinstance(details['points'], (int, float)):
-                        data[user]['points'] = 0
-                    if 'password_hash' not in details:
-                        pass
-                return data
-        except (json.JSONDecodeError, IOError):
-            st.error("Benutzerdatei konnte nicht gelesen werden.")
-            return {}
-    return {}
-
-def save_users(users):
-    # ... (wie zuvor) ...
-    try:
-        with open(USERS_FILE, "w", encoding='utf-8') as f:
-            json.dump(users, f, indent=2, ensure_ascii=False)
-    except IOError:
-        st.error("Fehler beim Speichern der Benutzerdaten.")
+            userdata.set_password_hash(username, password_hash)
+        except StorageError:
+            pass # Nächster Login versucht es erneut
+    return store
 
+# --- Daten Laden/Speichern (Logik in userdata.py, hier nur die Fehleranzeige) ---
+def get_user(username):
+    try:
+        return userdata.get_user(username)
+    except StorageError as e:
+        st.error(str(e))
+        return None
 
-# --- Verse Laden/Speichern (Stark angepasst für Sprachen) ---
+def has_users():
+    try:
+        return userdata.has_users()
+    except StorageError as e:
+        st.error(str(e))
+        return False
 
-def get_user_verse_file(username):
-    # ... (wie zuvor) ...
-    safe_username = "".join(c for c in username if c.isalnum() or c in ('_', '-')).rstrip()
-    if not safe_username:
-        safe_username = f"user_{random.randint(1000, 9999)}"
-    return os.path.join(USER_DATA_DIR, f"{safe_username}_verses_v2.json") # v2 wegen Sprachstruktur
+def register_user(username, password_hash):
+    # None statt False: ein Speicherfehler ist kein vergebener Benutzername
+    try:
+        return userdata.register_user(username, password_hash)
+    except StorageError as e:
+        st.session_state.register_error = f"{e} Bitte später erneut versuchen."
+        return None
 
 def load_user_verses(username, language_code):
-    """Lädt die privaten Verse eines Benutzers für eine bestimmte Sprache."""
-    filepath = get_user_verse_file(username)
-    if os.path.exists(filepath):
-        try:
-            with open(filepath, "r", encoding='utf-8') as f:
-                all_lang_data = json.load(f)
-                lang_data = all_lang_data.get(language_code, {})
-                # Stelle sicher, dass interne Flags korrekt sind (optional)
-                for title, details in lang_data.items():
-                    details['public'] = False # Sollten alle privat sein
-                    details['language'] = language_code
-                return lang_data
-        except (json.JSONDecodeError, IOError):
-             st.warning(f"Private Versdatei für {username} konnte nicht gelesen werden.")
-             return {}
-    return {}
+    try:
+        return userdata.load_user_verses(username, language_code)
+    except StorageError as e:
+        st.warning(str(e))
+        return {}
 
 def save_user_verses(username, language_code, lang_specific_data):
-    """Speichert die privaten Verse eines Benutzers für eine bestimmte Sprache."""
-    filepath = get_user_verse_file(username)
-    all_data = {}
-    # Lade zuerst alle vorhandenen Sprachen
-    if os.path.exists(filepath):
-        try:
-            with open(filepath, "r", encoding='utf-8') as f:
-                all_data = json.load(f)
-        except (json.JSONDecodeError, IOError):
-            st.warning(f"Konnte alte Daten für {username} nicht laden, überschreibe evtl.")
+    try:
+        userdata.save_user_verses(username, language_code, lang_specific_data)
+    except StorageError as e:
+        st.error(str(e))
 
-    # Update die spezifische Sprache
-    # Stelle sicher, dass nur wirklich private Daten gespeichert werden
-    all_data[language_code] = {title: details for title, details in lang_specific_data.items() if not details.get('public', False)}
+def save_progress(username, language_code, title, last_index=None, mode=None):
+    try:
+        return userdata.save_progress(username, language_code, title, last_index=last_index, mode=mode)
+    except StorageError as e:
+        st.error(str(e))
+        return False
+
+def load_review_cards(username, language_code, deck):
+    try:
+        return userdata.load_review_cards(username, language_code, deck)
+    except StorageError as e:
+        st.warning(str(e))
+        return {}
 
-    # Speichere das gesamte Objekt zurück
+def save_review_card(username, language_code, deck, position, card):
     try:
-        with open(filepath, "w", encoding='utf-8') as f:
-            json.dump(all_data, f, indent=2, ensure_ascii=False)
-    except IOError as e:
-        st.error(f"Fehler beim Speichern der privaten Verse für {username}: {e}")
+        userdata.save_review_card(username, language_code, deck, position, card)
+    except StorageError as e:
+        st.error(str(e))
 
 def load_public_verses(language_code):
-    """Lädt alle öffentlichen Verse für eine bestimmte Sprache."""
-    if os.path.exists(PUBLIC_VERSES_FILE):
-        try:
-            with open(PUBLIC_VERSES_FILE, "r", encoding='utf-8') as f:
-                all_lang_data = json.load(f)
-                lang_data = all_lang_data.get(language_code, {})
-                # Stelle sicher, dass interne Flags korrekt sind
-                for title, details in lang_data.items():
-                    details['public'] = True
-                    details['language'] = language_code
-                return lang_data
-        except (json.JSONDecodeError, IOError):
-            st.warning("Öffentliche Versdatei konnte nicht gelesen werden.")
-            return {}
-    return {}
-
-def save_public_verses(language_code, lang_specific_data):
-    """Speichert alle öffentlichen Verse für eine bestimmte Sprache."""
-    all_data = {}
-     # Lade zuerst alle vorhandenen Sprachen
-    if os.path.exists(PUBLIC_VERSES_FILE):
-        try:
-            with open(PUBLIC_VERSES_FILE, "r", encoding='utf-8') as f:
-                all_data = json.load(f)
-        except (json.JSONDecodeError, IOError):
-            st.warning("Konnte alte öffentliche Daten nicht laden, überschreibe evtl.")
+    try:
+        return userdata.load_public_verses(language_code)
+    except StorageError as e:
+        st.warning(str(e))
+        return {}
+
+def load_public_text(language_code, title):
+    try:
+        return userdata.load_public_text(language_code, title)
+    except StorageError as e:
+        st.warning(str(e))
+        return None
 
-    # Update die spezifische Sprache
-    # Stelle sicher, dass nur als public markierte gespeichert werden
-    all_data[language_code] = {title: details for title, details in lang_specific_data.items() if details.get('public', False)}
+def get_library_index(language_code):
+    try:
+        return userdata.get_library_index(language_code)
+    except StorageError as e:
+        st.warning(str(e))
+        return LibraryIndex()
 
-    # Speichere das gesamte Objekt zurück
+def find_forbidden(text, language_code):
+    # None, wenn die Prüfung nicht möglich ist: dann wird nicht gespeichert
     try:
-        with open(PUBLIC_VERSES_FILE, "w", encoding='utf-8') as f:
-             json.dump(all_data, f, indent=2, ensure_ascii=False)
-    except IOError as e:
-        st.error(f"Fehler beim Speichern der öffentlichen Verse: {e}")
+        return find_forbidden_content(text, language_code)
+    except ModerationError as e:
+        st.sidebar.error(str(e))
+        return None
+
+def add_public_text(language_code, title, details):
+    """True, wenn der Text angelegt wurde, False, wenn der Titel schon existiert; None bei Speicherfehlern."""
+    try:
+        return title in userdata.add_public_texts(language_code, {title: details})
+    except StorageError as e:
+        st.error(str(e))
+        return None
 
 
 # --- Formatprüfungsfunktion (unverändert) ---
@@ -175,76 +164,276 @@ def is_format_likely_correct(text):
     match = re.match(r"^\s*\d+\)\s+", first_line)
     return match is not None
 
-# --- NEU: Einfache Inhaltsprüfung (Platzhalter!) ---
-def contains_forbidden_content(text):
-    """Sehr einfache Prüfung auf unerwünschte Schlüsselwörter."""
-    if not text or not isinstance(text, str):
-        return False
-    text_lower = text.lower()
-    # !! Dies ist nur ein Beispiel - SEHR unzureichend für echte Moderation !!
-    forbidden_keywords = ["sex", "porn", "gamble", "kill", "drogen", "nazi", "hitler", "idiot", "arschloch", "fick"]
-    # Füge hier ggf. weitere, sprachspezifische Begriffe hinzu
-    for keyword in forbidden_keywords:
-        if keyword in text_lower:
-            return True
-    # Prüfung auf "Nonsense" (z.B. nur Zufallszeichen) ist noch schwieriger
-    # Hier könnte man z.B. die Ratio von Vokalen/Konsonanten, Wortlänge etc. prüfen
-    return False
-
-# --- Textbausteine-Funktion (unverändert) ---
-def group_words_into_chunks(words, max_chunks=MAX_CHUNKS):
-    # ... (wie zuvor) ...
-    n_words = len(words)
-    if n_words == 0: return []
-    num_chunks = min(n_words, max_chunks)
-    base_chunk_size = n_words // num_chunks
-    remainder = n_words % num_chunks
-    chunks = []
-    current_index = 0
-    for i in range(num_chunks):
-        chunk_size = base_chunk_size + (1 if i < remainder else 0)
-        chunk_words = words[current_index : current_index + chunk_size]
-        chunks.append(" ".join(chunk_words))
-        current_index += chunk_size
-    return chunks
-
-# --- Leaderboard Anzeige (unverändert) ---
-def display_leaderboard(users):
-    # ... (wie zuvor) ...
+# --- Leaderboard Anzeige (aus dem Top-K-Index, mit Zeitfenstern) ---
+@timed("display_leaderboard")
+def display_leaderboard(current_user=None, language=None):
+    """Zeigt die Top-Liste aus den geteilten Leaderboard-Indizes (ohne Sortieren pro Rerun).
+
+    Neben dem Gesamtstand gibt es rollierende Zeitfenster, optional nur für ``language``.
+    """
     st.markdown("---")
     st.subheader("🏆 Leaderboard")
-    if not users:
+    if not has_users():
         st.write("Noch keine Benutzer registriert.")
         return
-    sorted_users = sorted(
-        users.items(),
-        key=lambda item: item[1].get('points', 0) if isinstance(item[1].get('points'), (int, float)) else 0,
-        reverse=True
-    )
-    for i, (username, data) in enumerate(sorted_users[:LEADERBOARD_SIZE]):
-        points = data.get('points', 0)
+    window_label = st.radio("Zeitraum", list(LEADERBOARD_WINDOWS), horizontal=True, key="leaderboard_window", label_visibility="collapsed")
+    window = LEADERBOARD_WINDOWS[window_label]
+    if window is None:
+        board = get_leaderboard()
+        top = board.top(LEADERBOARD_SIZE)
+        rank_of = board.rank
+        points_of = board.points
+    else:
+        lang = ALL_LANGUAGES
+        if language and st.checkbox(f"Nur {LANGUAGES[language]}", key="leaderboard_language"):
+            lang = language
+        windowed = get_windowed_leaderboard()
+        top = windowed.top(window, LEADERBOARD_SIZE, lang)
+        rank_of = lambda username: windowed.rank(window, username, lang)
+        points_of = lambda username: windowed.points(window, username, lang)
+        if not top:
+            st.write("In diesem Zeitraum wurden noch keine Punkte vergeben.")
+    for i, (username, points) in enumerate(top):
         st.markdown(f"{i+1}. **{username}**: {points} Punkte")
+    # Eigener Platz, falls nicht in den Top
+    if current_user:
+        rank = rank_of(current_user)
+        if rank is not None and rank > LEADERBOARD_SIZE:
+            st.markdown(f"…  \n{rank}. **{current_user}**: {points_of(current_user)} Punkte")
+
+# --- Metriken (nur für Admins) ---
+def export_metrics():
+    """Schreibt die Prometheus-Datei höchstens alle EXPORT_INTERVAL Sekunden; Fehler nur ins Log."""
+    try:
+        metrics.export_if_due(userdata.METRICS_FILE)
+    except OSError as e:
+        logger.warning("Metriken konnten nicht geschrieben werden: %s", e)
+
+def display_metrics_page():
+    """Wohin die Zeit der Reruns dieses Prozesses geht: Spannen und JSON-I/O."""
+    st.title("📊 Metriken")
+    st.caption(f"Prozess {os.getpid()} · Werte seit dem Start oder dem letzten Zurücksetzen · "
+               f"Prometheus-Datei: `{userdata.METRICS_FILE}`")
+    rows = metrics.summary()
+    if rows:
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+    else:
+        st.info("Noch keine Messwerte.")
+    io = io_counters()
+    io_cols = st.columns(4)
+    io_cols[0].metric("JSON gelesen", io["reads"], help="Geparste Dateien (ohne Cache-Treffer)")
+    io_cols[1].metric("Cache-Treffer", io["cache_hits"])
+    io_cols[2].metric("Gelesen (kB)", f"{io['bytes_read'] / 1e3:.1f}")
+    io_cols[3].metric("Geschrieben", io["writes"], help=f"{io['bytes_written'] / 1e3:.1f} kB")
+    if not userdata.use_sqlite():
+        st.caption(f"Gepufferte Fortschrittsänderungen: {userdata.get_progress_buffer().pending_count()}")
+    if st.button("Zurücksetzen", key="reset_metrics"):
+        metrics.reset()
+        reset_io_counters()
+        st.rerun()
+
+# --- Auto-Advance ohne time.sleep ---
+def advance_if_due():
+    """Wechselt zum vorgemerkten nächsten Vers, sobald die Wartezeit abgelaufen ist."""
+    pending = st.session_state.get("auto_advance")
+    if not pending or time.time() < pending["due"]:
+        return
+    del st.session_state["auto_advance"]
+    if pending["random"]:
+        st.session_state.verse_index.pop(pending["text_key"], None)
+    else:
+        st.session_state.verse_index[pending["text_key"]] = pending["next_idx"]
+    reset_practice() # Reset State für nächsten Vers
+    st.rerun(scope="app")
+
+@st.fragment(run_every=AUTO_ADVANCE_DELAY)
+def auto_advance_timer():
+    """Der Browser stößt dieses Fragment nach AUTO_ADVANCE_DELAY erneut an.
+
+    Bis dahin ist der Skript-Thread frei, statt in time.sleep zu warten.
+    """
+    advance_if_due()
+
+def verse_seed(text_key, idx, verse):
+    """Seed der Mischung eines Verses: gleich für dieselbe Session, denselben Text und Vers."""
+    return derive_seed(st.session_state.shuffle_seed, text_key, idx, verse.get("ref"))
+
+def reset_practice():
+    """Verwirft den Zustand des aktuellen Verses (eine Zuweisung, kein Durchsuchen des Session State)."""
+    st.session_state.practice = None
+
+def get_review_queue(username, text_key, verses):
+    """Die Wiederholungs-Queue des gewählten Textes; bleibt über Reruns im Session State."""
+    queue = st.session_state.get("review_queue")
+    if queue is None or not queue.matches(text_key, verses):
+        language_code, deck = text_key
+        queue = ReviewQueue(text_key, verses, load_review_cards(username, language_code, deck))
+        st.session_state.review_queue = queue
+    return queue
+
+def record_review(username, practice, correct):
+    """Meldet das Ergebnis eines Verses einmalig an die Wiederholungs-Queue (SM-2)."""
+    queue = st.session_state.get("review_queue")
+    if practice.reviewed or queue is None or queue.key != practice.text_key:
+        return
+    practice.reviewed = True
+    card = queue.review(practice.index, quality_for(correct, practice.mistakes))
+    save_review_card(username, *practice.text_key, practice.index, card)
+
+def reset_library_page(language_code):
+    """Neue Suche: zurück auf die erste Ergebnisseite."""
+    st.session_state.library_pages[language_code] = 0
+
+def reset_navigation():
+    """Vergisst Versindex, Modus und Versbereich aller Texte, z.B. nach Sprach- oder Textwechsel."""
+    st.session_state.verse_index = {}
+    st.session_state.selected_modes = {}
+    st.session_state.verse_ranges = {}
+    reset_practice()
+
+def step_index(text_key, idx, total_verses, step):
+    """Nächster (``step=1``) bzw. vorheriger (``-1``) Vers; mit gewähltem Bereich nur dessen Verse."""
+    verse_range = st.session_state.verse_ranges.get(text_key)
+    if verse_range is None:
+        return (idx + step) % total_verses
+    positions = verse_range[1]
+    if idx not in positions:
+        return positions[0]
+    return positions[(positions.index(idx) + step) % len(positions)]
+
+def go_to_reference(username, query, current_language, selected_display_title, actual_title, is_public_text, user_verses_private):
+    """Springt zu einer Stelle ("2:8") oder übt nur einen Bereich ("Eph 1:3-14", "Eph 2").
+
+    Gesucht wird zuerst im gewählten Text, dann in den eigenen und zuletzt in
+    den öffentlichen Texten mit demselben Buch.
+    """
+    ref_range = parse_range(query)
+    if ref_range is None:
+        st.warning("Stelle nicht erkannt. Beispiele: 2:8, Eph 1:3-14, Eph 2")
+        return
+    private_index = RefIndex({title: details.get("verses", []) for title, details in user_verses_private.items()})
+    try:
+        public_index = userdata.get_ref_index(current_language)
+    except StorageError as e:
+        st.warning(str(e))
+        public_index = RefIndex()
+
+    current_index = public_index if is_public_text else private_index
+    display_title, positions = selected_display_title, current_index.lookup(ref_range, title=actual_title).get(actual_title)
+    if not positions and ref_range.book is not None:
+        # Anderer Text mit demselben Buch: eigene Texte vor öffentlichen
+        for index, marker in ((private_index, None), (public_index, PUBLIC_MARKER)):
+            hits = index.lookup(ref_range)
+            if hits:
+                title, positions = next(iter(hits.items()))
+                display_title = f"{marker} {title}" if marker else title
+                break
+    if not positions:
+        st.warning(f"{query.strip()} kommt in keinem Text vor.")
+        return
+
+    if display_title != selected_display_title:
+        st.session_state.selected_titles[current_language] = display_title
+        # Ohne eigenen Wert übernimmt die Textauswahl beim nächsten Lauf selected_titles
+        st.session_state.pop(f"selectbox_{username}_{current_language}", None)
+        reset_navigation()
+    text_key = (current_language, display_title)
+    if ref_range.start == ref_range.end:
+        st.session_state.verse_ranges.pop(text_key, None) # Einzelner Vers: nur springen
+    else:
+        st.session_state.verse_ranges[text_key] = (query.strip(), positions)
+    st.session_state.verse_index[text_key] = positions[0]
+    if not display_title.startswith(f"{PUBLIC_MARKER} "):
+        save_progress(username, current_language, display_title, last_index=positions[0])
+    reset_practice()
+    st.rerun()
+
+
+# --- Baustein-Board als Fragment ---
+def rerun_board():
+    """Führt nur das Fragment neu aus; läuft gerade das ganze Skript, dann dieses."""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
 
-# --- NEU: Funktion zur Hervorhebung von Fehlern ---
-def highlight_errors(selected_chunks, correct_chunks):
-    """Erzeugt einen HTML-String, der Fehler in den ausgewählten Chunks hervorhebt."""
-    html_output = []
-    matcher = SequenceMatcher(None, correct_chunks, selected_chunks)
-    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
-        if tag == 'equal':
-            html_output.append(" ".join(selected_chunks[j1:j2]))
-        elif tag == 'replace' or tag == 'insert':
-             # Rot hervorheben, was der User gewählt hat
-            html_output.append(f"<span style='color:red; font-weight:bold;'>{' '.join(selected_chunks[j1:j2])}</span>")
-        elif tag == 'delete':
-             # Optional: anzeigen, was fehlt (hier nicht direkt sichtbar in User-Auswahl)
-             pass
-    # Führe die Teile mit Leerzeichen zusammen (außer am Anfang/Ende)
-    return " ".join(filter(None, html_output))
+@st.fragment
+@timed("chunk_board")
+def chunk_board():
+    """Baustein-Buttons, Auswahlzeile und Rückgängig-Button.
+
+    Ein Klick führt nur dieses Fragment neu aus; das ganze Skript (Login,
+    Dateien, Auswahlfelder, Sidebar, Leaderboard) läuft erst wieder, wenn
+    alle Bausteine gewählt sind und das Feedback angezeigt werden muss.
+    """
+    practice = st.session_state.practice
+    if practice is None: # Vers wurde inzwischen gewechselt
+        return
+    ref = practice.ref
+    shuffled = practice.shuffled # Aus dem Seed berechnet, einmal pro Durchlauf
+    num_chunks = len(shuffled)
+
+    st.markdown(f"🧩 Wähle die Textbausteine:")
+    if practice.last_wrong is not None:
+        # Strenger Modus: sofortiger Hinweis statt Auswertung am Ende
+        st.warning(f"„{shuffled[practice.last_wrong]}“ passt hier nicht. Gesucht ist Baustein {len(practice.picks) + 1} von {num_chunks}.")
+
+    num_rows = math.ceil(num_chunks / COLS_PER_ROW)
+    button_index = 0
+
+    for r in range(num_rows):
+        cols = st.columns(COLS_PER_ROW)
+        for c in range(COLS_PER_ROW):
+            if button_index < num_chunks:
+                chunk_display_index = button_index # Index in der *gemischten* Liste
+                chunk_text = shuffled[chunk_display_index]
+                # Eindeutiger Key pro Button & Ref
+                button_key = f"chunk_btn_{chunk_display_index}_{ref}"
+
+                with cols[c]:
+                    if practice.is_used(chunk_display_index):
+                        st.button(f"~~{chunk_text}~~", key=button_key, disabled=True, use_container_width=True)
+                    else:
+                        if st.button(chunk_text, key=button_key, use_container_width=True):
+                            # Alle ausgewählt -> Feedback braucht die ganze Seite
+                            if practice.pick(chunk_display_index):
+                                practice.feedback_given = True
+                                st.rerun(scope="app")
+                            rerun_board()
+                button_index += 1
+
+
+    # --- NEU: Anzeige der ausgewählten Bausteine (ohne Titel) & Rückgängig-Button ---
+    st.markdown("---") # Trenner
+    sel_chunks_cols = st.columns([5, 1]) # Platz für Button
+    with sel_chunks_cols[0]:
+         # Zeige ausgewählte Chunks (nur Texte)
+         display_text = " ".join(practice.selected_texts()) if practice.picks else "*Noch nichts ausgewählt.*"
+         st.markdown(f"```{display_text}```")
+    with sel_chunks_cols[1]:
+         # NEU: "Letzten zurücknehmen" Button
+         if st.button("↩️", key=f"undo_last_{ref}", help="Letzten Baustein zurücknehmen", disabled=not practice.picks):
+              practice.undo()
+              # Feedback zurücksetzen, falls es durch die letzte Auswahl ausgelöst wurde
+              if practice.feedback_given:
+                   practice.feedback_given = False
+                   st.rerun(scope="app") # Feedback-Bereich ausblenden
+              rerun_board()
+
+    st.markdown("---") # Trenner
+
+
+def typed_board(practice):
+    """Eingabefeld für den Tipp-Modus; "Prüfen" bewertet die Eingabe wortweise (recall.py)."""
+    input_key = f"typed_input_{practice.text_key}_{practice.index}"
+    typed_text = st.text_area("✍️ Tippe den Vers aus dem Gedächtnis:", key=input_key)
+    if st.button("✔️ Prüfen", key=f"typed_check_{practice.text_key}_{practice.index}", disabled=not typed_text.strip()):
+        practice.check_typed(typed_text)
 
 
 # --- App Setup ---
 st.set_page_config(layout="wide")
+export_metrics()
 
 # --- Session State Initialisierung ---
 if "logged_in_user" not in st.session_state: st.session_state.logged_in_user = None
@@ -253,18 +442,25 @@ if "register_error" not in st.session_state: st.session_state.register_error = N
 # NEU: Sprache im State speichern
 if "selected_language" not in st.session_state:
     st.session_state.selected_language = DEFAULT_LANGUAGE
+# Auswahl pro Sprache/Text und der Zustand des aktuellen Verses (ein Objekt statt Keys pro Vers)
+if "selected_titles" not in st.session_state: st.session_state.selected_titles = {}
+if "verse_index" not in st.session_state: reset_navigation()
+if "verse_ranges" not in st.session_state: st.session_state.verse_ranges = {}
+if "practice" not in st.session_state: st.session_state.practice = None
+# Aus diesem Seed werden die Mischungen aller Verse berechnet (statt sie zu speichern)
+if "shuffle_seed" not in st.session_state: st.session_state.shuffle_seed = secrets.randbits(64)
+if "library_pages" not in st.session_state: st.session_state.library_pages = {}
 
 # --- Login / Registrierung / Logout (unverändert) ---
-users = load_users()
-
 if st.session_state.logged_in_user:
     # --- Ansicht für eingeloggte Benutzer ---
     st.sidebar.success(f"Angemeldet als: **{st.session_state.logged_in_user}**")
-    user_points = users.get(st.session_state.logged_in_user, {}).get("points", 0)
+    user_points = get_points_ledger().balance(st.session_state.logged_in_user)
     st.sidebar.markdown(f"**🏆 Deine Punkte: {user_points}**")
 
     if st.sidebar.button("🔒 Logout"):
-        # ... (Logout Logik wie zuvor) ...
+        # Gepufferten Fortschritt jetzt schreiben statt erst beim nächsten Intervall
+        userdata.flush_progress(st.session_state.logged_in_user)
         keys_to_clear = list(st.session_state.keys())
         for key in keys_to_clear:
             # Spracheinstellung evtl. behalten? Oder auch zurücksetzen? Hier zurücksetzen.
@@ -277,11 +473,16 @@ if st.session_state.logged_in_user:
     # --- Hauptanwendung (nur wenn eingeloggt) ---
     username = st.session_state.logged_in_user
 
+    # Metrik-Seite statt der Lernansicht (nur für Admins)
+    if username in ADMINS and st.sidebar.toggle("📊 Metriken", key="show_metrics"):
+        display_metrics_page()
+        st.stop()
+
     # --- Layout mit Leaderboard ---
     main_col, leaderboard_col = st.columns([3, 1])
 
     with leaderboard_col:
-        display_leaderboard(users)
+        display_leaderboard(current_user=username, language=st.session_state.selected_language)
 
     with main_col:
         st.title("📖 Vers-Lern-App")
@@ -306,10 +507,8 @@ if st.session_state.logged_in_user:
             if selected_lang_key != st.session_state.selected_language:
                 st.session_state.selected_language = selected_lang_key
                 # Wichtige States zurücksetzen, da Texte etc. wechseln
-                keys_to_delete = [k for k in st.session_state if k.startswith("selected_display_title_") or k.startswith("selected_mode_") or k.startswith("current_verse_index_")]
-                keys_to_delete.extend(["shuffled_chunks", "selected_chunks", "used_chunks", "feedback_given", "current_ref", "current_verse_data", "points_awarded_for_current_verse"])
-                for key in keys_to_delete:
-                    if key in st.session_state: del st.session_state[key]
+                st.session_state.selected_titles = {}
+                reset_navigation()
                 st.rerun()
 
         # Aktuelle Sprache für den Rest des Codes
@@ -317,52 +516,80 @@ if st.session_state.logged_in_user:
 
         # --- Texte laden (basierend auf Sprache) ---
         user_verses_private = load_user_verses(username, current_language)
-        public_verses = load_public_verses(current_language)
-
-        # Kombiniere Texte für die Auswahl
-        available_texts = {}
-        for title, data in user_verses_private.items():
-            available_texts[title] = {**data, 'source': 'private'}
-        for title, data in public_verses.items():
-            display_title = f"{PUBLIC_MARKER} {title}"
-            available_texts[display_title] = {**data, 'source': 'public', 'original_title': title}
+        library = get_library_index(current_language)
+
+        # Private Texte (pro Benutzer überschaubar) vollständig, öffentliche nur als
+        # eine Seite Suchergebnisse aus dem Index - die Verse lädt erst der gewählte Text
+        available_texts = {title: {**data, 'source': 'private'} for title, data in sorted(user_verses_private.items())}
+        def add_public_option(title):
+            available_texts[f"{PUBLIC_MARKER} {title}"] = {'source': 'public', 'original_title': title}
+
+        search_key = f"library_search_{current_language}"
+        library_page = st.session_state.library_pages.get(current_language, 0)
+        public_titles, public_total = library.search(st.session_state.get(search_key, ""), library_page)
+        for title in public_titles:
+            add_public_option(title)
+
+        # Ausgewählter Titel pro Sprache; ein öffentlicher bleibt wählbar, auch wenn er nicht auf der Seite steht
+        selected_titles = st.session_state.selected_titles
+        previous_title = selected_titles.get(current_language)
+        if previous_title and previous_title not in available_texts and previous_title.startswith(f"{PUBLIC_MARKER} "):
+            if previous_title[len(PUBLIC_MARKER) + 1:] in library:
+                add_public_option(previous_title[len(PUBLIC_MARKER) + 1:])
 
         with sel_col2:
             # Textauswahl
             if not available_texts:
-                st.warning(f"Keine Texte für {LANGUAGES[current_language]} verfügbar.")
+                if len(library):
+                    st.info("Keine öffentlichen Texte gefunden.")
+                else:
+                    st.warning(f"Keine Texte für {LANGUAGES[current_language]} verfügbar.")
                 selected_display_title = None
             else:
-                sorted_titles = sorted(available_texts.keys())
-                # Eindeutiger State Key pro Sprache
-                session_title_key = f"selected_display_title_{current_language}"
-
-                if session_title_key not in st.session_state or st.session_state[session_title_key] not in available_texts:
-                    st.session_state[session_title_key] = sorted_titles[0]
+                title_options = list(available_texts.keys())
+                if selected_titles.get(current_language) not in available_texts:
+                    selected_titles[current_language] = title_options[0]
 
                 selected_display_title = st.selectbox(
                     "Bibeltext",
-                    sorted_titles,
-                    index=sorted_titles.index(st.session_state[session_title_key]),
+                    title_options,
+                    index=title_options.index(selected_titles[current_language]),
                     key=f"selectbox_{username}_{current_language}"
                 )
 
                 # Wenn Textauswahl geändert wurde
-                if selected_display_title != st.session_state[session_title_key]:
-                    st.session_state[session_title_key] = selected_display_title
-                    keys_to_delete = ["shuffled_chunks", "selected_chunks", "used_chunks", "feedback_given", "current_ref", "current_verse_data", "current_verse_index", "points_awarded_for_current_verse"]
-                    # Modus- und Index-Keys könnten auch Text-spezifisch sein
-                    keys_to_delete.extend([k for k in st.session_state if k.startswith("selected_mode_") or k.startswith("current_verse_index_")])
-                    for key in keys_to_delete:
-                        if key in st.session_state: del st.session_state[key]
+                if selected_display_title != selected_titles[current_language]:
+                    selected_titles[current_language] = selected_display_title
+                    reset_navigation()
                     st.rerun()
 
+            # Suche in der öffentlichen Bibliothek (Titel, Stellen, Verstext; letztes Wort als Anfang)
+            if len(library):
+                st.text_input("🔎 Öffentliche Texte suchen", key=search_key, placeholder="Titel, Stelle oder Wort",
+                              on_change=reset_library_page, args=(current_language,))
+                library_pages = max(1, math.ceil(public_total / LIBRARY_PAGE_SIZE))
+                if library_pages > 1:
+                    page_cols = st.columns([1, 3, 1])
+                    with page_cols[0]:
+                        if st.button("◀", key=f"library_prev_{current_language}", disabled=library_page == 0):
+                            st.session_state.library_pages[current_language] = library_page - 1
+                            st.rerun()
+                    with page_cols[1]:
+                        st.caption(f"{public_total} öffentliche Texte · Seite {library_page + 1} von {library_pages}")
+                    with page_cols[2]:
+                        if st.button("▶", key=f"library_next_{current_language}", disabled=library_page + 1 >= library_pages):
+                            st.session_state.library_pages[current_language] = library_page + 1
+                            st.rerun()
+
         # Holen der Textdaten (nur wenn ein Titel ausgewählt wurde)
         if selected_display_title:
             selected_text_info = available_texts[selected_display_title]
             is_public_text = selected_text_info['source'] == 'public'
             actual_title = selected_text_info.get('original_title', selected_display_title)
-            current_text_data = selected_text_info
+            if is_public_text:
+                current_text_data = {**(load_public_text(current_language, actual_title) or {}), **selected_text_info}
+            else:
+                current_text_data = selected_text_info
             verses = current_text_data.get("verses", [])
             total_verses = len(verses)
         else:
@@ -377,7 +604,7 @@ if st.session_state.logged_in_user:
         with sel_col3:
             # Lernmodus Auswahl (Dropdown)
             # Modus "linear" statt "der Reihe nach"
-            mode_options_map = {"linear": "Linear", "random": "Zufällig"} # Intern:Anzeige
+            mode_options_map = {"linear": "Linear", "random": "Zufällig", "srs": "Wiederholen"} # Intern:Anzeige
             mode_keys = list(mode_options_map.keys())
             mode_display_options = list(mode_options_map.values())
 
@@ -386,15 +613,16 @@ if st.session_state.logged_in_user:
                  # Lese Modus aus privaten Daten
                  default_mode_internal = user_verses_private.get(actual_title, {}).get("mode", "linear")
 
-            # Eindeutiger Session Key pro Text und Sprache
-            session_mode_key = f"selected_mode_{current_language}_{selected_display_title}"
+            # Modus pro Text und Sprache
+            text_key = (current_language, selected_display_title)
+            selected_modes = st.session_state.selected_modes
 
             # Initialisiere Modus im State wenn nötig
-            if session_mode_key not in st.session_state:
-                 st.session_state[session_mode_key] = default_mode_internal
+            if text_key not in selected_modes:
+                 selected_modes[text_key] = default_mode_internal
 
             # Finde den Anzeige-Namen für den aktuellen State
-            current_selected_mode_display = mode_options_map.get(st.session_state[session_mode_key], mode_options_map["linear"])
+            current_selected_mode_display = mode_options_map.get(selected_modes[text_key], mode_options_map["linear"])
 
             # Selectbox erstellen
             selected_mode_display = st.selectbox(
@@ -408,34 +636,46 @@ if st.session_state.logged_in_user:
             selected_mode_internal = next(key for key, value in mode_options_map.items() if value == selected_mode_display)
 
             # Speichere Modusänderung (nur für private Texte persistent)
-            if selected_mode_internal != st.session_state[session_mode_key]:
-                 st.session_state[session_mode_key] = selected_mode_internal
+            if selected_mode_internal != selected_modes[text_key]:
+                 selected_modes[text_key] = selected_mode_internal
 
                  if not is_public_text:
-                     # Nur bei privaten Texten in Datei speichern
-                     # Laden -> Ändern -> Speichern
-                     private_texts = load_user_verses(username, current_language)
-                     if actual_title in private_texts:
-                         private_texts[actual_title]["mode"] = selected_mode_internal
-                         save_user_verses(username, current_language, private_texts)
-                     else:
+                     # Nur bei privaten Texten persistent speichern
+                     if not save_progress(username, current_language, actual_title, mode=selected_mode_internal):
                           st.warning(f"Konnte privaten Text '{actual_title}' zum Speichern des Modus nicht finden.")
 
-                 # Reset verse state on mode change
-                 keys_to_delete = ["shuffled_chunks", "selected_chunks", "used_chunks", "feedback_given", "current_ref", "current_verse_data", "current_verse_index", "points_awarded_for_current_verse"]
-                 keys_to_delete.extend([k for k in st.session_state if k.startswith("current_verse_index_")]) # Index auch zurücksetzen
-                 for key in keys_to_delete:
-                     if key in st.session_state: del st.session_state[key]
+                 # Reset verse state on mode change (Index auch zurücksetzen)
+                 st.session_state.verse_index = {}
+                 reset_practice()
                  st.rerun()
 
             # Aktueller Modus für die Logik
-            mode = st.session_state[session_mode_key]
+            mode = selected_modes[text_key]
 
+            # Strenger Modus: jeder Klick wird sofort geprüft (gilt ab dem nächsten Vers,
+            # der angefangene Vers behält seinen Fortschritt)
+            strict_mode = st.checkbox("Streng", key="strict_mode", help="Jeder Baustein wird sofort geprüft; falsche Klicks zählen als Fehlgriff. Gilt ab dem nächsten Vers.")
+            # Tipp-Modus: Vers frei eintippen statt Bausteine wählen
+            typed_mode = st.checkbox("Tippen", key="typed_mode", help="Vers aus dem Gedächtnis eintippen; Teilpunkte je nach Anzahl falscher oder fehlender Wörter.")
+
+
+        # --- Stelle oder Versbereich (z.B. "2:8", "Eph 1:3-14") ---
+        if selected_display_title and total_verses > 0:
+             verse_range = st.session_state.verse_ranges.get(text_key)
+             ref_cols = st.columns([4, 1, 1])
+             with ref_cols[0]:
+                  ref_query = st.text_input("📍 Stelle oder Bereich", key=f"ref_query_{current_language}", placeholder="z.B. 2:8, Eph 1:3-14 oder Eph 2", label_visibility="collapsed")
+             with ref_cols[1]:
+                  if st.button("📍 Üben", key=f"ref_go_{current_language}", use_container_width=True):
+                       go_to_reference(username, ref_query, current_language, selected_display_title, actual_title, is_public_text, user_verses_private)
+             with ref_cols[2]:
+                  if st.button("✖ Alle Verse", key=f"ref_clear_{current_language}", disabled=verse_range is None, use_container_width=True):
+                       st.session_state.verse_ranges.pop(text_key, None)
+                       st.rerun()
 
         # --- NEU: Fortschrittsbalken ---
         if selected_display_title and total_verses > 0:
              # Sicherstellen, dass der Index im State existiert und gültig ist
-             current_verse_index_key = f"current_verse_index_{current_language}_{selected_display_title}"
              # Verwende last_index als Startwert nur wenn Modus linear & Text privat
              start_idx = 0
              if mode == 'linear' and not is_public_text and actual_title in user_verses_private:
@@ -443,13 +683,36 @@ if st.session_state.logged_in_user:
              # Korrigiere Startindex, falls er außerhalb des Bereichs liegt
              start_idx = start_idx if 0 <= start_idx < total_verses else 0
 
+             if mode == "srs":
+                  # Wiederholen: der am frühesten fällige Vers aus der Queue (O(log n))
+                  review_queue = get_review_queue(username, text_key, verses)
+                  if text_key not in st.session_state.verse_index:
+                       next_position, _ = review_queue.next()
+                       st.session_state.verse_index[text_key] = next_position or 0
+
+             elif mode == "random" and text_key not in st.session_state.verse_index:
+                  # Zufällig: nach jedem Vers (Index verworfen) einen neuen wählen, im Bereich nur aus dessen Versen
+                  st.session_state.verse_index[text_key] = random.choice(verse_range[1] if verse_range is not None else range(total_verses))
+
              # Lese aktuellen Index aus Session State, nutze start_idx als Fallback
-             idx = st.session_state.get(current_verse_index_key, start_idx)
+             idx = st.session_state.verse_index.get(text_key, start_idx)
              # Stelle sicher, dass idx immer gültig ist
              idx = max(0, min(idx, total_verses - 1))
-
-             progress_value = (idx + 1) / total_verses
-             st.progress(progress_value, text=f"Vers {idx + 1} von {total_verses}")
+             # Gewählter Bereich: nur dessen Verse (die Wiederholung folgt weiter der Queue)
+             if verse_range is not None and mode != "srs" and idx not in verse_range[1]:
+                  idx = verse_range[1][0]
+
+             if mode == "srs":
+                  due_reviews, new_verses = review_queue.due_count()
+                  learned = total_verses - new_verses
+                  st.progress(learned / total_verses, text=f"Heute fällig: {due_reviews} · Neu: {new_verses} · Gelernt: {learned} von {total_verses}")
+             elif verse_range is not None:
+                  range_label, positions = verse_range
+                  position_in_range = positions.index(idx) + 1
+                  st.progress(position_in_range / len(positions), text=f"{range_label}: Vers {position_in_range} von {len(positions)}")
+             else:
+                  progress_value = (idx + 1) / total_verses
+                  st.progress(progress_value, text=f"Vers {idx + 1} von {total_verses}")
         else:
              idx = 0 # Kein Text oder keine Verse -> Index 0
 
@@ -467,27 +730,31 @@ if st.session_state.logged_in_user:
             elif not new_text: st.sidebar.error("Bitte Text eingeben.")
             elif not is_format_likely_correct(new_text):
                  st.sidebar.error(f"Format nicht korrekt. [Hilfe]({BIBLE_FORMAT_HELP_URL})")
-            # NEU: Inhaltsprüfung
-            elif contains_forbidden_content(new_text):
-                 st.sidebar.error("Inhalt unzulässig. Bitte prüfe den Text.")
+            # NEU: Inhaltsprüfung (ein Durchgang, mit Fundstellen)
+            elif (forbidden := find_forbidden(new_text, current_language)) is None:
+                 pass # Fehler beim Laden der Wortlisten wurde bereits angezeigt
+            elif forbidden:
+                 found = ", ".join(f"'{word}' (Zeile {new_text.count(chr(10), 0, start) + 1})" for start, _, word in forbidden[:3])
+                 st.sidebar.error(f"Inhalt unzulässig: {found}. Bitte prüfe den Text.")
             else:
                 # Alle Prüfungen OK -> Parsen und Speichern
                 try:
-                    parsed = parse_verses_from_text(new_text)
+                    parse_errors = []
+                    parsed = parse_verses_from_text(new_text, errors=parse_errors)
+                    # Übersprungene Zeilen bleiben auch nach dem Rerun sichtbar
+                    st.session_state["parse_errors"] = parse_errors
                     if parsed:
                         if share_publicly:
-                            all_public_verses = load_public_verses(current_language)
-                            if new_title in all_public_verses:
+                            added = add_public_text(current_language, new_title, {"verses": parsed, "schema": VERSE_SCHEMA_VERSION, "public": True, "added_by": username, "language": current_language})
+                            if added is False:
                                 st.sidebar.error(f"Öffentlicher Titel '{new_title}' existiert bereits in dieser Sprache.")
-                            else:
-                                all_public_verses[new_title] = {"verses": parsed, "public": True, "added_by": username, "language": current_language}
-                                save_public_verses(current_language, all_public_verses)
+                            elif added:
                                 st.sidebar.success("Öffentlicher Text gespeichert!")
                                 st.rerun()
                         else:
                             all_user_verses = load_user_verses(username, current_language)
                             if new_title in all_user_verses: st.sidebar.warning("Privater Text wird überschrieben.")
-                            all_user_verses[new_title] = {"verses": parsed, "mode": "linear", "last_index": 0, "public": False, "language": current_language}
+                            all_user_verses[new_title] = {"verses": parsed, "schema": VERSE_SCHEMA_VERSION, "mode": "linear", "last_index": 0, "public": False, "language": current_language}
                             save_user_verses(username, current_language, all_user_verses)
                             st.sidebar.success("Privater Text gespeichert!")
                             st.rerun()
@@ -496,6 +763,12 @@ if st.session_state.logged_in_user:
                 except Exception as e:
                     st.sidebar.error(f"Fehler: {e}")
 
+        if st.session_state.get("parse_errors"):
+            parse_errors = st.session_state["parse_errors"]
+            details = "\n".join(f"- Zeile {err.line_number}: {err.reason}" for err in parse_errors[:5])
+            more = f"\n- … und {len(parse_errors) - 5} weitere" if len(parse_errors) > 5 else ""
+            st.sidebar.warning(f"{len(parse_errors)} Zeile(n) übersprungen:\n{details}{more}")
+
 
         # --- Haupt-Lernlogik (nur wenn Text ausgewählt und Verse vorhanden) ---
         if selected_display_title and verses:
@@ -504,228 +777,150 @@ if st.session_state.logged_in_user:
                 # Sicherstellen, dass idx gültig ist (wird oben bereits gemacht)
                 idx = max(0, min(idx, len(verses) - 1)) # Doppelte Sicherheit
                 current_verse = verses[idx]
-                tokens = current_verse.get("text", "").split()
-                original_chunks = group_words_into_chunks(tokens, MAX_CHUNKS)
+                # Bausteine, Wortanzahl und Punkte wurden beim Speichern berechnet (verses.plan_verse)
+                original_chunks = current_verse["chunks"]
                 num_chunks = len(original_chunks)
 
                 # --- Leere Verse Behandlung ---
-                if not tokens or not original_chunks:
+                if not original_chunks:
                      st.warning(f"Vers {current_verse.get('ref', '')} ist leer oder konnte nicht verarbeitet werden.")
                      # --- NEU: Buttons für Navigation bei leerem Vers ---
                      nav_cols = st.columns(5)
                      with nav_cols[0]: # Vorheriger Vers Button (nur linear)
                          show_prev_button = (mode == 'linear' and total_verses > 1)
                          if st.button("⬅️ Zurück", key="prev_verse_button_empty", disabled=not show_prev_button):
-                             prev_idx = (idx - 1 + total_verses) % total_verses
-                             st.session_state[current_verse_index_key] = prev_idx
+                             prev_idx = step_index(text_key, idx, total_verses, -1)
+                             st.session_state.verse_index[text_key] = prev_idx
                              if not is_public_text: # Nur bei privaten Texten persistieren
-                                  private_data = load_user_verses(username, current_language)
-                                  if actual_title in private_data:
-                                      private_data[actual_title]["last_index"] = prev_idx
-                                      save_user_verses(username, current_language, private_data)
-                             # Reset State für den neuen (vorherigen) Vers
-                             keys_to_delete = ["shuffled_chunks", "selected_chunks", "used_chunks", "feedback_given", "current_ref", "current_verse_data", "points_awarded_for_current_verse"]
-                             for key in keys_to_delete:
-                                 if key in st.session_state: del st.session_state[key]
+                                  save_progress(username, current_language, actual_title, last_index=prev_idx)
+                             reset_practice() # Reset State für den neuen (vorherigen) Vers
                              st.rerun()
                      with nav_cols[4]: # Nächster Vers Button
                          if st.button("➡️ Überspringen", key="skip_verse_button_empty"):
-                             next_idx = (idx + 1) % total_verses
-                             st.session_state[current_verse_index_key] = next_idx
+                             next_idx = step_index(text_key, idx, total_verses, 1)
+                             st.session_state.verse_index[text_key] = next_idx
                              if mode == 'linear' and not is_public_text: # Nur bei linearen, privaten Texten persistieren
-                                  private_data = load_user_verses(username, current_language)
-                                  if actual_title in private_data:
-                                      private_data[actual_title]["last_index"] = next_idx
-                                      save_user_verses(username, current_language, private_data)
-                             # Reset State für nächsten Vers
-                             keys_to_delete = ["shuffled_chunks", "selected_chunks", "used_chunks", "feedback_given", "current_ref", "current_verse_data", "points_awarded_for_current_verse"]
-                             if mode == "random":
-                                 if current_verse_index_key in st.session_state: del st.session_state[current_verse_index_key]
-                             for key in keys_to_delete:
-                                 if key in st.session_state: del st.session_state[key]
+                                  save_progress(username, current_language, actual_title, last_index=next_idx)
+                             if mode != "linear":
+                                 st.session_state.verse_index.pop(text_key, None)
+                             reset_practice() # Reset State für nächsten Vers
                              st.rerun()
 
                 else:
                     # --- State Initialisierung für den aktuellen Vers ---
-                    # Verwende Ref UND Index für State-Keys, um bei Zufall sicher zu sein
-                    verse_state_base_key = f"{current_language}_{selected_display_title}_{current_verse.get('ref', idx)}"
-
-                    # Initialisiere, wenn nötig oder wenn sich Ref geändert hat
-                    if f"shuffled_chunks_{verse_state_base_key}" not in st.session_state or st.session_state.get("current_ref") != current_verse["ref"]:
-                        st.session_state[f"shuffled_chunks_{verse_state_base_key}"] = random.sample(original_chunks, num_chunks)
-                        # NEU: Speichere ausgewählte Chunks als Liste von Tupeln: (text, original_shuffled_index)
-                        st.session_state[f"selected_chunks_{verse_state_base_key}"] = []
-                        st.session_state[f"used_chunks_{verse_state_base_key}"] = [False] * num_chunks
-                        st.session_state[f"feedback_given_{verse_state_base_key}"] = False
-                        # Globale Refs für einfachere Prüfung
-                        st.session_state["current_ref"] = current_verse["ref"]
-                        st.session_state["current_verse_data"] = { # Allgemeine Daten für Feedback etc.
-                            "ref": current_verse["ref"],
-                            "text": current_verse["text"],
-                            "original_chunks": original_chunks,
-                            "tokens": tokens
-                        }
-                        st.session_state[f"points_awarded_{verse_state_base_key}"] = False
-
-
-                    # Lese aktuellen State für diesen Vers
-                    shuffled_chunks = st.session_state[f"shuffled_chunks_{verse_state_base_key}"]
-                    selected_chunks_list = st.session_state[f"selected_chunks_{verse_state_base_key}"] # Liste der Tupel
-                    used_chunks = st.session_state[f"used_chunks_{verse_state_base_key}"]
-                    feedback_given = st.session_state[f"feedback_given_{verse_state_base_key}"]
-                    points_awarded = st.session_state[f"points_awarded_{verse_state_base_key}"]
+                    # Ein Objekt pro Session; passt es nicht mehr zum Vers, wird es ersetzt
+                    practice = st.session_state.practice
+                    # "Streng" wirkt erst beim nächsten Vers; "Tippen" wechselt die Eingabe sofort
+                    if (practice is None or practice.typed != typed_mode
+                            or not practice.is_for(text_key, idx, current_verse)):
+                        # Die Mischung folgt aus dem Seed; ein neuer Zustand kostet nur ein paar Felder
+                        practice = PracticeState(text_key, idx, current_verse, verse_seed(text_key, idx, current_verse), strict=strict_mode, typed=typed_mode)
+                        st.session_state.practice = practice
 
 
                     # --- Anzeige der Baustein-Buttons ---
                     st.markdown(f"### 📌 {current_verse['ref']}")
-                    st.markdown(f"🧩 Wähle die Textbausteine:")
-
-                    num_rows = math.ceil(num_chunks / COLS_PER_ROW)
-                    button_index = 0
-
-                    for r in range(num_rows):
-                        cols = st.columns(COLS_PER_ROW)
-                        for c in range(COLS_PER_ROW):
-                            if button_index < num_chunks:
-                                chunk_display_index = button_index # Index in der *gemischten* Liste
-                                chunk_text = shuffled_chunks[chunk_display_index]
-                                is_used = used_chunks[chunk_display_index]
-                                # Eindeutiger Key pro Button & Ref
-                                button_key = f"chunk_btn_{chunk_display_index}_{current_verse['ref']}"
-
-                                with cols[c]:
-                                    if is_used:
-                                        st.button(f"~~{chunk_text}~~", key=button_key, disabled=True, use_container_width=True)
-                                    else:
-                                        if st.button(chunk_text, key=button_key, use_container_width=True):
-                                            # Füge Tupel zur Liste hinzu
-                                            selected_chunks_list.append((chunk_text, chunk_display_index))
-                                            used_chunks[chunk_display_index] = True
-                                            st.session_state[f"selected_chunks_{verse_state_base_key}"] = selected_chunks_list
-                                            st.session_state[f"used_chunks_{verse_state_base_key}"] = used_chunks
-
-
-                                            # Prüfe, ob alle ausgewählt wurden -> Feedback
-                                            if len(selected_chunks_list) == num_chunks:
-                                                st.session_state[f"feedback_given_{verse_state_base_key}"] = True
-                                                feedback_given = True # Update lokale Variable für sofortige Anzeige
-
-                                            st.rerun()
-                                button_index += 1
-
-
-                    # --- NEU: Anzeige der ausgewählten Bausteine (ohne Titel) & Rückgängig-Button ---
-                    st.markdown("---") # Trenner
-                    sel_chunks_cols = st.columns([5, 1]) # Platz für Button
-                    with sel_chunks_cols[0]:
-                         # Zeige ausgewählte Chunks (nur Texte)
-                         display_text = " ".join([item[0] for item in selected_chunks_list]) if selected_chunks_list else "*Noch nichts ausgewählt.*"
-                         st.markdown(f"```{display_text}```")
-                    with sel_chunks_cols[1]:
-                         # NEU: "Letzten zurücknehmen" Button
-                         if st.button("↩️", key=f"undo_last_{verse_state_base_key}", help="Letzten Baustein zurücknehmen", disabled=not selected_chunks_list):
-                              if selected_chunks_list:
-                                  last_chunk_text, last_original_index = selected_chunks_list.pop()
-                                  # Markiere den entsprechenden Button wieder als verfügbar
-                                  used_chunks[last_original_index] = False
-                                  # Update State
-                                  st.session_state[f"selected_chunks_{verse_state_base_key}"] = selected_chunks_list
-                                  st.session_state[f"used_chunks_{verse_state_base_key}"] = used_chunks
-                                  # Feedback zurücksetzen, falls es durch die letzte Auswahl ausgelöst wurde
-                                  if feedback_given and len(selected_chunks_list) < num_chunks:
-                                       st.session_state[f"feedback_given_{verse_state_base_key}"] = False
-                                  st.rerun()
-
-
-                    st.markdown("---") # Trenner
+                    if practice.typed:
+                        typed_board(practice)
+                    else:
+                        # Klicks auf Bausteine laufen nur im Fragment neu, nicht im ganzen Skript
+                        chunk_board()
 
 
                     # --- Feedback & Navigation ---
-                    if feedback_given:
-                        user_input_chunks = [item[0] for item in selected_chunks_list]
-                        user_input_text = " ".join(user_input_chunks)
-                        correct_text = st.session_state["current_verse_data"].get("text", "")
-                        correct_chunks_original = st.session_state["current_verse_data"].get("original_chunks", [])
-                        original_tokens_count = len(st.session_state["current_verse_data"].get("tokens", []))
+                    if practice.feedback_given:
+                        user_input_chunks = practice.selected_texts()
+                        correct_text = practice.verse.get("text", "")
+                        correct_chunks_original = practice.verse.get("chunks", [])
+                        verse_points = practice.verse.get("points", 0)
+
+                        if practice.typed:
+                            is_correct = practice.recall.distance == 0
+                            if practice.mistakes:
+                                verse_points = 0 # Volle Punkte nur im ersten Versuch
+                        elif practice.strict:
+                            # Jeder Klick wurde schon geprüft, die Auswahl ist vollständig und richtig
+                            is_correct = True
+                            if practice.mistakes:
+                                verse_points = 0 # Punkte nur ohne Fehlgriff
+                        else:
+                            is_correct = (" ".join(user_input_chunks) == correct_text)
 
-                        is_correct = (user_input_text == correct_text)
+                        if mode == "srs":
+                            record_review(username, practice, is_correct)
 
                         if is_correct:
                             st.success("✅ Richtig!")
-                            if not points_awarded:
-                                current_points = users.get(username, {}).get("points", 0)
-                                users[username]["points"] = current_points + original_tokens_count
-                                save_users(users)
-                                st.session_state[f"points_awarded_{verse_state_base_key}"] = True
+                            if practice.typed and practice.mistakes:
+                                st.info("Punkte gibt es nur für den ersten Versuch.")
+                            elif practice.mistakes:
+                                st.info(f"{practice.mistakes} Fehlgriff(e) - diesmal ohne Punkte.")
+                            if not practice.points_awarded:
+                                if verse_points:
+                                    with span("award_points"):
+                                        get_points_ledger().award(username, verse_points, lang=current_language)
+                                practice.points_awarded = True
                                 st.balloons()
+                                # --- Auto-Advance vormerken (Logik wie im Button) ---
+                                next_idx = step_index(text_key, idx, total_verses, 1)
+                                if mode == 'linear' and not is_public_text:
+                                    save_progress(username, current_language, actual_title, last_index=next_idx)
+                                st.session_state["auto_advance"] = {
+                                    "due": time.time() + AUTO_ADVANCE_DELAY,
+                                    "text_key": text_key,
+                                    "next_idx": next_idx,
+                                    "random": mode != "linear", # Nächsten Vers neu wählen
+                                }
                             st.markdown(f"<div style='background-color:#e6ffed; color:#094d21; padding:10px; border-radius:5px; border: 1px solid #b3e6c5;'><b>{correct_text}</b></div>", unsafe_allow_html=True)
 
-                            # --- NEU: Auto-Advance ---
+                            # --- Auto-Advance: der Timer läuft im Browser, nicht im Skript-Thread ---
                             st.markdown("➡️ Nächster Vers in Kürze...")
-                            time.sleep(AUTO_ADVANCE_DELAY)
-                            # Logik für nächsten Vers (wie im Button)
-                            next_idx = (idx + 1) % total_verses
-                            st.session_state[current_verse_index_key] = next_idx
-                            if mode == 'linear' and not is_public_text:
-                                private_data = load_user_verses(username, current_language)
-                                if actual_title in private_data:
-                                    private_data[actual_title]["last_index"] = next_idx
-                                    save_user_verses(username, current_language, private_data)
-                            # Reset State für nächsten Vers
-                            keys_to_delete = ["shuffled_chunks", "selected_chunks", "used_chunks", "feedback_given", "current_ref", "current_verse_data", "points_awarded_for_current_verse"]
-                            keys_to_delete.extend([k for k in st.session_state if k.startswith(f"shuffled_chunks_{verse_state_base_key.split('_')[0]}_{verse_state_base_key.split('_')[1]}")]) # Alle States für diesen Text/Sprache löschen? Vorsicht!
-                            # Sicherer: Nur die spezifischen für diesen Ref löschen
-                            keys_to_delete.extend([k for k in st.session_state if verse_state_base_key in k])
-
-                            if mode == "random":
-                                if current_verse_index_key in st.session_state: del st.session_state[current_verse_index_key]
-                            for key in keys_to_delete:
-                                if key in st.session_state: del st.session_state[key]
-                            st.rerun()
+                            auto_advance_timer()
 
                         else: # Falsche Antwort
-                            st.error("❌ Leider falsch.")
-                            # --- NEU: Fehler hervorheben ---
-                            highlighted_input = highlight_errors(user_input_chunks, correct_chunks_original)
+                            if practice.typed:
+                                recall_result = practice.recall
+                                st.error(f"❌ {recall_result.distance} Fehler bei {recall_result.words} Wörtern.")
+                                if practice.partial_points is None:
+                                    # Teilpunkte einmal, für den ersten Versuch
+                                    practice.partial_points = partial_points(recall_result, practice.verse.get("points", 0)) if practice.mistakes == 1 else 0
+                                    if practice.partial_points:
+                                        with span("award_points"):
+                                            get_points_ledger().award(username, practice.partial_points, lang=current_language)
+                                if practice.partial_points:
+                                    st.info(f"{practice.partial_points} Teilpunkte. Korrigiere die Eingabe und prüfe erneut.")
+                                highlighted_input = highlight_recall(recall_result.edits)
+                            else:
+                                st.error("❌ Leider falsch.")
+                                # --- NEU: Fehler hervorheben ---
+                                highlighted_input = highlight_errors(user_input_chunks, correct_chunks_original)
                             st.markdown("<b>Deine Eingabe (Fehler markiert):</b>", unsafe_allow_html=True)
                             st.markdown(f"<div style='background-color:#ffebeb; color:#8b0000; padding:10px; border-radius:5px; border: 1px solid #f5c6cb;'>{highlighted_input}</div>", unsafe_allow_html=True)
                             st.markdown("<b>Korrekt wäre:</b>", unsafe_allow_html=True)
                             st.markdown(f"<div style='background-color:#e6ffed; color:#094d21; padding:10px; border-radius:5px; border: 1px solid #b3e6c5; margin-top: 5px;'>{correct_text}</div>", unsafe_allow_html=True)
-                            st.session_state[f"points_awarded_{verse_state_base_key}"] = False # Keine Punkte
+                            practice.points_awarded = False # Keine Punkte
 
                             # --- NEU: Buttons bei falscher Antwort (Zurück / Nächster Vers) ---
                             nav_cols_feedback = st.columns([1,3,1])
                             with nav_cols_feedback[0]: # Vorheriger Vers Button
                                 show_prev_button = (mode == 'linear' and total_verses > 1)
                                 if st.button("⬅️ Zurück", key="prev_verse_button_feedback", disabled=not show_prev_button):
-                                    prev_idx = (idx - 1 + total_verses) % total_verses
-                                    st.session_state[current_verse_index_key] = prev_idx
+                                    prev_idx = step_index(text_key, idx, total_verses, -1)
+                                    st.session_state.verse_index[text_key] = prev_idx
                                     if not is_public_text: # Persistieren
-                                        private_data = load_user_verses(username, current_language)
-                                        if actual_title in private_data:
-                                            private_data[actual_title]["last_index"] = prev_idx
-                                            save_user_verses(username, current_language, private_data)
-                                    # Reset State
-                                    keys_to_delete = [k for k in st.session_state if verse_state_base_key in k or k == "current_verse_data" or k == "current_ref"]
-                                    for key in keys_to_delete:
-                                        if key in st.session_state: del st.session_state[key]
+                                        save_progress(username, current_language, actual_title, last_index=prev_idx)
+                                    reset_practice()
                                     st.rerun()
 
                             with nav_cols_feedback[2]: # Nächster Vers Button
                                 if st.button("➡️ Nächster Vers", key="next_verse_button_feedback"):
-                                    next_idx = (idx + 1) % total_verses
-                                    st.session_state[current_verse_index_key] = next_idx
+                                    next_idx = step_index(text_key, idx, total_verses, 1)
+                                    st.session_state.verse_index[text_key] = next_idx
                                     if mode == 'linear' and not is_public_text: # Persistieren
-                                        private_data = load_user_verses(username, current_language)
-                                        if actual_title in private_data:
-                                            private_data[actual_title]["last_index"] = next_idx
-                                            save_user_verses(username, current_language, private_data)
-                                    # Reset State
-                                    keys_to_delete = [k for k in st.session_state if verse_state_base_key in k or k == "current_verse_data" or k == "current_ref"]
-                                    if mode == "random":
-                                        if current_verse_index_key in st.session_state: del st.session_state[current_verse_index_key]
-                                    for key in keys_to_delete:
-                                        if key in st.session_state: del st.session_state[key]
+                                        save_progress(username, current_language, actual_title, last_index=next_idx)
+                                    if mode != "linear":
+                                        st.session_state.verse_index.pop(text_key, None)
+                                    reset_practice()
                                     st.rerun()
 
 else: # Nicht eingeloggt
@@ -738,8 +933,22 @@ else: # Nicht eingeloggt
         login_username = st.text_input("Benutzername", key="login_user")
         login_password = st.text_input("Passwort", type="password", key="login_pw")
         if st.button("Login", key="login_button"):
-            user_data = users.get(login_username)
-            if user_data and verify_password(user_data.get("password_hash", ""), login_password):
+            keys = login_keys(login_username, client_ip())
+            wait = login_limiter.retry_after(keys)
+            user_data = None if wait else get_user(login_username)
+            valid = None
+            if wait:
+                st.session_state.login_error = f"Zu viele Fehlversuche. Bitte in {math.ceil(wait)} Sekunden erneut versuchen."
+            else:
+                try:
+                    valid = user_data is not None and verify_password(user_data.get("password_hash", ""), login_password)
+                except AuthBusy as e:
+                    st.session_state.login_error = str(e)
+            if valid:
+                login_limiter.success(keys)
+                if needs_rehash(user_data["password_hash"]):
+                    # Kostenfaktor geändert: Hash im Hintergrund erneuern
+                    rehash_in_background(login_password, store_rehashed_password(login_username))
                 st.session_state.logged_in_user = login_username
                 st.session_state.login_error = None
                 if "register_error" in st.session_state: del st.session_state.register_error
@@ -747,7 +956,9 @@ else: # Nicht eingeloggt
                 st.session_state.selected_language = DEFAULT_LANGUAGE
                 st.rerun()
             else:
-                st.session_state.login_error = "Ungültiger Benutzername oder Passwort."
+                if valid is False:
+                    login_limiter.failure(keys)
+                    st.session_state.login_error = "Ungültiger Benutzername oder Passwort."
                 st.error(st.session_state.login_error)
         elif st.session_state.login_error:
              st.error(st.session_state.login_error)
@@ -763,21 +974,27 @@ else: # Nicht eingeloggt
                  st.session_state.register_error = "Bitte alle Felder ausfüllen."
             elif reg_password != reg_password_confirm:
                  st.session_state.register_error = "Passwörter stimmen nicht überein."
-            elif reg_username in users:
+            elif get_user(reg_username) is not None:
                  st.session_state.register_error = "Benutzername bereits vergeben."
             elif len(reg_password) < 6:
                  st.session_state.register_error = "Passwort muss mind. 6 Zeichen lang sein."
             else:
-                 password_hash = hash_password(reg_password)
-                 users[reg_username] = {"password_hash": password_hash, "points": 0}
-                 save_users(users)
-                 st.session_state.logged_in_user = reg_username
-                 st.session_state.register_error = None
-                 if "login_error" in st.session_state: del st.session_state.login_error
-                 # Sprache auf Default setzen beim Registrieren/Login
-                 st.session_state.selected_language = DEFAULT_LANGUAGE
-                 st.success(f"Benutzer '{reg_username}' registriert & angemeldet!")
-                 st.rerun()
+                 try:
+                     registered = register_user(reg_username, hash_password(reg_password))
+                 except AuthBusy as e:
+                     registered = None
+                     st.session_state.register_error = str(e)
+                 if registered is False:
+                     # Jemand anderes war schneller
+                     st.session_state.register_error = "Benutzername bereits vergeben."
+                 elif registered:
+                     st.session_state.logged_in_user = reg_username
+                     st.session_state.register_error = None
+                     if "login_error" in st.session_state: del st.session_state.login_error
+                     # Sprache auf Default setzen beim Registrieren/Login
+                     st.session_state.selected_language = DEFAULT_LANGUAGE
+                     st.success(f"Benutzer '{reg_username}' registriert & angemeldet!")
+                     st.rerun()
             if st.session_state.register_error:
                 st.error(st.session_state.register_error)
         elif st.session_state.register_error:
@@ -788,4 +1005,4 @@ else: # Nicht eingeloggt
     st.title("📖 Vers-Lern-App")
     st.markdown("Bitte melde dich an oder registriere dich.")
     st.markdown("---")
-    display_leaderboard(users)
\ No newline at end of file
+    display_leaderboard()
\ No newline at end of file
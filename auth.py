@@ -0,0 +1,195 @@
+"""Passwort-Hashing außerhalb des Streamlit-Skript-Threads.
+
+bcrypt läuft auf einem kleinen, begrenzten Thread-Pool (bcrypt gibt dabei den
+GIL frei). Meldet sich eine ganze Klasse gleichzeitig an, warten die Anfragen
+in einer Warteschlange fester Größe, statt dass jeder Server-Thread selbst
+eine Viertelsekunde rechnet; wer auch dort nach QUEUE_TIMEOUT keinen Platz
+bekommt, wird abgewiesen.
+
+Der Kostenfaktor kommt aus ``VERSER_BCRYPT_ROUNDS`` (Standard 12). Hashes mit
+anderem Faktor werden beim nächsten erfolgreichen Login im Hintergrund neu
+berechnet. ``AttemptLimiter`` begrenzt Fehlversuche pro Benutzername und IP,
+damit ein Brute-Force-Versuch die CPU nicht auslasten kann. ``X-Forwarded-For``
+zählt dabei nur, wenn die Verbindung von einem Proxy aus
+``VERSER_TRUSTED_PROXIES`` kommt; sonst könnte jeder Client mit einer neuen
+Kopfzeile pro Versuch das IP-Limit umgehen.
+"""
+import collections
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.environ.get("VERSER_BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.environ.get("VERSER_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+MAX_PENDING = HASH_WORKERS * 4 # Laufende + wartende Hash-Aufträge
+QUEUE_TIMEOUT = 5 # Sekunden Wartezeit auf einen Platz in der Warteschlange
+HASH_TIMEOUT = 10 # Sekunden
+
+MAX_ATTEMPTS_PER_USER = 5
+MAX_ATTEMPTS_PER_IP = 20
+ATTEMPT_WINDOW = 300 # Sekunden
+BUSY_MESSAGE = "Der Server ist gerade ausgelastet. Bitte in ein paar Sekunden erneut versuchen."
+# Adressen vorgeschalteter Proxies, z.B. VERSER_TRUSTED_PROXIES="127.0.0.1,10.0.0.5"
+TRUSTED_PROXIES = {ip.strip() for ip in os.environ.get("VERSER_TRUSTED_PROXIES", "").split(",") if ip.strip()}
+
+
+class AuthBusy(Exception):
+    """Zu viele gleichzeitige Hash-Aufträge; später erneut versuchen."""
+
+
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+_pending = threading.BoundedSemaphore(MAX_PENDING)
+
+
+def _submit(fn, *args, block=True):
+    """Reiht ``fn`` auf dem Pool ein und liefert das Future."""
+    if not (_pending.acquire(timeout=QUEUE_TIMEOUT) if block else _pending.acquire(blocking=False)):
+        raise AuthBusy(BUSY_MESSAGE)
+    try:
+        future = _executor.submit(fn, *args)
+    except BaseException:
+        _pending.release()
+        raise
+    future.add_done_callback(lambda _: _pending.release())
+    return future
+
+
+def _result(future):
+    try:
+        return future.result(HASH_TIMEOUT)
+    except FutureTimeout:
+        raise AuthBusy(BUSY_MESSAGE)
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(stored_hash, password):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), stored_hash.encode('utf-8'))
+    except ValueError:
+        return False
+
+
+def hash_password(password, rounds=None):
+    return _result(_submit(_hash, password, rounds or BCRYPT_ROUNDS))
+
+
+def verify_password(stored_hash, provided_password):
+    if not stored_hash:
+        return False
+    return _result(_submit(_check, stored_hash, provided_password))
+
+
+def hash_rounds(stored_hash):
+    """Kostenfaktor eines bcrypt-Hashes ("$2b$12$..." -> 12), None wenn unlesbar."""
+    try:
+        return int(stored_hash.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def needs_rehash(stored_hash):
+    return hash_rounds(stored_hash) != BCRYPT_ROUNDS
+
+
+def rehash_in_background(password, store):
+    """Berechnet den Hash mit BCRYPT_ROUNDS neu und übergibt ihn an ``store(hash)``.
+
+    Der Login wartet nicht darauf; ist der Pool voll, wird es beim nächsten
+    Login erneut versucht.
+    """
+    try:
+        future = _submit(_hash, password, BCRYPT_ROUNDS, block=False)
+    except AuthBusy:
+        return
+    future.add_done_callback(lambda f: f.exception() is None and store(f.result()))
+
+
+class AttemptLimiter:
+    """Gleitendes Zeitfenster für Fehlversuche, getrennt nach Schlüssel.
+
+    Schlüssel sind z.B. ``("user", name)`` oder ``("ip", adresse)``; ``limits``
+    bildet die Art auf die erlaubte Anzahl Fehlversuche pro Fenster ab.
+    """
+
+    def __init__(self, limits=None, window=ATTEMPT_WINDOW, clock=time.monotonic):
+        self.limits = limits or {"user": MAX_ATTEMPTS_PER_USER, "ip": MAX_ATTEMPTS_PER_IP}
+        self.window = window
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = {} # Schlüssel -> deque der Zeitpunkte
+        self._next_prune = 0
+
+    def _recent(self, key, now):
+        attempts = self._failures.get(key)
+        if attempts is None:
+            return None
+        while attempts and attempts[0] <= now - self.window:
+            attempts.popleft()
+        if not attempts:
+            del self._failures[key]
+            return None
+        return attempts
+
+    def _prune(self, now):
+        # Gelegentlich alle abgelaufenen Schlüssel entfernen, damit der Speicher begrenzt bleibt
+        if now >= self._next_prune:
+            for key in list(self._failures):
+                self._recent(key, now)
+            self._next_prune = now + self.window
+
+    def retry_after(self, keys):
+        """Sekunden bis zum nächsten erlaubten Versuch (0: jetzt erlaubt)."""
+        now = self._clock()
+        wait = 0
+        with self._lock:
+            self._prune(now)
+            for key in keys:
+                attempts = self._recent(key, now)
+                if attempts and len(attempts) >= self.limits.get(key[0], MAX_ATTEMPTS_PER_USER):
+                    wait = max(wait, attempts[0] + self.window - now)
+        return wait
+
+    def failure(self, keys):
+        now = self._clock()
+        with self._lock:
+            for key in keys:
+                self._failures.setdefault(key, collections.deque()).append(now)
+
+    def success(self, keys):
+        """Nach erfolgreichem Login zählen nur noch die Fehlversuche der IP."""
+        with self._lock:
+            for key in keys:
+                if key[0] != "ip":
+                    self._failures.pop(key, None)
+
+
+login_limiter = AttemptLimiter()
+
+
+def client_address(peer_ip, forwarded=None, trusted=None):
+    """Adresse für das IP-Limit: die Gegenstelle, hinter vertrauten Proxies aus ``X-Forwarded-For``.
+
+    Von rechts gelesen zählt die erste Adresse, die kein vertrauter Proxy ist;
+    was weiter links steht, kann der Client selbst eingetragen haben.
+    """
+    trusted = TRUSTED_PROXIES if trusted is None else trusted
+    if not forwarded or peer_ip not in trusted:
+        return peer_ip
+    hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if hop not in trusted:
+            return hop
+    return hops[0] if hops else peer_ip
+
+
+def login_keys(username, client_ip=None):
+    keys = [("user", username)]
+    if client_ip:
+        keys.append(("ip", client_ip))
+    return keys
@@ -0,0 +1,382 @@
+"""Online-Snapshot, Prüfung und Wiederherstellung des Datenordners.
+
+    python backup.py snapshot -o verser.tar.gz     # bei laufender App
+    python backup.py verify verser.tar.gz
+    python backup.py restore verser.tar.gz --force  # bei gestoppter App
+
+Alle JSON-Dateien werden per Umbenennen ersetzt, Logs nur angehängt (siehe
+storage.py und points.py). Der Snapshot hält deshalb die exklusive
+Snapshot-Sperre nur, solange er jede Datei per Hardlink in einen
+Zwischenordner übernimmt und bei Logs die aktuelle Länge notiert: ein Hardlink
+hält genau den Stand dieses Moments fest, spätere Schreibzugriffe legen neue
+Dateien an. Alle Dateien stammen damit vom selben Zeitpunkt (Versdateien und
+ihre Texte unter ``texts/``, Punkte-Snapshot und Log). Komprimiert und gehasht
+wird danach ohne Sperre. SQLite-Datenbanken kopiert die Online-Backup-API von
+SQLite in einer Lesetransaktion.
+
+Nicht gesichert werden Sperr- und Temporärdateien, ``metrics.prom`` und der
+API-Schlüssel ``api_secret``. Fortschritt, den laufende App-Prozesse noch im
+Write-Behind-Puffer halten (höchstens ``VERSER_FLUSH_INTERVAL`` Sekunden), ist
+noch nicht auf der Platte und fehlt daher ebenfalls.
+
+Das Archiv ist ein .tar.gz mit dem Datenordner und ``MANIFEST.json``
+(Größe und SHA-256 jeder Datei) als letztem Eintrag; es wird in einem Durchgang
+geschrieben und gelesen, geht also auch über eine Pipe (``-o -``).
+"""
+import argparse
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tarfile
+import tempfile
+import time
+import zlib
+from pathlib import PurePosixPath
+
+import userdata
+from storage import fsync_dir, snapshot_barrier
+from textstore import content_id
+
+MANIFEST_NAME = "MANIFEST.json"
+FORMAT_VERSION = 1
+STAGING_PREFIX = ".snapshot-"
+SKIPPED_NAMES = {"metrics.prom", "api_secret"}
+SKIPPED_SUFFIXES = (".lock", ".tmp", ".db-wal", ".db-shm", ".db-journal")
+CHUNK_SIZE = 1 << 20
+
+
+class BackupError(Exception):
+    pass
+
+
+def _skipped(name):
+    return name in SKIPPED_NAMES or name.endswith(SKIPPED_SUFFIXES)
+
+
+def _capture(data_dir, staging):
+    """Übernimmt alle Dateien unter der exklusiven Sperre nach ``staging``.
+
+    Liefert ``([(Pfad im Archiv, Datei im Zwischenordner, Größe)], [Datenbanken])``;
+    Datenbanken werden danach per ``_copy_database`` gesichert.
+    """
+    entries, databases = [], []
+    with snapshot_barrier(data_dir):
+        for root, dirs, files in os.walk(data_dir):
+            dirs[:] = sorted(name for name in dirs if not name.startswith(STAGING_PREFIX))
+            for name in sorted(files):
+                if _skipped(name):
+                    continue
+                source = os.path.join(root, name)
+                archive_name = os.path.relpath(source, data_dir).replace(os.sep, "/")
+                if name.endswith(".db"):
+                    databases.append((archive_name, source))
+                    continue
+                staged = os.path.join(staging, str(len(entries)))
+                try:
+                    os.link(source, staged)
+                except FileNotFoundError:
+                    continue
+                except OSError:
+                    # Kein Hardlink möglich (Dateisystem): kopieren, die Sperre hält dann länger
+                    shutil.copyfile(source, staged)
+                # Logs wachsen am selben Inode weiter; gesichert wird nur die Länge von jetzt
+                entries.append((archive_name, staged, os.path.getsize(staged)))
+    return entries, databases
+
+
+def _copy_database(source, target):
+    """Konsistente Kopie einer (im WAL-Modus weiter beschriebenen) SQLite-Datenbank."""
+    src = sqlite3.connect(source, timeout=10)
+    try:
+        dst = sqlite3.connect(target)
+        try:
+            src.backup(dst)
+            dst.execute("PRAGMA journal_mode=DELETE") # Eine Datei ohne -wal im Archiv
+        finally:
+            dst.close()
+    finally:
+        src.close()
+
+
+class _HashingReader:
+    """Liest höchstens ``size`` Bytes aus ``f`` und hasht sie nebenbei."""
+
+    def __init__(self, f, size):
+        self._f = f
+        self._remaining = size
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._f.read(size)
+        self._remaining -= len(data)
+        self.sha256.update(data)
+        return data
+
+
+def _add_file(tar, archive_name, path, size, mtime):
+    info = tarfile.TarInfo(archive_name)
+    info.size = size
+    info.mtime = mtime
+    info.mode = 0o600
+    with open(path, "rb") as f:
+        reader = _HashingReader(f, size)
+        tar.addfile(info, reader)
+    return {"size": size, "sha256": reader.sha256.hexdigest()}
+
+
+def snapshot(data_dir, output):
+    """Schreibt einen Snapshot von ``data_dir`` nach ``output`` (Binärdatei).
+
+    Liefert ``{"files", "bytes", "lock_ms"}``; ``lock_ms`` ist die Zeit, in der
+    Schreibzugriffe warten mussten.
+    """
+    if not os.path.isdir(data_dir):
+        raise BackupError(f"Datenordner {data_dir} existiert nicht")
+    created = datetime.datetime.now(datetime.timezone.utc)
+    staging = tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=data_dir)
+    try:
+        started = time.perf_counter()
+        entries, databases = _capture(data_dir, staging)
+        lock_ms = (time.perf_counter() - started) * 1000
+        for archive_name, source in databases:
+            staged = os.path.join(staging, f"{len(entries)}.db")
+            _copy_database(source, staged)
+            entries.append((archive_name, staged, os.path.getsize(staged)))
+
+        files = {}
+        mtime = int(created.timestamp())
+        with tarfile.open(fileobj=output, mode="w|gz") as tar:
+            for archive_name, staged, size in sorted(entries):
+                files[archive_name] = _add_file(tar, archive_name, staged, size, mtime)
+            manifest = json.dumps({
+                "format": FORMAT_VERSION,
+                "created": created.isoformat(timespec="seconds"),
+                "files": files,
+            }, indent=2, ensure_ascii=False).encode('utf-8')
+            manifest_path = os.path.join(staging, MANIFEST_NAME)
+            with open(manifest_path, "wb") as f:
+                f.write(manifest)
+            _add_file(tar, MANIFEST_NAME, manifest_path, len(manifest), mtime)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return {"files": len(files), "bytes": sum(entry["size"] for entry in files.values()), "lock_ms": lock_ms}
+
+
+# --- Prüfen und Wiederherstellen ---
+
+def _member_name(member):
+    """Normalisierter Pfad eines Archiveintrags oder None, wenn er aus dem Ordner hinauszeigt."""
+    path = PurePosixPath(member.name)
+    if path.is_absolute() or ".." in path.parts or not path.parts:
+        return None
+    return path.as_posix()
+
+
+def _collect_references(data, references):
+    """Sammelt alle ``verses_id`` (Verweise in ``texts/``) aus geparstem JSON."""
+    if isinstance(data, dict):
+        verses_id = data.get("verses_id")
+        if isinstance(verses_id, str):
+            references.add(verses_id)
+        for value in data.values():
+            _collect_references(value, references)
+    elif isinstance(data, list):
+        for value in data:
+            _collect_references(value, references)
+
+
+def _check_content(name, path, data, references):
+    """Inhaltliche Prüfung einer Datei; liefert eine Fehlermeldung oder None."""
+    if name.endswith(".json"):
+        try:
+            parsed = json.loads(data)
+        except ValueError as e:
+            return f"{name}: kein gültiges JSON ({e})"
+        parts = name.split("/")
+        if len(parts) == 2 and parts[0] == "texts" and isinstance(parsed, dict):
+            # Inhaltsadressiert: der Dateiname ist der Hash des Inhalts
+            if content_id(parsed.get("verses", []), parsed.get("schema", 1)) != parts[1][:-len(".json")]:
+                return f"{name}: Inhalt passt nicht zum Dateinamen"
+        else:
+            _collect_references(parsed, references)
+    elif name.endswith(".db"):
+        try:
+            conn = sqlite3.connect(path)
+            try:
+                result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            result = str(e)
+        if result != "ok":
+            return f"{name}: SQLite-Prüfung fehlgeschlagen ({result})"
+    return None
+
+
+def _extract(archive, target_dir, problems, references):
+    """Schreibt alle Dateien aus ``archive`` nach ``target_dir`` und prüft ihren Inhalt.
+
+    Liefert ``(Manifest oder None, {Pfad: {"size", "sha256"}})``.
+    """
+    manifest, seen = None, {}
+    with tarfile.open(archive, mode="r|gz") as tar:
+        for member in tar:
+            name = _member_name(member)
+            if name is None or not member.isfile():
+                problems.append(f"{member.name}: unzulässiger Eintrag")
+                continue
+            source = tar.extractfile(member)
+            if name == MANIFEST_NAME:
+                try:
+                    manifest = json.loads(source.read())
+                except ValueError as e:
+                    problems.append(f"{MANIFEST_NAME}: kein gültiges JSON ({e})")
+                continue
+            path = os.path.join(target_dir, *name.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            digest = hashlib.sha256()
+            buffered = [] if name.endswith(".json") else None
+            with open(path, "wb") as f:
+                while chunk := source.read(CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    if buffered is not None:
+                        buffered.append(chunk)
+            seen[name] = {"size": member.size, "sha256": digest.hexdigest()}
+            problem = _check_content(name, path, b"".join(buffered or ()), references)
+            if problem:
+                problems.append(problem)
+    return manifest, seen
+
+
+def _read_archive(archive, target_dir):
+    """Liest ``archive`` einmal vollständig und schreibt die Dateien nach ``target_dir``.
+
+    Liefert ``(Manifest, [Probleme])``; ohne Probleme ist der Inhalt von
+    ``target_dir`` genau der gesicherte Datenordner.
+    """
+    problems, references = [], set()
+    try:
+        manifest, seen = _extract(archive, target_dir, problems, references)
+    except (tarfile.TarError, EOFError, gzip.BadGzipFile, zlib.error) as e:
+        return None, problems + [f"Archiv beschädigt: {e}"]
+    if manifest is None:
+        problems.append(f"{MANIFEST_NAME} fehlt (Archiv unvollständig?)")
+        return None, problems
+    expected = manifest.get("files", {})
+    for name in sorted(expected.keys() - seen.keys()):
+        problems.append(f"{name}: fehlt im Archiv")
+    for name in sorted(seen.keys() - expected.keys()):
+        problems.append(f"{name}: nicht im Manifest")
+    for name in sorted(expected.keys() & seen.keys()):
+        if expected[name] != seen[name]:
+            problems.append(f"{name}: Prüfsumme oder Größe weicht ab")
+    for verses_id in sorted(references):
+        if f"texts/{verses_id}.json" not in seen:
+            problems.append(f"texts/{verses_id}.json: verwiesen, aber nicht im Archiv")
+    return manifest, problems
+
+
+def verify(archive):
+    """Prüft ``archive`` vollständig; liefert ``(Manifest, [Probleme])``."""
+    scratch = tempfile.mkdtemp(prefix="verser-verify-")
+    try:
+        return _read_archive(archive, scratch)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def restore(archive, data_dir, force=False):
+    """Stellt ``archive`` nach ``data_dir`` wieder her; nur bei gestoppter App.
+
+    Entpackt und prüft zuerst in einen Nachbarordner und tauscht erst dann
+    aus. Ein nicht leerer ``data_dir`` wird nur mit ``force`` ersetzt und
+    bleibt als ``<data_dir>.before-restore-<Zeit>`` erhalten. Liefert
+    ``(Manifest, Pfad des alten Ordners oder None)``.
+    """
+    data_dir = os.path.normpath(data_dir)
+    existing = os.path.isdir(data_dir) and any(not _skipped(name) for name in os.listdir(data_dir))
+    if existing and not force:
+        raise BackupError(f"{data_dir} ist nicht leer (--force ersetzt ihn)")
+    parent = os.path.dirname(os.path.abspath(data_dir))
+    staging = tempfile.mkdtemp(prefix=os.path.basename(data_dir) + ".restore-", dir=parent)
+    try:
+        manifest, problems = _read_archive(archive, staging)
+        if problems:
+            raise BackupError("Archiv fehlerhaft:\n" + "\n".join(problems))
+        previous = None
+        if existing:
+            previous = f"{data_dir}.before-restore-{time.strftime('%Y%m%d-%H%M%S')}"
+            os.rename(data_dir, previous)
+        elif os.path.exists(data_dir):
+            shutil.rmtree(data_dir) # Leer bis auf Sperrdateien
+        os.rename(staging, data_dir)
+        fsync_dir(parent)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return manifest, previous
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Snapshot, Prüfung und Wiederherstellung des Datenordners.")
+    data_dir = argparse.ArgumentParser(add_help=False)
+    data_dir.add_argument("--data-dir", default=userdata.USER_DATA_DIR, help="Datenordner (Standard: VERSER_DATA_DIR bzw. user_data)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    snapshot_parser = commands.add_parser("snapshot", parents=[data_dir], help="Konsistenten Snapshot bei laufender App schreiben")
+    snapshot_parser.add_argument("-o", "--output", help="Archivdatei oder '-' für stdout (Standard: verser-<Zeit>.tar.gz)")
+    verify_parser = commands.add_parser("verify", help="Archiv vollständig prüfen")
+    verify_parser.add_argument("archive")
+    restore_parser = commands.add_parser("restore", parents=[data_dir], help="Archiv in den Datenordner zurückspielen (App vorher stoppen)")
+    restore_parser.add_argument("archive")
+    restore_parser.add_argument("--force", action="store_true", help="Vorhandenen Datenordner ersetzen")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "snapshot":
+            output = args.output or f"verser-{time.strftime('%Y%m%d-%H%M%S')}.tar.gz"
+            if output == "-":
+                stats = snapshot(args.data_dir, sys.stdout.buffer)
+            else:
+                # Erst nach vollständigem Schreiben unter dem endgültigen Namen
+                tmp_path = output + ".tmp"
+                try:
+                    with open(tmp_path, "wb") as f:
+                        stats = snapshot(args.data_dir, f)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, output)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.unlink(tmp_path)
+                    raise
+            print(f"{stats['files']} Dateien, {stats['bytes']} Bytes gesichert -> {output} "
+                  f"(Schreibsperre {stats['lock_ms']:.1f} ms)", file=sys.stderr)
+        elif args.command == "verify":
+            manifest, problems = verify(args.archive)
+            for problem in problems:
+                print(problem, file=sys.stderr)
+            if problems:
+                return 1
+            print(f"OK: {len(manifest['files'])} Dateien, Snapshot vom {manifest.get('created')}")
+        else:
+            manifest, previous = restore(args.archive, args.data_dir, args.force)
+            print(f"{len(manifest['files'])} Dateien aus dem Snapshot vom {manifest.get('created')} "
+                  f"nach {args.data_dir} zurückgespielt")
+            if previous:
+                print(f"Bisheriger Ordner: {previous}")
+    except (BackupError, OSError, tarfile.TarError, sqlite3.Error) as e:
+        print(f"Fehler: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
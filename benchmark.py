@@ -0,0 +1,355 @@
+"""Lasttest und Micro-Benchmarks ohne Browser.
+
+    python benchmark.py load --users 20 --verses 10 --processes 4
+    python benchmark.py load --users 50 --backend sqlite --json
+    python benchmark.py micro --scale 10
+
+``load`` startet die App für jeden simulierten Benutzer in einem eigenen
+``AppTest`` (Streamlits Test-Runner, kein Browser) und lässt alle Benutzer
+gleichzeitig üben: registrieren, den öffentlichen Übungstext wählen, Bausteine
+in der richtigen Reihenfolge anklicken, zum nächsten Vers wechseln. Die
+Sessions eines Prozesses laufen verschränkt und teilen sich - wie im Server -
+Caches, Ledger und Leaderboard; mehrere Prozesse schreiben gleichzeitig in
+denselben Datenordner. Gemessen wird jeder Rerun; ausgegeben werden p50/p95/p99,
+gelesene und geschriebene Dateien und Bytes (``storage.io_counters``) sowie
+verlorene Punktvergaben (erwartete Punkte gegen den Stand auf der Platte).
+
+Die Daten landen in einem temporären Ordner (``VERSER_DATA_DIR``), die
+bcrypt-Kosten werden für den Lauf gesenkt. ``userdata`` wird deshalb erst in
+den Funktionen importiert, nachdem die Umgebung gesetzt ist.
+
+``micro`` misst einzelne Funktionen mit großen Eingaben: Parsen, Bausteine,
+Fehlerhervorhebung und die Leaderboard-Anzeige.
+"""
+import argparse
+import ast
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+import timeit
+from concurrent.futures import ProcessPoolExecutor
+
+import storage
+from leaderboard import LeaderboardIndex
+from practice import highlight_errors
+from recall import score_recall
+from verses import VERSE_SCHEMA_VERSION, group_words_into_chunks, parse_verses_from_text
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+TEXT_TITLE = "Benchmark"
+LANGUAGE = "DE"
+PASSWORD = "benchmark-pw"
+WORDS = (
+    "Gnade sei mit euch und Friede von Gott unserem Vater und dem Herrn Jesus Christus "
+    "gepriesen sei der Gott und Vater der uns gesegnet hat mit jedem geistlichen Segen"
+).split()
+
+
+def synthetic_text(verse_count, words_per_verse=16, seed=0):
+    """Text im Eingabeformat der App (``1) Buch 1:1 Text``)."""
+    rng = random.Random(seed)
+    lines = []
+    for number in range(1, verse_count + 1):
+        chapter, verse = divmod(number - 1, 30)
+        text = " ".join(rng.choice(WORDS) for _ in range(words_per_verse))
+        lines.append(f"{number}) Bench. {chapter + 1}:{verse + 1} {text}")
+    return "\n".join(lines)
+
+
+def percentiles(samples):
+    """p50/p95/p99 und Maximum in Millisekunden."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+    return {"n": len(ordered), "p50": at(0.50), "p95": at(0.95), "p99": at(0.99), "max": ordered[-1] * 1000}
+
+
+def quiet_streamlit():
+    """Nur noch Fehler von Streamlit loggen (Warnungen über den fehlenden Skript-Kontext u.ä.)."""
+    from streamlit import config
+    from streamlit.logger import set_log_level
+    # Die Konfiguration setzt beim ersten Lesen die Log-Stufe, deshalb zuerst laden
+    config.get_config_options()
+    set_log_level("error")
+
+
+# --- Lasttest ---
+
+class SimulatedUser:
+    """Ein Benutzer mit eigener App-Session; misst die Dauer jedes Reruns.
+
+    ``steps`` ist ein Generator, der nach jedem Rerun anhält. So lassen sich
+    viele Sessions in einem Prozess verschränkt ausführen wie Anfragen
+    verschiedener Browser an einen Server.
+    """
+
+    def __init__(self, name, timeout):
+        from streamlit.testing.v1 import AppTest
+        self.name = name
+        self.at = AppTest.from_file(APP_FILE, default_timeout=timeout)
+        self.latencies = []
+        self.points = 0 # Erwartete Punkte
+
+    def run(self, widget=None):
+        started = time.perf_counter()
+        if widget is None:
+            self.at.run()
+        else:
+            widget.run()
+        self.latencies.append(time.perf_counter() - started)
+        if self.at.exception:
+            raise RuntimeError(f"{self.name}: {self.at.exception[0].message}")
+
+    def steps(self, verse_count):
+        at = self.at
+        self.run()
+        yield
+        at.text_input(key="reg_user").input(self.name)
+        at.text_input(key="reg_pw").input(PASSWORD)
+        at.text_input(key="reg_pw_confirm").input(PASSWORD)
+        self.run(at.button(key="register_button").click())
+        if at.session_state.logged_in_user != self.name:
+            raise RuntimeError(f"{self.name}: Registrierung fehlgeschlagen")
+        yield
+        for _ in range(verse_count):
+            # Bausteine des aktuellen Verses in richtiger Reihenfolge anklicken
+            practice = at.session_state.practice
+            if practice is None:
+                raise RuntimeError(f"{self.name}: kein Vers angezeigt")
+            ref, shuffled = practice.ref, list(practice.shuffled)
+            free = list(range(len(shuffled)))
+            for chunk in practice.verse["chunks"]:
+                position = next(p for p in free if shuffled[p] == chunk) # Gleiche Bausteine sind austauschbar
+                free.remove(position)
+                self.run(at.button(key=f"chunk_btn_{position}_{ref}").click())
+                yield
+            if not at.success:
+                raise RuntimeError(f"{self.name}: {ref} nicht als richtig gewertet")
+            self.points += practice.verse.get("points", 0)
+            # Auto-Advance sofort auslösen, statt AUTO_ADVANCE_DELAY abzuwarten
+            at.session_state["auto_advance"] = {**at.session_state["auto_advance"], "due": 0}
+            self.run()
+            yield
+
+
+def run_sessions(names, verse_count, timeout):
+    """Führt die Sessions ``names`` in diesem Prozess reihum aus, je ein Rerun pro Runde.
+
+    Läuft in einem eigenen Prozess: AppTest ersetzt bei jedem Lauf die
+    globale Streamlit-Runtime und ist daher nicht threadsicher.
+    """
+    import userdata
+    quiet_streamlit()
+    users = [SimulatedUser(name, timeout) for name in names]
+    storage.reset_io_counters()
+    running = {user.name: user.steps(verse_count) for user in users}
+    errors = []
+    while running:
+        for name, steps in list(running.items()):
+            try:
+                next(steps)
+            except StopIteration:
+                del running[name]
+            except Exception as e:
+                errors.append(str(e))
+                del running[name]
+    userdata.flush_progress()
+    return {
+        "latencies": [latency for user in users for latency in user.latencies],
+        "points": {user.name: user.points for user in users},
+        "io": storage.io_counters(),
+        "errors": errors,
+    }
+
+
+def stored_balances(userdata):
+    """Punktestände frisch von der Platte, ohne die Objekte des Lasttests."""
+    if userdata.use_sqlite():
+        from sqlite_store import SQLitePointsLedger, SQLiteStore
+        return SQLitePointsLedger(SQLiteStore(userdata.DB_FILE)).balances()
+    from points import PointsLedger
+    return PointsLedger(userdata.USER_DATA_DIR).balances()
+
+
+def run_load_test(users=10, verses=5, processes=2, text_verses=50, backend="json", timeout=60, log=print):
+    """Lässt ``users`` Benutzer je ``verses`` Verse üben und liefert die Messwerte als Dict.
+
+    Die Benutzer werden auf ``processes`` Prozesse verteilt (wie mehrere
+    Server-Prozesse auf denselben Daten); innerhalb eines Prozesses laufen
+    ihre Sessions verschränkt und teilen sich Caches, Ledger und Leaderboard.
+    """
+    data_dir = tempfile.mkdtemp(prefix="verser-bench-")
+    os.environ["VERSER_DATA_DIR"] = data_dir
+    os.environ["VERSER_STORAGE"] = backend
+    os.environ.setdefault("VERSER_BCRYPT_ROUNDS", "4") # Registrieren soll nicht den Test dominieren
+    import userdata
+
+    if userdata.USER_DATA_DIR != data_dir:
+        raise RuntimeError("userdata wurde bereits mit einem anderen Datenordner importiert.")
+    userdata.save_public_verses(LANGUAGE, {TEXT_TITLE: {
+        "verses": parse_verses_from_text(synthetic_text(text_verses)),
+        "schema": VERSE_SCHEMA_VERSION,
+        "public": True,
+        "added_by": "benchmark",
+        "language": LANGUAGE,
+    }})
+    processes = max(1, min(processes, users))
+    log(f"{users} Benutzer in {processes} Prozess(en), je {verses} Verse, Speicher: {backend}, Daten: {data_dir}")
+
+    names = [f"bench{number:04d}" for number in range(users)]
+    started = time.perf_counter()
+    # spawn: frische Prozesse, die userdata mit dem temporären Datenordner importieren
+    with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(run_sessions, names[worker::processes], verses, timeout) for worker in range(processes)]
+        results = [future.result() for future in futures]
+    seconds = time.perf_counter() - started
+
+    io = {}
+    for result in results:
+        for name, value in result["io"].items():
+            io[name] = io.get(name, 0) + value
+    expected = {name: points for result in results for name, points in result["points"].items()}
+    stored = stored_balances(userdata)
+    lost = {name: points - stored.get(name, 0) for name, points in expected.items() if stored.get(name, 0) != points}
+    latencies = [latency for result in results for latency in result["latencies"]]
+    return {
+        "users": users,
+        "verses": verses,
+        "processes": processes,
+        "backend": backend,
+        "seconds": seconds,
+        "reruns": len(latencies),
+        "latency_ms": percentiles(latencies),
+        "io": io,
+        "expected_points": sum(expected.values()),
+        "stored_points": sum(stored.get(name, 0) for name in expected),
+        "lost_updates": lost,
+        "errors": [error for result in results for error in result["errors"]],
+    }
+
+
+# --- Micro-Benchmarks ---
+
+def load_app_function(name, namespace):
+    """Lädt eine Funktion aus app.py, ohne das Skript auszuführen (app.py ist eine Streamlit-Seite)."""
+    with open(APP_FILE, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), APP_FILE)
+    node = next(node for node in tree.body if isinstance(node, ast.FunctionDef) and node.name == name)
+    node.decorator_list = [] # Messung (metrics.timed) und Fragmente gehören nicht zum Benchmark
+    exec(compile(ast.Module(body=[node], type_ignores=[]), APP_FILE, "exec"), namespace)
+    return namespace[name]
+
+
+def best_of(function, repeat=5):
+    """Schnellster von ``repeat`` Läufen in Sekunden (wie timeit)."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def run_micro(scale=1, log=print):
+    import streamlit as st
+    quiet_streamlit() # Ohne Skript-Kontext warnt jeder st-Aufruf
+    rng = random.Random(0)
+    results = {}
+
+    def measure(label, function, size):
+        seconds = best_of(function)
+        results[label] = {"size": size, "ms": seconds * 1000}
+        log(f"{label:<34} {size:>9}  {seconds * 1000:10.3f} ms")
+
+    verse_count = 1000 * scale
+    raw_text = synthetic_text(verse_count, words_per_verse=30)
+    measure("parse_verses_from_text", lambda: parse_verses_from_text(raw_text), verse_count)
+
+    words = [rng.choice(WORDS) for _ in range(100_000 * scale)]
+    measure("group_words_into_chunks", lambda: group_words_into_chunks(words), len(words))
+    measure("group_words_into_chunks (8/Vers)", lambda: [group_words_into_chunks(words[i:i + 30]) for i in range(0, 30_000, 30)], 1000)
+
+    chunks = group_words_into_chunks(words[:2000 * scale], max_chunks=200 * scale)
+    shuffled = rng.sample(chunks, len(chunks))
+    measure("highlight_errors (gemischt)", lambda: highlight_errors(shuffled, chunks), len(chunks))
+    almost = chunks[:]
+    almost[len(almost) // 2], almost[-1] = almost[-1], almost[len(almost) // 2]
+    measure("highlight_errors (ein Tausch)", lambda: highlight_errors(almost, chunks), len(chunks))
+
+    # Ein ganzes Kapitel getippt: ein paar falsche Wörter, ein vergessener Satz
+    chapter = words[:1000 * scale]
+    typed = chapter[:]
+    for _ in range(len(typed) // 50):
+        typed[rng.randrange(len(typed))] = "falsch"
+    del typed[len(typed) // 2:len(typed) // 2 + 15]
+    chapter_text, typed_text = " ".join(chapter), " ".join(typed)
+    measure("score_recall (Kapitel getippt)", lambda: score_recall(chapter_text, typed_text), len(chapter))
+    unrelated_text = " ".join(rng.sample(chapter, len(chapter)))
+    measure("score_recall (anderer Text)", lambda: score_recall(chapter_text, unrelated_text), len(chapter))
+
+    user_count = 10_000 * scale
+    balances = {f"user{number:06d}": rng.randrange(5000) for number in range(user_count)}
+    board = LeaderboardIndex(balances)
+    last = min(balances, key=lambda name: (balances[name], name))
+    namespace = {
+        "st": st, "get_leaderboard": lambda: board, "has_users": lambda: True,
+        "LEADERBOARD_SIZE": 10, "LEADERBOARD_WINDOWS": {"Gesamt": None},
+    }
+    display_leaderboard = load_app_function("display_leaderboard", namespace)
+    measure("display_leaderboard", lambda: display_leaderboard(current_user=last), user_count)
+    measure("LeaderboardIndex.update", lambda: board.update(last, rng.randrange(5000)), user_count)
+    measure("LeaderboardIndex (Aufbau)", lambda: LeaderboardIndex(balances), user_count)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lasttest und Micro-Benchmarks der Vers-Lern-App.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    load = commands.add_parser("load", help="Viele gleichzeitige Sessions simulieren")
+    load.add_argument("--users", type=int, default=10, help="Gleichzeitige Benutzer")
+    load.add_argument("--verses", type=int, default=5, help="Gelöste Verse pro Benutzer")
+    load.add_argument("--processes", type=int, default=2, help="Prozesse, auf die die Benutzer verteilt werden")
+    load.add_argument("--text-verses", type=int, default=50, help="Verse im Übungstext")
+    load.add_argument("--backend", choices=("json", "sqlite"), default="json")
+    load.add_argument("--timeout", type=float, default=60, help="Maximale Dauer eines Reruns in Sekunden")
+    micro = commands.add_parser("micro", help="Einzelne Funktionen mit großen Eingaben messen")
+    micro.add_argument("--scale", type=int, default=1, help="Faktor für die Eingabegrößen")
+    for command in (load, micro):
+        command.add_argument("--json", action="store_true", help="Ergebnis als JSON ausgeben")
+    args = parser.parse_args(argv)
+    log = (lambda message: None) if args.json else print
+
+    if args.command == "micro":
+        results = run_micro(args.scale, log)
+        if args.json:
+            print(json.dumps(results, indent=2))
+        return 0
+
+    try:
+        results = run_load_test(args.users, args.verses, args.processes, args.text_verses, args.backend, args.timeout, log)
+    except (RuntimeError, OSError) as e:
+        print(f"Fehler: {e}", file=sys.stderr)
+        return 1
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        latency, io = results["latency_ms"], results["io"]
+        print(f"{results['reruns']} Reruns in {results['seconds']:.1f}s ({results['reruns'] / max(results['seconds'], 1e-9):.1f}/s)")
+        if latency:
+            print(f"Latenz pro Rerun: p50 {latency['p50']:.0f} ms, p95 {latency['p95']:.0f} ms, "
+                  f"p99 {latency['p99']:.0f} ms, max {latency['max']:.0f} ms")
+        print(f"JSON gelesen: {io['reads']} Dateien ({io['bytes_read'] / 1e3:.1f} kB), {io['cache_hits']} aus dem Cache; "
+              f"geschrieben: {io['writes']} ({io['bytes_written'] / 1e3:.1f} kB)")
+        print(f"Punkte: {results['expected_points']} erwartet, {results['stored_points']} gespeichert, "
+              f"{len(results['lost_updates'])} Benutzer mit verlorenen Vergaben")
+        for error in results["errors"][:5]:
+            print(f"Fehler: {error}", file=sys.stderr)
+    return 1 if results["errors"] or results["lost_updates"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""Bulk-Import öffentlicher Texte aus einem Ordner oder Archiv.
+
+    python bulk_import.py kapitel/ --language DE
+    python bulk_import.py bibel.zip --added-by admin --dry-run
+
+Jede Datei ``<Titel>.txt`` wird zum öffentlichen Text ``<Titel>`` (Format wie im
+Formular der App). Liegen die Dateien in Unterordnern mit Sprachkürzel
+(``DE/``, ``EN/``), bestimmt der Ordner die Sprache. Bereits vorhandene oder
+doppelte Titel werden übersprungen, Texte mit unzulässigem Inhalt ebenso.
+Geschrieben wird am Ende genau einmal pro Sprache, und zwar nur hinzufügend:
+Texte, die während des Imports in der App entstehen, bleiben erhalten.
+"""
+import argparse
+import io
+import os
+import re
+import sys
+import tarfile
+import time
+import zipfile
+from pathlib import PurePosixPath
+
+import userdata
+from moderation import ModerationError, find_forbidden_content
+from verses import VERSE_SCHEMA_VERSION, iter_verses
+
+TEXT_SUFFIXES = (".txt",)
+LANGUAGE_DIR_RE = re.compile(r"^[A-Z]{2,3}$")
+DEFAULT_LANGUAGE = "DE"
+
+
+def iter_source_files(source):
+    """Liefert ``(relativer Pfad, Binärdatei)`` für jede Textdatei in Ordner, .zip oder .tar(.gz)."""
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(TEXT_SUFFIXES):
+                    path = os.path.join(root, name)
+                    with open(path, "rb") as f:
+                        yield os.path.relpath(path, source).replace(os.sep, "/"), f
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(TEXT_SUFFIXES):
+                    with archive.open(info) as f:
+                        yield info.filename, f
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source, "r:*") as archive:
+            for member in archive: # streamend, ohne das Archiv zu entpacken
+                if member.isfile() and member.name.lower().endswith(TEXT_SUFFIXES):
+                    yield member.name, archive.extractfile(member)
+    else:
+        raise ValueError(f"{source} ist weder Ordner noch .zip/.tar-Archiv.")
+
+
+def language_and_title(relative_path, default_language):
+    path = PurePosixPath(relative_path)
+    language = default_language
+    for part in path.parts[:-1]:
+        if LANGUAGE_DIR_RE.match(part):
+            language = part
+    return language, " ".join(path.stem.split())
+
+
+def import_texts(source, default_language=DEFAULT_LANGUAGE, added_by="import", dry_run=False, log=print):
+    """Importiert alle Texte aus ``source`` und liefert eine Statistik als Dict."""
+    stats = {"files": 0, "imported": 0, "skipped": 0, "verses": 0, "bytes": 0, "bad_lines": 0, "writes": 0}
+    started = time.perf_counter()
+    existing = {} # Sprache -> vorhandene öffentliche Texte
+    known_titles = {} # Sprache -> Titel (casefold) aus Bestand und Import
+    pending = {} # Sprache -> neue Texte
+
+    for relative_path, f in iter_source_files(source):
+        stats["files"] += 1
+        language, title = language_and_title(relative_path, default_language)
+        if language not in existing:
+            existing[language] = userdata.load_public_verses(language)
+            known_titles[language] = {t.casefold() for t in existing[language]}
+        if not title or title.casefold() in known_titles[language]:
+            log(f"Übersprungen (Titel existiert bereits): {language}/{title}")
+            stats["skipped"] += 1
+            continue
+
+        raw = f.read()
+        stats["bytes"] += len(raw)
+        errors = []
+        parsed = list(iter_verses(io.StringIO(raw.decode("utf-8-sig")), errors))
+        stats["bad_lines"] += len(errors)
+        for err in errors[:3]:
+            log(f"  {relative_path}:{err.line_number}: {err.reason}")
+        if not parsed:
+            log(f"Übersprungen (keine Verse erkannt): {relative_path}")
+            stats["skipped"] += 1
+            continue
+        forbidden = find_forbidden_content("\n".join(verse["text"] for verse in parsed), language)
+        if forbidden:
+            words = ", ".join(sorted({word for _, _, word in forbidden}))
+            log(f"Übersprungen (Inhalt unzulässig: {words}): {relative_path}")
+            stats["skipped"] += 1
+            continue
+
+        known_titles[language].add(title.casefold())
+        pending.setdefault(language, {})[title] = {
+            "verses": parsed,
+            "schema": VERSE_SCHEMA_VERSION,
+            "public": True,
+            "added_by": added_by,
+            "language": language,
+        }
+        stats["imported"] += 1
+        stats["verses"] += len(parsed)
+
+    # Ein Schreibvorgang pro Sprache; zusammengeführt wird erst beim Schreiben
+    for language, texts in pending.items():
+        if not dry_run:
+            added = set(userdata.add_public_texts(language, texts))
+            stats["writes"] += 1
+            for title in texts.keys() - added:
+                log(f"Übersprungen (Titel inzwischen angelegt): {language}/{title}")
+                stats["imported"] -= 1
+                stats["skipped"] += 1
+                stats["verses"] -= len(texts[title]["verses"])
+            texts = {title: texts[title] for title in added}
+        log(f"{language}: {len(texts)} neue Texte{' (Probelauf, nichts gespeichert)' if dry_run else ''}")
+
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Öffentliche Texte aus Ordner oder Archiv importieren.")
+    parser.add_argument("source", help="Ordner, .zip oder .tar(.gz) mit <Titel>.txt-Dateien")
+    parser.add_argument("--language", default=DEFAULT_LANGUAGE, help="Sprache, wenn kein Sprachordner (DE/, EN/) vorhanden ist")
+    parser.add_argument("--added-by", default="import", help="Wird als 'added_by' gespeichert")
+    parser.add_argument("--dry-run", action="store_true", help="Nur prüfen, nichts speichern")
+    args = parser.parse_args(argv)
+
+    try:
+        stats = import_texts(args.source, args.language.upper(), args.added_by, args.dry_run)
+    except (ValueError, OSError, userdata.StorageError, ModerationError) as e:
+        print(f"Fehler: {e}", file=sys.stderr)
+        return 1
+
+    seconds = max(stats["seconds"], 1e-9)
+    print(
+        f"{stats['files']} Dateien, {stats['imported']} importiert, {stats['skipped']} übersprungen, "
+        f"{stats['verses']} Verse, {stats['bad_lines']} fehlerhafte Zeilen, {stats['writes']} Schreibvorgänge"
+    )
+    print(
+        f"{seconds:.2f}s: {stats['files'] / seconds:.0f} Dateien/s, {stats['verses'] / seconds:.0f} Verse/s, "
+        f"{stats['bytes'] / seconds / 1e6:.1f} MB/s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""Inkrementell gepflegter Leaderboard-Index.
+
+Statt bei jedem Rerun alle Benutzer zu sortieren, hält der Index eine nach
+(Punkte absteigend, Name) sortierte Liste. Er wird vom Punkte-Ledger bei
+jeder Änderung aktualisiert und von allen Sessions eines Prozesses geteilt.
+
+- ``top(k)``: O(k)
+- ``rank(name)``: O(log n) per Binärsuche
+- ``update(name, points)``: O(log n) Suche plus ein Verschieben im Speicher
+
+``WindowedLeaderboard`` hält solche Indizes pro Zeitfenster (heute, 7 und 30
+Tage rollierend) und Sprache. Grundlage sind Tages-Buckets ``{Tag: {Sprache:
+{Benutzer: Punkte}}}`` aus dem Ledger: eine Vergabe ändert nur die Summen der
+betroffenen Fenster, ein Tageswechsel zieht nur den herausfallenden Tag ab -
+die Historie wird nie erneut durchlaufen.
+"""
+import bisect
+import datetime
+import threading
+
+WINDOWS = {"day": 1, "week": 7, "month": 30} # Fensterlänge in Tagen, einschließlich heute
+ALL_LANGUAGES = "*"
+
+
+class LeaderboardIndex:
+    def __init__(self, balances=None):
+        self._lock = threading.Lock()
+        self._points = {}
+        self._order = [] # sortierte Schlüssel (-points, username)
+        for username, points in (balances or {}).items():
+            self._points[username] = points
+            self._order.append((-points, username))
+        self._order.sort()
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, username):
+        return username in self._points
+
+    def update(self, username, points):
+        """Setzt den Punktestand von ``username`` (legt ihn bei Bedarf an)."""
+        with self._lock:
+            old = self._points.get(username)
+            if old == points:
+                return
+            if old is not None:
+                position = bisect.bisect_left(self._order, (-old, username))
+                del self._order[position]
+            self._points[username] = points
+            bisect.insort(self._order, (-points, username))
+
+    def remove(self, username):
+        with self._lock:
+            points = self._points.pop(username, None)
+            if points is not None:
+                del self._order[bisect.bisect_left(self._order, (-points, username))]
+
+    def add(self, username):
+        """Nimmt einen neu registrierten Benutzer mit 0 Punkten auf."""
+        if username not in self._points:
+            self.update(username, 0)
+
+    def top(self, k):
+        """Die ``k`` besten Benutzer als Liste von ``(username, points)``."""
+        with self._lock:
+            return [(username, -negative_points) for negative_points, username in self._order[:k]]
+
+    def rank(self, username):
+        """1-basierter Platz von ``username`` oder ``None``, wenn unbekannt."""
+        with self._lock:
+            points = self._points.get(username)
+            if points is None:
+                return None
+            return bisect.bisect_left(self._order, (-points, username)) + 1
+
+    def points(self, username):
+        return self._points.get(username, 0)
+
+
+def today():
+    return datetime.date.today().toordinal()
+
+
+class WindowedLeaderboard:
+    """Top-Listen je rollierendem Zeitfenster und Sprache, inkrementell aus Tages-Buckets.
+
+    Wird beim Ledger als Listener angemeldet: ``reset(buckets)`` nach dem
+    Laden eines Stands, ``award(...)`` für jede einzelne Vergabe. Tage sind
+    Ordinalzahlen (``date.toordinal``); Vergaben ohne Sprache zählen nur unter
+    ``ALL_LANGUAGES``.
+    """
+
+    def __init__(self, windows=WINDOWS, clock=today):
+        self.windows = dict(windows)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets = {} # Tag -> {Sprache: {Benutzer: Punkte}}
+        self._day = None # Tag, auf den sich die Summen beziehen
+        self._indexes = {} # (Fensterlänge, Sprache) -> LeaderboardIndex
+
+    def reset(self, buckets):
+        """Ersetzt alle Buckets (z.B. nach dem Laden eines neuen Ledger-Snapshots)."""
+        with self._lock:
+            day = self._clock()
+            self._buckets = {}
+            for bucket_day, langs in buckets.items():
+                # Tage in der Zukunft (Uhr eines anderen Prozesses) zählen für heute
+                target = self._buckets.setdefault(min(bucket_day, day), {})
+                for lang, users in langs.items():
+                    merged = target.setdefault(lang, {})
+                    for username, points in users.items():
+                        merged[username] = merged.get(username, 0) + points
+            self._rebuild(day)
+
+    def award(self, day, lang, username, points):
+        with self._lock:
+            self._roll()
+            # Uhren anderer Prozesse können vorgehen: solche Vergaben zählen für heute
+            day = min(day, self._day)
+            users = self._buckets.setdefault(day, {}).setdefault(lang or "", {})
+            users[username] = users.get(username, 0) + points
+            for length in self.windows.values():
+                if day > self._day - length:
+                    self._add(length, lang, username, points)
+
+    def top(self, window, k, lang=ALL_LANGUAGES):
+        """Die ``k`` Besten im Fenster ``window`` (Schlüssel aus ``windows``) als ``[(Benutzer, Punkte)]``."""
+        index = self._index(window, lang)
+        return index.top(k) if index is not None else []
+
+    def rank(self, window, username, lang=ALL_LANGUAGES):
+        index = self._index(window, lang)
+        return index.rank(username) if index is not None else None
+
+    def points(self, window, username, lang=ALL_LANGUAGES):
+        index = self._index(window, lang)
+        return index.points(username) if index is not None else 0
+
+    # --- Intern (Aufrufer hält self._lock) ---
+
+    def _index(self, window, lang):
+        with self._lock:
+            self._roll()
+            return self._indexes.get((self.windows[window], lang))
+
+    def _add(self, length, lang, username, points):
+        for key in ((length, ALL_LANGUAGES), (length, lang)) if lang else ((length, ALL_LANGUAGES),):
+            index = self._indexes.get(key)
+            if index is None:
+                index = self._indexes[key] = LeaderboardIndex()
+            total = index.points(username) + points
+            if total:
+                index.update(username, total)
+            else:
+                index.remove(username)
+
+    def _rebuild(self, day):
+        self._day = day
+        self._indexes = {}
+        self._prune()
+        for bucket_day, langs in self._buckets.items():
+            for length in self.windows.values():
+                if day - length < bucket_day <= day:
+                    for lang, users in langs.items():
+                        for username, points in users.items():
+                            self._add(length, lang, username, points)
+
+    def _roll(self):
+        """Tageswechsel: je Fenster nur den herausfallenden Tag abziehen."""
+        day = self._clock()
+        if day == self._day:
+            return
+        if self._day is None or not 0 < day - self._day <= max(self.windows.values()):
+            self._rebuild(day)
+            return
+        for new_day in range(self._day + 1, day + 1):
+            for length in self.windows.values():
+                for lang, users in self._buckets.get(new_day - length, {}).items():
+                    for username, points in users.items():
+                        self._add(length, lang, username, -points)
+        self._day = day
+        self._prune()
+
+    def _prune(self):
+        oldest = self._day - max(self.windows.values())
+        for bucket_day in [bucket_day for bucket_day in self._buckets if bucket_day <= oldest]:
+            del self._buckets[bucket_day]
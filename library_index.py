@@ -0,0 +1,152 @@
+"""Invertierter Index über die öffentlichen Texte einer Sprache.
+
+Indexiert werden Titel, Referenzen ("eph", "1", "3") und Verstext, jeweils
+kleingeschrieben. Eine Suche schneidet die Postings-Mengen der Suchbegriffe;
+der letzte Begriff gilt als Wortanfang (Suche beim Tippen) und wird über das
+sortierte Vokabular per Binärsuche aufgelöst. Treffer im Titel stehen vorn,
+ohne Suchbegriff wird die alphabetische Titelliste seitenweise geliefert.
+
+Der Index wird einmal pro Sprache aufgebaut (``userdata.get_library_index``)
+und beim Speichern öffentlicher Texte nur für neue, geänderte oder entfernte
+Texte aktualisiert. Der Index wird von allen Sitzungen des Prozesses geteilt;
+Suche und Änderungen laufen darum unter einer eigenen Sperre.
+"""
+import bisect
+import re
+import threading
+
+TOKEN_RE = re.compile(r"\w+")
+PAGE_SIZE = 20
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.casefold())
+
+
+def text_fingerprint(details):
+    """Kurzer Fingerabdruck der Verse, um geänderte Texte beim Speichern zu erkennen."""
+    return hash(tuple((verse.get("ref"), verse.get("text")) for verse in details.get("verses", [])))
+
+
+class LibraryIndex:
+
+    def __init__(self, texts=None, version=None):
+        self.version = version # Stand der Quelle, aus dem der Index gebaut wurde
+        self._postings = {} # Begriff -> Titel
+        self._doc_terms = {} # Titel -> alle Begriffe (zum Entfernen)
+        self._title_terms = {} # Titel -> Begriffe im Titel (für die Reihenfolge)
+        self._fingerprints = {}
+        self._titles = [] # sortiert
+        self._vocabulary = [] # sortiert, bei Bedarf neu aufgebaut
+        self._vocabulary_stale = False
+        self._lock = threading.RLock()
+        for title, details in (texts or {}).items():
+            self._add(title, details)
+        self._titles.sort()
+
+    def __len__(self):
+        return len(self._titles)
+
+    def __contains__(self, title):
+        return title in self._doc_terms
+
+    def _add(self, title, details):
+        title_terms = set(tokenize(title))
+        # Ein regulärer Ausdruck über den ganzen Text statt einer pro Vers
+        terms = title_terms.union(tokenize("\n".join(
+            f"{verse.get('ref', '')} {verse.get('text', '')}" for verse in details.get("verses", [])
+        )))
+        all_postings = self._postings
+        for term in terms:
+            postings = all_postings.get(term)
+            if postings is None:
+                all_postings[term] = {title}
+                self._vocabulary_stale = True
+            else:
+                postings.add(title)
+        self._doc_terms[title] = terms
+        self._title_terms[title] = title_terms
+        self._fingerprints[title] = text_fingerprint(details)
+        self._titles.append(title)
+
+    def add(self, title, details):
+        """Nimmt einen Text auf oder ersetzt ihn."""
+        with self._lock:
+            if title in self._doc_terms:
+                self.remove(title)
+            self._add(title, details)
+            self._titles.pop()
+            bisect.insort(self._titles, title)
+
+    def remove(self, title):
+        with self._lock:
+            terms = self._doc_terms.pop(title, None)
+            if terms is None:
+                return
+            for term in terms:
+                postings = self._postings[term]
+                postings.discard(title)
+                if not postings:
+                    del self._postings[term]
+                    self._vocabulary_stale = True
+            del self._title_terms[title]
+            del self._fingerprints[title]
+            del self._titles[bisect.bisect_left(self._titles, title)]
+
+    def sync(self, texts):
+        """Gleicht den Index mit ``texts`` ab; neu indexiert werden nur neue und geänderte Texte."""
+        with self._lock:
+            for title in [title for title in self._doc_terms if title not in texts]:
+                self.remove(title)
+            for title, details in texts.items():
+                if self._fingerprints.get(title) != text_fingerprint(details):
+                    self.add(title, details)
+
+    def search(self, query, page=0, page_size=PAGE_SIZE):
+        """Eine Seite Titel für ``query`` und die Gesamtzahl der Treffer."""
+        with self._lock:
+            return self._search(query, page, page_size)
+
+    # --- Intern (Aufrufer hält self._lock) ---
+
+    def _prefix_matches(self, prefix):
+        if self._vocabulary_stale:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_stale = False
+        vocabulary = self._vocabulary
+        start = bisect.bisect_left(vocabulary, prefix)
+        end = bisect.bisect_left(vocabulary, prefix + "\U0010ffff")
+        matches = set()
+        for term in vocabulary[start:end]:
+            matches |= self._postings[term]
+        return matches
+
+    def _search(self, query, page, page_size):
+        terms = tokenize(query)
+        if not terms:
+            start = page * page_size
+            return self._titles[start:start + page_size], len(self._titles)
+        # Ohne abschließendes Leerzeichen ist das letzte Wort noch unvollständig
+        partial = None if query[-1:].isspace() else terms.pop()
+        candidates = [self._postings.get(term, set()) for term in terms]
+        if partial is not None:
+            candidates.append(self._prefix_matches(partial))
+        candidates.sort(key=len)
+        result = set(candidates[0])
+        for postings in candidates[1:]:
+            result &= postings
+            if not result:
+                break
+        query_terms = set(terms)
+
+        def rank(title):
+            # Zuerst alle Begriffe im Titel (das letzte Wort vollständig vor nur als Anfang), dann der Rest
+            title_terms = self._title_terms[title]
+            if not query_terms <= title_terms:
+                return 2
+            if partial is None or partial in title_terms:
+                return 0
+            return 1 if any(term.startswith(partial) for term in title_terms) else 2
+        ranked = sorted(result, key=lambda title: (rank(title), title))
+        start = page * page_size
+        return ranked[start:start + page_size], len(ranked)
@@ -0,0 +1,190 @@
+"""Laufzeitmessung im Prozess: benannte Zeitspannen als Histogramme.
+
+    with span("chunk_board"):
+        ...
+
+    @timed("load_users")
+    def load_users(): ...
+
+Jede Spanne landet in einem Histogramm mit festen Grenzen (wie bei
+Prometheus), das pro Prozess von allen Sessions geteilt wird. Das Messen
+kostet zwei ``perf_counter``-Aufrufe und eine Binärsuche. Zusammen mit den
+I/O-Zählern aus ``storage`` zeigt die Admin-Seite der App, ob ein Rerun
+seine Zeit im Speicher oder beim Rendern verbringt; ``export_if_due`` schreibt
+dieselben Werte regelmäßig als Prometheus-Textdatei (z.B. für den
+Textfile-Collector des node_exporter).
+"""
+import bisect
+import functools
+import os
+import tempfile
+import threading
+import time
+
+from storage import io_counters
+
+# Obergrenzen der Buckets in Sekunden
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+EXPORT_INTERVAL = 30 # Sekunden
+
+_histograms = {} # Name -> Histogram
+_lock = threading.Lock()
+_last_export = 0.0
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count", "maximum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1) # letzter Bucket: über der größten Grenze
+        self.total = 0.0
+        self.count = 0
+        self.maximum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def quantile(self, q):
+        """Schätzt das Quantil ``q`` (0-1) durch lineare Interpolation im Bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for position, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BUCKETS[position - 1] if position else 0.0
+                upper = BUCKETS[position] if position < len(BUCKETS) else self.maximum
+                return min(lower + (upper - lower) * (rank - seen) / count, self.maximum)
+            seen += count
+        return self.maximum
+
+
+def observe(name, seconds):
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+
+class span:
+    """Misst die Dauer eines ``with``-Blocks unter ``name``, auch wenn er mit einer Ausnahme endet.
+
+    Das gilt auch für ``st.rerun``/``st.stop``, die als Ausnahmen umgesetzt sind.
+    """
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def timed(name):
+    """Dekorator: jeder Aufruf der Funktion ist eine Spanne ``name``."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def snapshot():
+    """Kopie aller Histogramme als ``{Name: Histogram}``."""
+    with _lock:
+        copies = {}
+        for name, histogram in _histograms.items():
+            copy = Histogram()
+            copy.counts = list(histogram.counts)
+            copy.total, copy.count, copy.maximum = histogram.total, histogram.count, histogram.maximum
+            copies[name] = copy
+        return copies
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def summary():
+    """Eine Zeile pro Spanne (Anzahl, Summe, Mittel, p50/p95/p99, Maximum in ms), teuerste zuerst."""
+    rows = []
+    for name, histogram in snapshot().items():
+        rows.append({
+            "Spanne": name,
+            "Anzahl": histogram.count,
+            "Summe (s)": round(histogram.total, 3),
+            "Mittel (ms)": round(histogram.total / histogram.count * 1000, 2),
+            "p50 (ms)": round(histogram.quantile(0.50) * 1000, 2),
+            "p95 (ms)": round(histogram.quantile(0.95) * 1000, 2),
+            "p99 (ms)": round(histogram.quantile(0.99) * 1000, 2),
+            "Max (ms)": round(histogram.maximum * 1000, 2),
+        })
+    rows.sort(key=lambda row: row["Summe (s)"], reverse=True)
+    return rows
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text():
+    """Alle Histogramme und I/O-Zähler im Prometheus-Textformat."""
+    lines = [
+        "# HELP verser_span_seconds Dauer benannter Abschnitte (Laden, Speichern, Parsen, Rendern).",
+        "# TYPE verser_span_seconds histogram",
+    ]
+    for name, histogram in sorted(snapshot().items()):
+        label = _label(name)
+        cumulative = 0
+        for bound, count in zip(BUCKETS, histogram.counts):
+            cumulative += count
+            lines.append(f'verser_span_seconds_bucket{{span="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'verser_span_seconds_bucket{{span="{label}",le="+Inf"}} {histogram.count}')
+        lines.append(f'verser_span_seconds_sum{{span="{label}"}} {histogram.total:.6f}')
+        lines.append(f'verser_span_seconds_count{{span="{label}"}} {histogram.count}')
+    for name, value in sorted(io_counters().items()):
+        metric = f"verser_json_{name}_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_file(path):
+    """Schreibt ``prometheus_text`` atomar nach ``path`` (Leser sehen nie eine halbe Datei)."""
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(prometheus_text())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def export_if_due(path, interval=EXPORT_INTERVAL):
+    """Schreibt die Prometheus-Datei, wenn der letzte Export mindestens ``interval`` Sekunden her ist."""
+    global _last_export
+    now = time.monotonic()
+    with _lock:
+        if now - _last_export < interval:
+            return False
+        _last_export = now
+    write_prometheus_file(path)
+    return True
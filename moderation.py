@@ -0,0 +1,102 @@
+"""Inhaltsprüfung für neu hinzugefügte Texte (ohne Streamlit, auch für den Bulk-Import).
+
+Pro Sprache wird aus den Wortlisten einmal ein einziger regulärer Ausdruck mit
+Wortgrenzen gebaut; ein Text wird dann in einem Durchgang geprüft, statt pro
+Schlüsselwort einmal. Dadurch trifft "kill" nicht mehr in "skill".
+
+Die Listen stehen in ``DEFAULT_WORD_LISTS`` und können über
+``user_data/moderation_words.json`` (gleiches Format) ersetzt werden. Einträge
+mit ``*`` am Ende sind Wortanfänge ("kill*" trifft "killer", nicht "skill"),
+alle anderen müssen als ganzes Wort vorkommen. Der Schlüssel ``"*"`` gilt für
+alle Sprachen. Ist die Datei unlesbar oder falsch aufgebaut, meldet jede
+Prüfung ``ModerationError``; gespeichert wird dann nichts ungeprüft.
+"""
+import functools
+import json
+import os
+import re
+
+from userdata import USER_DATA_DIR
+
+MODERATION_FILE = os.path.join(USER_DATA_DIR, "moderation_words.json")
+
+# !! Dies ist nur ein Beispiel - SEHR unzureichend für echte Moderation !!
+DEFAULT_WORD_LISTS = {
+    "*": ["sex*", "porn*", "nazi*", "hitler*", "idiot*"],
+    "DE": ["drogen*", "arschloch*", "fick*"],
+    "EN": ["gambl*", "kill*"],
+}
+
+
+class ModerationError(Exception):
+    """Die Wortlisten konnten nicht geladen werden; die Meldung ist für Benutzer gedacht."""
+
+
+def load_word_lists():
+    """Wortlisten aus MODERATION_FILE, sonst die eingebauten Listen."""
+    if not os.path.exists(MODERATION_FILE):
+        return DEFAULT_WORD_LISTS
+    try:
+        with open(MODERATION_FILE, "r", encoding='utf-8') as f:
+            lists = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ModerationError(f"Moderationsliste {MODERATION_FILE} konnte nicht gelesen werden: {e}")
+    if not isinstance(lists, dict) or not all(
+        isinstance(words, list) and all(isinstance(word, str) for word in words) for words in lists.values()
+    ):
+        raise ModerationError(f"Moderationsliste {MODERATION_FILE} muss Sprachen auf Wortlisten abbilden.")
+    return lists
+
+
+def _word_pattern(entry):
+    entry = entry.strip().lower()
+    if entry.endswith("*"):
+        return re.escape(entry[:-1]) + r"\w*"
+    return re.escape(entry)
+
+
+@functools.lru_cache(maxsize=None)
+def get_matcher(language_code=None, ignore_case=False):
+    """Kompilierter Ausdruck für eine Sprache (``None``: alle Listen zusammen).
+
+    Ohne ``ignore_case`` erwartet der Ausdruck bereits kleingeschriebenen Text;
+    das ist etwa doppelt so schnell wie ``re.IGNORECASE``.
+    """
+    lists = load_word_lists()
+    if language_code is None:
+        entries = [entry for words in lists.values() for entry in words]
+    else:
+        entries = lists.get("*", []) + lists.get(language_code, [])
+    if not entries:
+        return None
+    # Längere Einträge zuerst, damit die Alternative den längsten Treffer liefert
+    alternatives = sorted({_word_pattern(entry) for entry in entries if entry.strip()}, key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(alternatives) + r")\b", re.IGNORECASE if ignore_case else 0)
+
+
+def reload_word_lists():
+    """Verwirft die kompilierten Ausdrücke, z.B. nach Änderung von MODERATION_FILE."""
+    get_matcher.cache_clear()
+
+
+def _prepared(text, language_code):
+    """Liefert (Ausdruck, zu durchsuchender Text) mit positionsgleichem Kleinschreiben."""
+    folded = text.lower()
+    if len(folded) == len(text):
+        return get_matcher(language_code), folded
+    # Selten (z.B. "İ"): Kleinschreiben ändert die Länge, dann auf dem Original suchen
+    return get_matcher(language_code, ignore_case=True), text
+
+
+def find_forbidden_content(text, language_code=None):
+    """Alle Treffer als Liste von ``(start, end, wort)`` in einem Durchgang.
+
+    ``ModerationError``, wenn die Wortlisten nicht geladen werden können.
+    """
+    if not text or not isinstance(text, str):
+        return []
+    matcher, haystack = _prepared(text, language_code)
+    if matcher is None:
+        return []
+    return [(m.start(), m.end(), text[m.start():m.end()]) for m in matcher.finditer(haystack)]
+
@@ -0,0 +1,261 @@
+"""Punkte-Ledger: atomare Punktvergabe ohne Read-Modify-Write von users.json.
+
+Jede Vergabe wird als eine JSON-Zeile an ``points_ledger.<gen>.log`` angehängt
+und per fsync gesichert; das kostet O(1) statt eines Neuschreibens aller
+Benutzer. ``points_snapshot.json`` enthält die verdichteten Punktestände und
+die Generation ``gen`` des Logs, das auf diesen Stand aufsetzt.
+
+Beim Verdichten wird zuerst ein neuer Snapshot mit ``gen + 1`` atomar
+geschrieben und erst danach das alte Log gelöscht. Stürzt der Prozess
+dazwischen ab, wird das alte Log ignoriert, weil der Snapshot bereits auf die
+neue Generation zeigt - kein Punkt geht verloren oder wird doppelt gezählt.
+Eine unvollständige letzte Zeile (Absturz während des Schreibens) wird beim
+Einlesen übersprungen.
+
+Jede Vergabe trägt Zeitpunkt und Sprache. Daraus führt der Ledger Tages-Buckets
+(Punkte pro Tag, Sprache und Benutzer) für die Zeitfenster-Leaderboards; der
+Snapshot behält davon die letzten BUCKET_DAYS Tage, ältere Vergaben zählen nur
+noch im Gesamtstand.
+"""
+import datetime
+import json
+import os
+import threading
+import time
+
+from storage import count_io, file_lock, fsync_dir, read_json, write_barrier, write_json_atomic
+
+SNAPSHOT_NAME = "points_snapshot.json"
+LOG_NAME = "points_ledger.{generation}.log"
+COMPACT_EVERY = 1000 # Anzahl Log-Einträge, nach denen verdichtet wird
+BUCKET_DAYS = 31 # So viele Tage Buckets bleiben beim Verdichten erhalten (längstes Fenster: 30)
+
+
+def award_day(timestamp):
+    """Tag (``date.toordinal``, lokale Zeit) einer Vergabe."""
+    return datetime.date.fromtimestamp(timestamp).toordinal()
+
+
+def buckets_to_json(buckets):
+    return {datetime.date.fromordinal(day).isoformat(): langs for day, langs in sorted(buckets.items())}
+
+
+def buckets_from_json(data):
+    return {
+        datetime.date.fromisoformat(day).toordinal(): {lang: dict(users) for lang, users in langs.items()}
+        for day, langs in (data or {}).items()
+    }
+
+
+def add_to_buckets(buckets, day, lang, username, points):
+    users = buckets.setdefault(day, {}).setdefault(lang or "", {})
+    users[username] = users.get(username, 0) + points
+
+
+class PointsLedger:
+    """Prozessweit geteilte Sicht auf die Punktestände aller Benutzer.
+
+    ``seed`` ist eine Funktion, die beim allerersten Start die Startstände
+    liefert (z.B. die ``points`` aus users.json).
+    """
+
+    def __init__(self, data_dir, seed=None, compact_every=COMPACT_EVERY):
+        self.data_dir = data_dir
+        self.snapshot_path = os.path.join(data_dir, SNAPSHOT_NAME)
+        self.compact_every = compact_every
+        self._seed = seed
+        self._lock = threading.Lock()
+        self._balances = {}
+        self._generation = None
+        self._snapshot_signature = None
+        self._log_offset = 0
+        self._log_records = 0
+        self._listeners = []
+        self._buckets = {} # Tag -> {Sprache: {Benutzer: Punkte}}
+        self._window_listeners = []
+
+    def add_listener(self, listener):
+        """``listener(username, balance)`` wird nach jeder Änderung eines Punktestands aufgerufen."""
+        self._listeners.append(listener)
+
+    def add_window_listener(self, listener):
+        """Meldet z.B. ein ``leaderboard.WindowedLeaderboard`` an.
+
+        ``listener.reset(buckets)`` bekommt sofort und nach jedem neu geladenen
+        Snapshot alle Tages-Buckets, ``listener.award(day, lang, username, points)``
+        jede einzelne Vergabe.
+        """
+        self.refresh()
+        with self._lock:
+            listener.reset(self._buckets)
+            self._window_listeners.append(listener)
+
+    def _record(self, day, lang, username, points):
+        add_to_buckets(self._buckets, day, lang, username, points)
+        for listener in self._window_listeners:
+            listener.award(day, lang, username, points)
+
+    def _notify(self, usernames):
+        for username in usernames:
+            for listener in self._listeners:
+                listener(username, self._balances.get(username, 0))
+
+    # --- Lesen ---
+
+    def balance(self, username):
+        """Aktueller Punktestand von ``username`` (0 für Unbekannte)."""
+        self.refresh()
+        return self._balances.get(username, 0)
+
+    def balances(self):
+        """Kopie aller Punktestände als ``{username: points}``."""
+        self.refresh()
+        with self._lock:
+            return dict(self._balances)
+
+    def buckets(self):
+        """Kopie der Tages-Buckets als ``{Tag: {Sprache: {username: points}}}``."""
+        self.refresh()
+        with self._lock:
+            return {day: {lang: dict(users) for lang, users in langs.items()} for day, langs in self._buckets.items()}
+
+    def refresh(self):
+        """Übernimmt Vergaben anderer Prozesse. Ohne Änderungen nur zwei stat-Aufrufe."""
+        with self._lock:
+            if self._is_current():
+                return
+            with file_lock(self.snapshot_path, shared=True):
+                self._catch_up()
+
+    # --- Schreiben ---
+
+    def award(self, username, points, lang=None):
+        """Schreibt ``points`` (in der Sprache ``lang``) atomar gut und liefert den neuen Stand."""
+        points = int(points)
+        timestamp = int(time.time())
+        entry = {"u": username, "p": points, "t": timestamp}
+        if lang:
+            entry["l"] = lang
+        record = json.dumps(entry, ensure_ascii=False)
+        with self._lock, file_lock(self.snapshot_path):
+            self._catch_up()
+            log_path = self._log_path()
+            with write_barrier(), open(log_path, "ab") as f:
+                data = (record + "\n").encode('utf-8')
+                if self._log_offset != f.tell():
+                    # Abgebrochene Zeile eines Absturzes abschließen
+                    data = b"\n" + data
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+                count_io(writes=1, bytes_written=len(data))
+                self._log_offset = f.tell()
+            self._balances[username] = self._balances.get(username, 0) + points
+            self._log_records += 1
+            self._notify([username])
+            self._record(award_day(timestamp), lang, username, points)
+            if self._log_records >= self.compact_every:
+                self._compact()
+            return self._balances[username]
+
+    def compact(self):
+        """Schreibt einen neuen Snapshot und beginnt ein leeres Log."""
+        with self._lock, file_lock(self.snapshot_path):
+            self._catch_up()
+            self._compact()
+
+    # --- Intern (Aufrufer hält self._lock) ---
+
+    def _log_path(self, generation=None):
+        generation = self._generation if generation is None else generation
+        return os.path.join(self.data_dir, LOG_NAME.format(generation=generation))
+
+    def _is_current(self):
+        if self._generation is None:
+            return False
+        try:
+            stat = os.stat(self.snapshot_path)
+        except FileNotFoundError:
+            return False
+        if (stat.st_mtime_ns, stat.st_size) != self._snapshot_signature:
+            return False
+        try:
+            return os.path.getsize(self._log_path()) == self._log_offset
+        except FileNotFoundError:
+            return self._log_offset == 0
+
+    def _catch_up(self):
+        """Liest Snapshot (falls neu) und die noch nicht gesehenen Log-Zeilen ein."""
+        if not os.path.exists(self.snapshot_path):
+            self._initialize()
+        stat = os.stat(self.snapshot_path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        changed = set()
+        if signature != self._snapshot_signature:
+            snapshot = read_json(self.snapshot_path)
+            old_balances = self._balances
+            self._balances = dict(snapshot.get("balances", {}))
+            changed.update(
+                username for username in old_balances.keys() | self._balances.keys()
+                if old_balances.get(username) != self._balances.get(username)
+            )
+            self._generation = snapshot.get("generation", 0)
+            self._snapshot_signature = signature
+            self._log_offset = 0
+            self._log_records = 0
+            self._buckets = buckets_from_json(snapshot.get("buckets"))
+            for listener in self._window_listeners:
+                listener.reset(self._buckets)
+        try:
+            with open(self._log_path(), "rb") as f:
+                f.seek(self._log_offset)
+                chunk = f.read()
+            count_io(reads=1, bytes_read=len(chunk))
+        except FileNotFoundError:
+            self._notify(changed)
+            return
+        # Nur vollständige Zeilen übernehmen
+        end = chunk.rfind(b"\n") + 1
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue # Zeile eines abgebrochenen Schreibvorgangs
+            self._balances[entry["u"]] = self._balances.get(entry["u"], 0) + entry["p"]
+            self._log_records += 1
+            changed.add(entry["u"])
+            self._record(award_day(entry.get("t", 0)), entry.get("l"), entry["u"], entry["p"])
+        self._log_offset += end
+        self._notify(changed)
+
+    def _initialize(self):
+        """Erster Start: Snapshot aus den Startständen anlegen (genau einmal über alle Prozesse)."""
+        with file_lock(self.snapshot_path + ".init"):
+            if os.path.exists(self.snapshot_path):
+                return
+            balances = self._seed() if self._seed else {}
+            write_json_atomic(self.snapshot_path, {"generation": 1, "balances": balances})
+
+    def _compact(self):
+        old_log = self._log_path()
+        new_generation = self._generation + 1
+        oldest = award_day(time.time()) - BUCKET_DAYS
+        for day in [day for day in self._buckets if day <= oldest]:
+            del self._buckets[day]
+        write_json_atomic(self.snapshot_path, {
+            "generation": new_generation,
+            "balances": self._balances,
+            "buckets": buckets_to_json(self._buckets),
+        })
+        stat = os.stat(self.snapshot_path)
+        self._snapshot_signature = (stat.st_mtime_ns, stat.st_size)
+        self._generation = new_generation
+        self._log_offset = 0
+        self._log_records = 0
+        try:
+            os.unlink(old_log)
+            fsync_dir(self.data_dir)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,157 @@
+"""Zustand der laufenden Übung (ein Vers) innerhalb einer Session.
+
+Statt vieler Session-Keys pro Vers ("shuffled_chunks_<Sprache>_<Titel>_<Ref>",
+"used_chunks_...", ...) hält jede Session genau ein ``PracticeState``. Beim
+Verswechsel wird es als Ganzes ersetzt: das Zurücksetzen ist eine Zuweisung,
+und alte Verse hinterlassen keine Keys im Session State.
+
+Die gemischte Reihenfolge wird nicht gespeichert, sondern aus einem Seed
+berechnet (``derive_seed`` aus dem Seed der Session und dem Vers); der
+Fortschritt ist eine Bitmaske plus die gewählten Positionen als Bytes. Derselbe
+Vers erscheint in einer Session also immer gleich gemischt, auch nach einem
+Neuaufbau des Zustands oder auf einer anderen Replika.
+
+Im strengen Modus (``strict``) wird jeder Klick sofort gegen den erwarteten
+Baustein an der nächsten Position geprüft. Falsche Bausteine werden nicht
+übernommen, sondern als Fehlgriff gezählt; die Auswahl ist damit immer ein
+korrekter Anfang des Verses, und der Vergleich am Ende entfällt.
+
+Im Tipp-Modus (``typed``) wird der Vers frei eingetippt und wortweise mit
+recall.py bewertet; jeder weitere Versuch nach einem fehlerhaften zählt wie
+ein Fehlgriff.
+"""
+import hashlib
+from difflib import SequenceMatcher # Für die Fehlerhervorhebung
+
+from recall import score_recall
+
+_MASK64 = (1 << 64) - 1
+
+
+def derive_seed(session_seed, *parts):
+    """64-Bit-Seed aus dem Seed der Session und z.B. Text, Index und Referenz eines Verses."""
+    digest = hashlib.blake2b(repr((session_seed, parts)).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def shuffle_order(count, seed):
+    """Gemischte Reihenfolge der Positionen ``0..count-1`` zu ``seed``.
+
+    Fisher-Yates mit SplitMix64 statt ``random``: dieselbe Reihenfolge in
+    jedem Prozess und jeder Python-Version, also auch auf anderen Replikas.
+    """
+    order = list(range(count))
+    state = seed & _MASK64
+    for i in range(count - 1, 0, -1):
+        state = (state + 0x9E3779B97F4A7C15) & _MASK64
+        z = state
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+        z ^= z >> 31
+        j = z % (i + 1)
+        order[i], order[j] = order[j], order[i]
+    return order
+
+
+def shuffle_chunks(chunks, seed):
+    """Die Bausteine in der gemischten Reihenfolge zu ``seed``."""
+    return [chunks[position] for position in shuffle_order(len(chunks), seed)]
+
+
+class PracticeState:
+    __slots__ = (
+        "text_key", "index", "verse", "seed", "picks", "used", "feedback_given", "points_awarded",
+        "strict", "mistakes", "last_wrong", "reviewed", "typed", "recall", "partial_points",
+    )
+
+    def __init__(self, text_key, index, verse, seed, strict=False, typed=False):
+        self.text_key = text_key # (Sprache, angezeigter Titel)
+        self.index = index
+        self.verse = verse # Referenz, keine Kopie
+        self.seed = seed # Die Mischung wird bei Bedarf daraus berechnet, nicht gespeichert
+        self.picks = bytearray() # Gewählte Positionen (in der gemischten Reihenfolge), der Reihe nach
+        self.used = 0 # Bitmaske der gewählten Positionen
+        self.feedback_given = False
+        self.points_awarded = False
+        self.strict = strict
+        self.mistakes = 0 # Fehlgriffe im strengen Modus
+        self.last_wrong = None # Position des letzten falschen Klicks (für den Hinweis)
+        self.reviewed = False # Ergebnis bereits an die Wiederholungs-Queue gemeldet
+        self.typed = typed
+        self.recall = None # Bewertung der letzten getippten Eingabe (recall.RecallResult)
+        self.partial_points = None # Teilpunkte des ersten, fehlerhaften Versuchs (einmal vergeben)
+
+    @property
+    def ref(self):
+        return self.verse.get("ref")
+
+    @property
+    def shuffled(self):
+        """Die gemischten Bausteine (bei jedem Zugriff neu berechnet)."""
+        return shuffle_chunks(self.verse["chunks"], self.seed)
+
+    @property
+    def selected(self):
+        """Gewählte Bausteine als ``[(Text, Position)]``."""
+        shuffled = self.shuffled
+        return [(shuffled[position], position) for position in self.picks]
+
+    def is_used(self, position):
+        return bool(self.used >> position & 1)
+
+    def is_for(self, text_key, index, verse):
+        """True, wenn dieser Zustand zum angegebenen Vers gehört."""
+        return (
+            self.index == index
+            and self.text_key == text_key
+            and self.verse.get("ref") == verse.get("ref")
+            and self.verse["chunks"] == verse["chunks"]
+        )
+
+    def pick(self, position):
+        """Wählt den Baustein an ``position`` (in ``shuffled``). True, wenn damit alle gewählt sind."""
+        count = len(self.verse["chunks"])
+        if self.strict:
+            if self.shuffled[position] != self.verse["chunks"][len(self.picks)]:
+                self.mistakes += 1
+                self.last_wrong = position
+                return False
+            self.last_wrong = None
+        self.picks.append(position)
+        self.used |= 1 << position
+        return len(self.picks) == count
+
+    def undo(self):
+        """Nimmt den zuletzt gewählten Baustein zurück."""
+        if self.picks:
+            self.used &= ~(1 << self.picks.pop())
+        self.last_wrong = None
+
+    def check_typed(self, text):
+        """Bewertet die getippte Eingabe; ein fehlerhafter Versuch zählt als Fehlgriff."""
+        self.recall = score_recall(self.verse.get("text", ""), text)
+        if self.recall.distance:
+            self.mistakes += 1
+        self.feedback_given = True
+        return self.recall
+
+    def selected_texts(self):
+        shuffled = self.shuffled
+        return [shuffled[position] for position in self.picks]
+
+
+def highlight_errors(selected_chunks, correct_chunks):
+    """Erzeugt einen HTML-String, der Fehler in den ausgewählten Chunks hervorhebt."""
+    html_output = []
+    matcher = SequenceMatcher(None, correct_chunks, selected_chunks)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            html_output.append(" ".join(selected_chunks[j1:j2]))
+        elif tag == 'replace' or tag == 'insert':
+             # Rot hervorheben, was der User gewählt hat
+            html_output.append(f"<span style='color:red; font-weight:bold;'>{' '.join(selected_chunks[j1:j2])}</span>")
+        elif tag == 'delete':
+             # Optional: anzeigen, was fehlt (hier nicht direkt sichtbar in User-Auswahl)
+             pass
+    # Führe die Teile mit Leerzeichen zusammen (außer am Anfang/Ende)
+    return " ".join(filter(None, html_output))
@@ -0,0 +1,150 @@
+"""Auswertung frei getippter Verse: Wort-Editierdistanz mit Fehlerstellen.
+
+Verglichen wird wortweise, ohne Groß-/Kleinschreibung und Satzzeichen
+("Gott," gilt als "gott"). Die Distanz ist die Zahl der fehlenden,
+überzähligen und falschen Wörter; daraus ergeben sich Teilpunkte.
+
+Die Distanz rechnet der bitparallele Algorithmus von Myers (in Hyyrös
+Formulierung): eine Spalte der DP-Matrix ist ein Paar Python-Ganzzahlen mit
+einem Bit pro Wort des Verses, ein getipptes Wort kostet eine Handvoll
+Ganzzahl-Operationen. Ein ganzes Kapitel (einige tausend Wörter) ist damit in
+wenigen Millisekunden bewertet statt quadratisch viele Zellen in Python zu
+füllen. Für die Fehlerstellen bleiben die Spalten gespeichert; jede Zelle lässt
+sich daraus per ``bit_count`` zurückrechnen, der Rückweg kostet also nur
+O(Wörter) Schritte.
+"""
+import html
+import re
+from collections import namedtuple
+
+_WORD_RE = re.compile(r"[^\w]+")
+
+# tag: "equal", "replace" (falsches Wort), "delete" (Wort fehlt), "insert" (Wort zu viel)
+Edit = namedtuple("Edit", "tag expected typed")
+
+
+def normalize_word(word):
+    return _WORD_RE.sub("", word.casefold())
+
+
+def _word_ids(expected, typed):
+    """Beide Wortfolgen als Zahlen (gleiches normalisiertes Wort, gleiche Zahl)."""
+    ids = {}
+    convert = lambda words: [ids.setdefault(normalize_word(word), len(ids)) for word in words]
+    return convert(expected), convert(typed)
+
+
+def _columns(expected_ids, typed_ids):
+    """Spalten der DP-Matrix (Zeilen: erwartete Wörter, Spalten: getippte Wörter).
+
+    Liefert je Spalte ``(Pv, Mv, Distanz)``: Bit r von Pv/Mv ist gesetzt, wenn
+    D[r+1][j] - D[r][j] = +1 bzw. -1 ist; die Distanz ist D[m][j].
+    """
+    m = len(expected_ids)
+    full = (1 << m) - 1
+    high = 1 << (m - 1) if m else 0
+    peq = {}
+    for row, word in enumerate(expected_ids):
+        peq[word] = peq.get(word, 0) | (1 << row)
+    pv, mv, score = full, 0, m
+    columns = [(pv, mv, score)]
+    for word in typed_ids:
+        eq = peq.get(word, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        # Globale Ausrichtung: die erste Zeile (D[0][j] = j) steigt pro Spalte um 1
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+        columns.append((pv, mv, score))
+    return columns
+
+
+def edit_distance(expected, typed):
+    """Wort-Editierdistanz zwischen zwei Wortlisten."""
+    expected_ids, typed_ids = _word_ids(expected, typed)
+    if not expected_ids:
+        return len(typed_ids)
+    return _columns(expected_ids, typed_ids)[-1][2]
+
+
+def word_diff(expected, typed):
+    """Distanz und Ausrichtung ``[Edit, ...]`` der Wortlisten ``expected`` und ``typed``."""
+    expected_ids, typed_ids = _word_ids(expected, typed)
+    if not expected_ids:
+        return len(typed), [Edit("insert", None, word) for word in typed]
+    columns = _columns(expected_ids, typed_ids)
+
+    def cell(i, j):
+        pv, mv, score = columns[j]
+        return score - ((pv >> i).bit_count() - (mv >> i).bit_count())
+
+    edits = []
+    i, j = len(expected), len(typed)
+    value = columns[j][2]
+    while i or j:
+        if i and j and expected_ids[i - 1] == typed_ids[j - 1]:
+            # Gleiche Wörter: die Diagonale ist immer optimal (D[i-1][j-1] == D[i][j])
+            edits.append(Edit("equal", expected[i - 1], typed[j - 1]))
+            i, j = i - 1, j - 1
+            continue
+        # Fehlendes bzw. überzähliges Wort, wenn danach wieder Wörter übereinstimmen (vertauschte Wörter)
+        if i > 1 and j and expected_ids[i - 2] == typed_ids[j - 1] and cell(i - 1, j) + 1 == value:
+            step = "delete"
+        elif j > 1 and i and typed_ids[j - 2] == expected_ids[i - 1] and cell(i, j - 1) + 1 == value:
+            step = "insert"
+        elif i and j and cell(i - 1, j - 1) + 1 == value:
+            step = "replace"
+        elif i and cell(i - 1, j) + 1 == value:
+            step = "delete"
+        else:
+            step = "insert"
+        edits.append(Edit(step, expected[i - 1] if step != "insert" else None, typed[j - 1] if step != "delete" else None))
+        i -= step != "insert"
+        j -= step != "delete"
+        value -= 1
+    edits.reverse()
+    return columns[-1][2], edits
+
+
+RecallResult = namedtuple("RecallResult", "distance edits words accuracy")
+
+
+def score_recall(expected_text, typed_text):
+    """Bewertet ``typed_text`` gegen ``expected_text``.
+
+    ``accuracy`` ist 1 - Distanz / Wortzahl (nicht unter 0); bei exakter
+    Wiedergabe (bis auf Groß-/Kleinschreibung und Satzzeichen) ist die Distanz 0.
+    """
+    expected, typed = expected_text.split(), typed_text.split()
+    distance, edits = word_diff(expected, typed)
+    accuracy = max(0.0, 1 - distance / len(expected)) if expected else float(not typed)
+    return RecallResult(distance, edits, len(expected), accuracy)
+
+
+def partial_points(result, points):
+    """Teilpunkte: ``points`` anteilig nach ``accuracy``, abgerundet."""
+    return int(points * result.accuracy)
+
+
+def highlight_recall(edits):
+    """HTML der Eingabe: falsche und überzählige Wörter rot, fehlende bzw. richtige grün daneben."""
+    parts = []
+    for tag, expected, typed in edits:
+        if tag == "equal":
+            parts.append(html.escape(typed))
+        elif tag == "replace":
+            parts.append(f"<span style='color:red; text-decoration:line-through;'>{html.escape(typed)}</span> "
+                         f"<span style='color:green; font-weight:bold;'>{html.escape(expected)}</span>")
+        elif tag == "insert":
+            parts.append(f"<span style='color:red; text-decoration:line-through;'>{html.escape(typed)}</span>")
+        else:
+            parts.append(f"<span style='color:green; font-weight:bold;'>[{html.escape(expected)}]</span>")
+    return " ".join(parts)
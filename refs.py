@@ -0,0 +1,142 @@
+"""Strukturierte Versreferenzen: Buch, Kapitel, Vers statt freier Strings.
+
+``parse_ref("1 Kor. 13:4")`` liefert ``("1kor", 13, 4)``; der Buchname wird
+normalisiert (kleingeschrieben, ohne Punkte und Leerzeichen) und interniert,
+damit tausende Verse eines Buches sich einen String teilen.
+
+``RefIndex`` hält die Referenzen eines oder mehrerer Texte in kompakten
+Arrays, sortiert nach (Buch, Kapitel, Vers). Bereiche wie "Eph 1:3-14" oder
+Sprünge zu "2:8" sind damit zwei Binärsuchen statt eines Durchlaufs über alle
+Verse - auch über mehrere Texte desselben Buches hinweg.
+"""
+import bisect
+import re
+import sys
+from array import array
+from collections import namedtuple
+
+REF_RE = re.compile(r"\s*(?P<book>(?:\d+\.?\s*)?[^\W\d_]+)\.?\s*(?P<chapter>\d+):(?P<verse>\d+)\s*$")
+# "Eph 1:3-14", "Eph. 1:3–2:5", "2:8", "1:3-14", "Eph 2" (ganzes Kapitel), "2-3" (Kapitel 2 bis 3)
+QUERY_RE = re.compile(
+    r"\s*(?:(?P<book>(?:\d+\.?\s*)?[^\W\d_]+)\.?\s*)?"
+    r"(?P<chapter>\d+)(?::(?P<verse>\d+))?"
+    r"(?:\s*[-–—]\s*(?:(?P<end_chapter>\d+):)?(?P<end>\d+))?\s*$"
+)
+MAX_NUMBER = 1023 # Kapitel und Verse werden in je 10 Bit gepackt
+
+RefRange = namedtuple("RefRange", "book start end") # start/end: (Kapitel, Vers), einschließlich
+
+
+def normalize_book(name):
+    return sys.intern("".join(name.casefold().replace(".", "").split()))
+
+
+def parse_ref(ref):
+    """``(Buch, Kapitel, Vers)`` oder None, wenn ``ref`` keine Referenz ist."""
+    match = REF_RE.match(ref or "")
+    if match is None:
+        return None
+    chapter, verse = int(match.group("chapter")), int(match.group("verse"))
+    if chapter > MAX_NUMBER or verse > MAX_NUMBER:
+        return None
+    return normalize_book(match.group("book")), chapter, verse
+
+
+def parse_range(query):
+    """Liest eine Stellenangabe als ``RefRange`` (Buch None = jedes Buch), sonst None.
+
+    Ein einzelner Vers ergibt einen Bereich mit ``start == end``; Kapitel oder
+    Verse über ``MAX_NUMBER`` ergeben None wie bei ``parse_ref``.
+    """
+    match = QUERY_RE.match(query or "")
+    if match is None:
+        return None
+    book = normalize_book(match.group("book")) if match.group("book") else None
+    chapter = int(match.group("chapter"))
+    end = match.group("end")
+    if match.group("verse") is None:
+        # Nur Kapitel: "Eph 2" bzw. "Eph 2-3"
+        end_chapter = int(end) if end is not None else chapter
+        start, stop = (chapter, 0), (end_chapter, MAX_NUMBER)
+    else:
+        start = (chapter, int(match.group("verse")))
+        if end is None:
+            stop = start
+        else:
+            end_chapter = match.group("end_chapter")
+            stop = (int(end_chapter) if end_chapter else chapter, int(end))
+    if stop < start or max(start + stop) > MAX_NUMBER:
+        return None # größere Zahlen liefen in _pack in die Buch-Bits über
+    return RefRange(book, start, stop)
+
+
+def _pack(book_id, chapter, verse):
+    return (book_id << 20) | (chapter << 10) | verse
+
+
+class RefIndex:
+    """Sortierte Referenzen der Texte ``{Titel: Versliste}``.
+
+    Pro Vers drei Zahlen in ``array``s (Schlüssel, Textnummer, Position),
+    keine Tupel oder Dicts. Verse ohne erkennbare Referenz fehlen im Index.
+    """
+
+    def __init__(self, texts=None, version=None):
+        self.version = version # Stand der Quelle (wie bei LibraryIndex)
+        self.titles = []
+        self._text_numbers = {} # Titel -> Textnummer
+        self.books = [] # Buch-ID -> normalisierter Name
+        book_ids = {}
+        entries = []
+        for text_number, (title, verses) in enumerate((texts or {}).items()):
+            self.titles.append(title)
+            self._text_numbers[title] = text_number
+            for position, verse in enumerate(verses):
+                parsed = parse_ref(verse.get("ref"))
+                if parsed is None:
+                    continue
+                book, chapter, number = parsed
+                book_id = book_ids.get(book)
+                if book_id is None:
+                    book_id = book_ids[book] = len(self.books)
+                    self.books.append(book)
+                entries.append((_pack(book_id, chapter, number), text_number, position))
+        entries.sort()
+        self._keys = array("q", (entry[0] for entry in entries))
+        self._texts = array("I", (entry[1] for entry in entries))
+        self._positions = array("I", (entry[2] for entry in entries))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _book_ids(self, book):
+        """IDs der Bücher, die zu ``book`` passen: exakt zuerst, dann als Anfang ("eph" ~ "epheser")."""
+        if book is None:
+            return range(len(self.books))
+        exact = [book_id for book_id, name in enumerate(self.books) if name == book]
+        return exact + [
+            book_id for book_id, name in enumerate(self.books)
+            if name != book and (name.startswith(book) or book.startswith(name))
+        ]
+
+    def lookup(self, ref_range, title=None):
+        """Positionen im Bereich als ``{Titel: [Positionen]}``, je Text in Bibelreihenfolge.
+
+        Mit ``title`` nur in diesem Text. Die Titel stehen in der Reihenfolge
+        ihres ersten Treffers.
+        """
+        text_number = None
+        if title is not None:
+            text_number = self._text_numbers.get(title)
+            if text_number is None:
+                return {}
+        result = {}
+        keys = self._keys
+        for book_id in self._book_ids(ref_range.book):
+            start = bisect.bisect_left(keys, _pack(book_id, *ref_range.start))
+            end = bisect.bisect_right(keys, _pack(book_id, *ref_range.end))
+            for entry in range(start, end):
+                number = self._texts[entry]
+                if text_number is None or number == text_number:
+                    result.setdefault(self.titles[number], []).append(self._positions[entry])
+        return result
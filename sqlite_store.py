@@ -0,0 +1,540 @@
+"""SQLite-Speicher (WAL) für Benutzer, Texte, Verse und Fortschritt.
+
+Wird mit ``VERSER_STORAGE=sqlite`` aktiviert. Im WAL-Modus können viele
+Streamlit-Sessions gleichzeitig lesen, während eine schreibt; ein neuer
+``last_index`` oder eine Punktvergabe ändert genau eine Zeile.
+
+Bestehende JSON-Daten einmalig übernehmen::
+
+    python sqlite_store.py migrate
+"""
+import argparse
+import contextlib
+import datetime
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from points import BUCKET_DAYS, add_to_buckets, award_day
+from srs import Card
+from verses import VERSE_SCHEMA_VERSION, plan_verse
+
+PUBLIC_OWNER = "" # owner-Wert für öffentliche Texte
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username      TEXT PRIMARY KEY,
+    password_hash TEXT NOT NULL,
+    points        INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS users_by_points ON users(points DESC);
+
+CREATE TABLE IF NOT EXISTS texts (
+    id       INTEGER PRIMARY KEY AUTOINCREMENT, -- nie wiederverwendet, Schlüssel des Vers-Caches
+    owner    TEXT NOT NULL,
+    language TEXT NOT NULL,
+    title    TEXT NOT NULL,
+    added_by TEXT,
+    revision INTEGER NOT NULL DEFAULT 1,
+    UNIQUE (owner, language, title)
+);
+
+CREATE TABLE IF NOT EXISTS verses (
+    text_id  INTEGER NOT NULL REFERENCES texts(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    ref      TEXT NOT NULL,
+    text     TEXT NOT NULL,
+    plan     TEXT, -- JSON: chunks, tokens, points, v (VERSE_SCHEMA_VERSION)
+    PRIMARY KEY (text_id, position)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS progress (
+    username   TEXT NOT NULL,
+    text_id    INTEGER NOT NULL REFERENCES texts(id) ON DELETE CASCADE,
+    mode       TEXT NOT NULL DEFAULT 'linear',
+    last_index INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (username, text_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS review_cards (
+    username TEXT NOT NULL,
+    language TEXT NOT NULL,
+    deck     TEXT NOT NULL, -- angezeigter Titel (öffentliche mit Markierung)
+    position INTEGER NOT NULL,
+    ref      TEXT NOT NULL,
+    ease     REAL NOT NULL,
+    interval INTEGER NOT NULL,
+    reps     INTEGER NOT NULL,
+    due      INTEGER NOT NULL,
+    PRIMARY KEY (username, language, deck, position)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS point_awards (
+    id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    points   INTEGER NOT NULL,
+    ts       INTEGER NOT NULL,
+    lang     TEXT -- Sprache der Vergabe (für Leaderboards pro Sprache)
+);
+
+CREATE INDEX IF NOT EXISTS point_awards_ts ON point_awards (ts);
+
+CREATE TABLE IF NOT EXISTS spent_tokens (
+    nonce   TEXT PRIMARY KEY, -- eingelöste Punkt-Tokens der API
+    expires INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteStore:
+    """Eine Verbindung pro Thread auf dieselbe Datenbankdatei."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._verse_cache = {} # text_id -> (revision, verses, Pläne vollständig in der DB?)
+        self._verse_cache_lock = threading.Lock()
+        conn = self.connection()
+        conn.executescript(SCHEMA)
+        # Datenbanken aus der Zeit vor den Bausteinplänen nachrüsten
+        if "plan" not in [row[1] for row in conn.execute("PRAGMA table_info(verses)")]:
+            conn.execute("ALTER TABLE verses ADD COLUMN plan TEXT")
+        # ... und aus der Zeit vor den Vergaben mit Sprache
+        if "lang" not in [row[1] for row in conn.execute("PRAGMA table_info(point_awards)")]:
+            conn.execute("ALTER TABLE point_awards ADD COLUMN lang TEXT")
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Schreibtransaktion; BEGIN IMMEDIATE vermeidet Deadlocks beim Hochstufen."""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    # --- Benutzer ---
+
+    def load_users(self):
+        rows = self.connection().execute("SELECT username, password_hash, points FROM users")
+        return {name: {"password_hash": pw_hash, "points": points} for name, pw_hash, points in rows}
+
+    def get_user(self, username):
+        row = self.connection().execute(
+            "SELECT password_hash, points FROM users WHERE username = ?", (username,)
+        ).fetchone()
+        return {"password_hash": row[0], "points": row[1]} if row else None
+
+    def has_users(self):
+        return self.connection().execute("SELECT 1 FROM users LIMIT 1").fetchone() is not None
+
+    def add_user(self, username, password_hash):
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO users (username, password_hash, points) VALUES (?, ?, 0)",
+                (username, password_hash),
+            )
+            return cursor.rowcount == 1
+
+    def set_password_hash(self, username, password_hash):
+        with self.transaction() as conn:
+            conn.execute("UPDATE users SET password_hash = ? WHERE username = ?", (password_hash, username))
+
+    # --- Texte ---
+
+    def _verses(self, conn, text_id, revision):
+        with self._verse_cache_lock:
+            cached = self._verse_cache.get(text_id)
+        if cached is not None and cached[0] == revision:
+            return cached[1]
+        verses = []
+        plans_stored = True
+        for ref, text, plan in conn.execute("SELECT ref, text, plan FROM verses WHERE text_id = ? ORDER BY position", (text_id,)):
+            plan = json.loads(plan) if plan else {}
+            if plan.pop("v", None) == VERSE_SCHEMA_VERSION:
+                verses.append({"ref": ref, "text": text, **plan})
+            else:
+                # Fehlender oder veralteter Plan: nachrechnen, gespeichert wird beim nächsten save_texts
+                verses.append(plan_verse({"ref": ref, "text": text}))
+                plans_stored = False
+        with self._verse_cache_lock:
+            self._verse_cache[text_id] = (revision, verses, plans_stored)
+        return verses
+
+    def load_texts(self, owner, language):
+        """Texte eines Besitzers (``None`` = öffentlich) als ``{title: details}``.
+
+        Die Verslisten kommen aus einem Cache und werden nur neu gelesen, wenn
+        sich die ``revision`` des Textes geändert hat.
+        """
+        conn = self.connection()
+        if owner is None:
+            rows = conn.execute(
+                "SELECT id, title, revision, added_by, NULL, NULL FROM texts WHERE owner = ? AND language = ?",
+                (PUBLIC_OWNER, language),
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT t.id, t.title, t.revision, t.added_by, p.mode, p.last_index FROM texts t "
+                "LEFT JOIN progress p ON p.text_id = t.id AND p.username = t.owner "
+                "WHERE t.owner = ? AND t.language = ?",
+                (owner, language),
+            ).fetchall()
+        texts = {}
+        for text_id, title, revision, added_by, mode, last_index in rows:
+            details = {"verses": self._verses(conn, text_id, revision), "schema": VERSE_SCHEMA_VERSION}
+            if owner is None:
+                details["added_by"] = added_by
+            else:
+                details["mode"] = mode or "linear"
+                details["last_index"] = last_index or 0
+            texts[title] = details
+        return texts
+
+    def load_text(self, owner, language, title):
+        """Ein einzelner Text (``owner=None``: öffentlich) oder None."""
+        row = self.connection().execute(
+            "SELECT id, revision, added_by FROM texts WHERE owner = ? AND language = ? AND title = ?",
+            (PUBLIC_OWNER if owner is None else owner, language, title),
+        ).fetchone()
+        if row is None:
+            return None
+        text_id, revision, added_by = row
+        return {"verses": self._verses(self.connection(), text_id, revision), "schema": VERSE_SCHEMA_VERSION, "added_by": added_by}
+
+    def texts_version(self, owner, language):
+        """Ändert sich bei jedem Hinzufügen, Ändern oder Löschen eines Textes."""
+        return self.connection().execute(
+            "SELECT COUNT(*), COALESCE(MAX(id), 0), COALESCE(SUM(revision), 0) FROM texts WHERE owner = ? AND language = ?",
+            (PUBLIC_OWNER if owner is None else owner, language),
+        ).fetchone()
+
+    def save_texts(self, owner, language, texts):
+        """Ersetzt alle Texte eines Besitzers in einer Sprache durch ``texts``.
+
+        Fehlende Titel werden gelöscht; zum Hinzufügen ``add_texts`` verwenden.
+        Unveränderte Verslisten werden nicht neu geschrieben.
+        """
+        owner_key = PUBLIC_OWNER if owner is None else owner
+        with self.transaction() as conn:
+            existing = {
+                title: (text_id, revision)
+                for text_id, title, revision in conn.execute(
+                    "SELECT id, title, revision FROM texts WHERE owner = ? AND language = ?", (owner_key, language)
+                )
+            }
+            for title, (text_id, _) in existing.items():
+                if title not in texts:
+                    conn.execute("DELETE FROM texts WHERE id = ?", (text_id,))
+            for title, details in texts.items():
+                verses = details.get("verses", [])
+                if title in existing:
+                    text_id, revision = existing[title]
+                    with self._verse_cache_lock:
+                        cached = self._verse_cache.get(text_id)
+                    if cached is None or cached[0] != revision or not cached[2] or cached[1] != verses:
+                        conn.execute("DELETE FROM verses WHERE text_id = ?", (text_id,))
+                        self._insert_verses(conn, text_id, verses)
+                        conn.execute("UPDATE texts SET revision = revision + 1 WHERE id = ?", (text_id,))
+                else:
+                    text_id = conn.execute(
+                        "INSERT INTO texts (owner, language, title, added_by) VALUES (?, ?, ?, ?)",
+                        (owner_key, language, title, details.get("added_by")),
+                    ).lastrowid
+                    self._insert_verses(conn, text_id, verses)
+                if owner is not None:
+                    conn.execute(
+                        "INSERT INTO progress (username, text_id, mode, last_index) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT(username, text_id) DO UPDATE SET mode = excluded.mode, last_index = excluded.last_index",
+                        (owner, text_id, details.get("mode", "linear"), int(details.get("last_index", 0))),
+                    )
+
+    def add_texts(self, owner, language, texts):
+        """Fügt Texte hinzu, deren Titel es noch nicht gibt; vorhandene bleiben unberührt.
+
+        Anders als ``save_texts`` ohne vorheriges Laden: gleichzeitiges
+        Hinzufügen verschiedener Titel verliert nichts. Liefert die Titel, die
+        tatsächlich neu angelegt wurden.
+        """
+        owner_key = PUBLIC_OWNER if owner is None else owner
+        added = []
+        with self.transaction() as conn:
+            for title, details in texts.items():
+                cursor = conn.execute(
+                    "INSERT INTO texts (owner, language, title, added_by) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(owner, language, title) DO NOTHING",
+                    (owner_key, language, title, details.get("added_by")),
+                )
+                if cursor.rowcount != 1:
+                    continue
+                self._insert_verses(conn, cursor.lastrowid, details.get("verses", []))
+                if owner is not None:
+                    conn.execute(
+                        "INSERT INTO progress (username, text_id, mode, last_index) VALUES (?, ?, ?, ?)",
+                        (owner, cursor.lastrowid, details.get("mode", "linear"), int(details.get("last_index", 0))),
+                    )
+                added.append(title)
+        return added
+
+    def _insert_verses(self, conn, text_id, verses):
+        conn.executemany(
+            "INSERT INTO verses (text_id, position, ref, text, plan) VALUES (?, ?, ?, ?, ?)",
+            [(text_id, position, v.get("ref", ""), v.get("text", ""), _plan_json(v)) for position, v in enumerate(verses)],
+        )
+
+    def save_progress(self, username, language, title, last_index=None, mode=None):
+        """Aktualisiert eine einzelne progress-Zeile. False, wenn der Text fehlt."""
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT id FROM texts WHERE owner = ? AND language = ? AND title = ?", (username, language, title)
+            ).fetchone()
+            if row is None:
+                return False
+            conn.execute(
+                "INSERT INTO progress (username, text_id, mode, last_index) VALUES (?, ?, COALESCE(?, 'linear'), COALESCE(?, 0)) "
+                "ON CONFLICT(username, text_id) DO UPDATE SET "
+                "mode = COALESCE(?, mode), last_index = COALESCE(?, last_index)",
+                (username, row[0], mode, last_index, mode, last_index),
+            )
+            return True
+
+    # --- Eingelöste Tokens (API) ---
+
+    def spend_token(self, nonce, expires):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM spent_tokens WHERE expires < ?", (int(time.time()),))
+            cursor = conn.execute("INSERT OR IGNORE INTO spent_tokens (nonce, expires) VALUES (?, ?)", (nonce, int(expires)))
+            return cursor.rowcount == 1
+
+    # --- Wiederholung (SM-2) ---
+
+    def load_review_cards(self, username, language, deck):
+        rows = self.connection().execute(
+            "SELECT position, ref, ease, interval, reps, due FROM review_cards "
+            "WHERE username = ? AND language = ? AND deck = ?",
+            (username, language, deck),
+        )
+        return {position: Card(ref, ease, interval, reps, due) for position, ref, ease, interval, reps, due in rows}
+
+    def save_review_card(self, username, language, deck, position, card):
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO review_cards (username, language, deck, position, ref, ease, interval, reps, due) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (username, language, deck, position, card.ref, card.ease, card.interval, card.reps, card.due),
+            )
+
+
+def _plan_json(verse):
+    if "chunks" not in verse:
+        return None
+    return json.dumps(
+        {"chunks": verse["chunks"], "tokens": verse["tokens"], "points": verse["points"], "v": VERSE_SCHEMA_VERSION},
+        ensure_ascii=False,
+    )
+
+
+class SQLitePointsLedger:
+    """Gleiche Schnittstelle wie ``points.PointsLedger``, gespeichert in SQLite.
+
+    Jede Vergabe ist eine Zeile in ``point_awards`` plus ein ``UPDATE`` des
+    Punktestands in derselben Transaktion. Andere Prozesse werden über die
+    fortlaufende ``id`` der Vergaben eingeholt. Die Tages-Buckets für die
+    Zeitfenster-Leaderboards sind eine Gruppierung der Vergaben der letzten
+    BUCKET_DAYS Tage (Index auf ``ts``).
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._balances = None
+        self._last_award_id = 0
+        self._listeners = []
+        self._window_listeners = []
+
+    def add_listener(self, listener):
+        """``listener(username, balance)`` wird nach jeder Änderung eines Punktestands aufgerufen."""
+        self._listeners.append(listener)
+
+    def add_window_listener(self, listener):
+        """Wie ``PointsLedger.add_window_listener``; die Buckets kommen aus einer Abfrage."""
+        self.refresh()
+        conn = self.store.connection()
+        with self._lock:
+            since = datetime.datetime.combine(
+                datetime.date.fromordinal(award_day(time.time()) - BUCKET_DAYS + 1), datetime.time()
+            ).timestamp()
+            buckets = {}
+            rows = conn.execute(
+                "SELECT date(ts, 'unixepoch', 'localtime'), lang, username, SUM(points) FROM point_awards"
+                " WHERE ts >= ? AND id <= ? GROUP BY 1, 2, 3",
+                (int(since), self._last_award_id),
+            )
+            for day, lang, username, points in rows:
+                add_to_buckets(buckets, datetime.date.fromisoformat(day).toordinal(), lang, username, points)
+            listener.reset(buckets)
+            self._window_listeners.append(listener)
+
+    def balance(self, username):
+        self.refresh()
+        return self._balances.get(username, 0)
+
+    def balances(self):
+        self.refresh()
+        with self._lock:
+            return dict(self._balances)
+
+    def refresh(self):
+        conn = self.store.connection()
+        with self._lock:
+            if self._balances is None:
+                conn.execute("BEGIN") # Konsistenter Lesestand für beide Abfragen
+                try:
+                    self._last_award_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM point_awards").fetchone()[0]
+                    self._balances = dict(conn.execute("SELECT username, points FROM users"))
+                finally:
+                    conn.execute("COMMIT")
+                return
+            rows = conn.execute(
+                "SELECT id, username, points, ts, lang FROM point_awards WHERE id > ? ORDER BY id", (self._last_award_id,)
+            ).fetchall()
+            for award_id, username, points, timestamp, lang in rows:
+                self._balances[username] = self._balances.get(username, 0) + points
+                self._last_award_id = award_id
+                for listener in self._window_listeners:
+                    listener.award(award_day(timestamp), lang, username, points)
+            for username in {row[1] for row in rows}:
+                for listener in self._listeners:
+                    listener(username, self._balances[username])
+
+    def award(self, username, points, lang=None):
+        """Wie ``PointsLedger.award``; ``KeyError`` ohne Änderung, wenn es ``username`` nicht gibt."""
+        with self.store.transaction() as conn:
+            updated = conn.execute("UPDATE users SET points = points + ? WHERE username = ?", (int(points), username))
+            if updated.rowcount != 1:
+                # Sonst zählte die Vergabe in den Zeitfenstern, aber in keinem Punktestand
+                raise KeyError(username)
+            conn.execute(
+                "INSERT INTO point_awards (username, points, ts, lang) VALUES (?, ?, ?, ?)",
+                (username, int(points), int(time.time()), lang or None),
+            )
+        return self.balance(username)
+
+    def compact(self):
+        """Nichts zu tun: der Punktestand steht bereits in ``users.points``."""
+
+
+# --- Einmalige Übernahme der JSON-Daten ---
+
+def migrate_from_json(data_dir, db_path):
+    """Übernimmt users.json, Punkte-Ledger, öffentliche und private Texte sowie Wiederholungsdaten nach SQLite.
+
+    Liefert ``(benutzer, texte)`` als Anzahl der übernommenen Einträge.
+    """
+    from points import PointsLedger, SNAPSHOT_NAME
+    from userdata import TEXTS_DIR, safe_filename
+    from storage import read_json
+    from textstore import TextStore
+
+    text_store = TextStore(os.path.join(data_dir, os.path.basename(TEXTS_DIR)))
+
+    def resolve(texts):
+        # Ausgelagerte Verslisten (verses_id) wieder einsetzen
+        return {title: text_store.resolve(details) for title, details in texts.items()}
+
+    store = SQLiteStore(db_path)
+    users = read_json(os.path.join(data_dir, "users.json")) or {}
+    users = {name: dict(details) for name, details in users.items()}
+    buckets = {}
+    if os.path.exists(os.path.join(data_dir, SNAPSHOT_NAME)):
+        ledger = PointsLedger(data_dir)
+        balances = ledger.balances()
+        for name, details in users.items():
+            details["points"] = balances.get(name, 0)
+        buckets = ledger.buckets()
+    # Tages-Buckets als Vergaben (mittags) übernehmen; die Punktestände stehen schon in users.
+    # Bei einem erneuten Lauf sind die Vergaben schon da und würden die Zeitfenster verdoppeln.
+    with store.transaction() as conn:
+        if buckets and conn.execute("SELECT 1 FROM point_awards LIMIT 1").fetchone():
+            print("Vergaben übersprungen: point_awards ist bereits gefüllt.")
+            buckets = {}
+        conn.executemany(
+            "INSERT INTO users (username, password_hash, points) VALUES (?, ?, ?) "
+            "ON CONFLICT(username) DO UPDATE SET password_hash = excluded.password_hash, points = excluded.points",
+            [(name, d.get("password_hash", ""), int(d.get("points", 0))) for name, d in users.items()],
+        )
+        for day, langs in buckets.items():
+            noon = int(datetime.datetime.combine(datetime.date.fromordinal(day), datetime.time(12)).timestamp())
+            for lang, points_by_user in langs.items():
+                conn.executemany(
+                    "INSERT INTO point_awards (username, points, ts, lang) VALUES (?, ?, ?, ?)",
+                    [(username, points, noon, lang or None) for username, points in points_by_user.items()],
+                )
+
+    text_count = 0
+    public = read_json(os.path.join(data_dir, "public_verses.json")) or {}
+    for language, texts in public.items():
+        if not isinstance(texts, dict) or "verses" in texts:
+            print(f"Übersprungen (altes Format ohne Sprache): {language}")
+            continue
+        store.save_texts(None, language, resolve(texts))
+        text_count += len(texts)
+
+    owners = {safe_filename(name): name for name in users}
+    for path in glob.glob(os.path.join(data_dir, "*_verses_v2.json")):
+        prefix = os.path.basename(path)[:-len("_verses_v2.json")]
+        username = owners.get(prefix)
+        if username is None:
+            print(f"Übersprungen (kein passender Benutzer): {path}")
+            continue
+        for language, texts in (read_json(path) or {}).items():
+            store.save_texts(username, language, resolve(texts))
+            text_count += len(texts)
+
+    from srs import card_from_json
+    for path in glob.glob(os.path.join(data_dir, "*_reviews.json")):
+        username = owners.get(os.path.basename(path)[:-len("_reviews.json")])
+        if username is None:
+            print(f"Übersprungen (kein passender Benutzer): {path}")
+            continue
+        for language, decks in (read_json(path) or {}).items():
+            for deck, cards in decks.items():
+                for position, card in cards.items():
+                    store.save_review_card(username, language, deck, int(position), card_from_json(card))
+    return len(users), text_count
+
+
+def main(argv=None):
+    from userdata import USER_DATA_DIR, DB_FILE
+
+    parser = argparse.ArgumentParser(description="SQLite-Speicher der Vers-Lern-App verwalten.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="JSON-Dateien einmalig nach SQLite übernehmen")
+    migrate.add_argument("--data-dir", default=USER_DATA_DIR)
+    migrate.add_argument("--db", default=None, help=f"Zieldatei (Standard: {DB_FILE})")
+    args = parser.parse_args(argv)
+
+    db_path = args.db or os.path.join(args.data_dir, os.path.basename(DB_FILE))
+    started = time.perf_counter()
+    users, texts = migrate_from_json(args.data_dir, db_path)
+    print(f"{users} Benutzer und {texts} Texte nach {db_path} übernommen ({time.perf_counter() - started:.2f}s).")
+    print("Aktivieren mit: VERSER_STORAGE=sqlite streamlit run app.py")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Verteilte Wiederholung (SM-2) pro Benutzer und Vers.
+
+Jeder gelernte Vers eines Textes ist eine ``Card`` mit Leichtigkeit (``ease``),
+Intervall in Tagen, Anzahl erfolgreicher Wiederholungen und Fälligkeitstag.
+``ReviewQueue`` hält die gelernten Verse eines Textes in einem Heap nach
+Fälligkeit: der nächste Vers kostet O(log n), eine Bewertung ebenso. Fällige
+Wiederholungen kommen zuerst; erst wenn heute keine mehr fällig ist, folgen
+noch nie gelernte Verse in der Reihenfolge des Textes (eigener Heap nach
+Position). Sonst würde ein langer Text mit vielen neuen Versen die
+Wiederholungen von gestern endlos verdrängen.
+
+Veraltete Heap-Einträge (nach einer Bewertung) werden nicht gesucht und
+entfernt, sondern beim Herausnehmen übersprungen. Die Zahl der heute fälligen
+Verse kommt aus einem Zähler pro Fälligkeitstag, ohne alle Verse anzusehen.
+"""
+import collections
+import datetime
+import heapq
+
+MIN_EASE = 1.3
+START_EASE = 2.5
+NEW = -1 # Fälligkeitstag noch nie gelernter Verse (Platzhalter vor der ersten Bewertung)
+
+Card = collections.namedtuple("Card", "ref ease interval reps due")
+
+
+def today():
+    """Heutiger Tag als fortlaufende Zahl (date.toordinal)."""
+    return datetime.date.today().toordinal()
+
+
+def schedule(card, quality, day):
+    """SM-2: neue Karte nach einer Bewertung ``quality`` (0-5) am Tag ``day``."""
+    if quality < 3:
+        reps, interval = 0, 1 # Von vorn, morgen wieder
+    else:
+        reps = card.reps + 1
+        if reps == 1:
+            interval = 1
+        elif reps == 2:
+            interval = 6
+        else:
+            interval = round(card.interval * card.ease)
+    ease = max(MIN_EASE, card.ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return card._replace(ease=ease, interval=interval, reps=reps, due=day + interval)
+
+
+class ReviewQueue:
+    """Fällige Verse eines Textes für einen Benutzer.
+
+    ``verses`` ist die Versliste des Textes, ``cards`` die gespeicherten
+    Karten als ``{position: Card}``. Karten, deren Referenz nicht mehr zum
+    Vers an dieser Position passt (Text wurde ersetzt), werden verworfen.
+    """
+
+    def __init__(self, key, verses, cards=None):
+        self.key = key
+        self._verses = verses
+        self.refs = [verse.get("ref") for verse in verses]
+        self.cards = {}
+        self._due_per_day = collections.Counter()
+        heap, new_positions = [], []
+        for position, ref in enumerate(self.refs):
+            card = (cards or {}).get(position)
+            if card is not None and card.ref == ref:
+                self.cards[position] = card
+                self._due_per_day[card.due] += 1
+                heap.append((card.due, position))
+            else:
+                new_positions.append(position) # Aufsteigend, also bereits ein Heap
+        heapq.heapify(heap)
+        self._heap = heap
+        self._new_positions = new_positions
+        self._new = len(new_positions)
+
+    def __len__(self):
+        return len(self.refs)
+
+    def matches(self, key, verses):
+        """True, wenn die Queue noch zu diesem Text passt (gleiche Refs in gleicher Reihenfolge).
+
+        Solange der Text nicht neu geladen wurde, ist das nur ein Identitätsvergleich.
+        """
+        if self.key != key:
+            return False
+        if verses is self._verses:
+            return True
+        if len(verses) != len(self.refs) or any(verse.get("ref") != ref for verse, ref in zip(verses, self.refs)):
+            return False
+        self._verses = verses
+        return True
+
+    def _is_current(self, due, position):
+        card = self.cards.get(position)
+        return card is not None and due == card.due
+
+    def next(self, day=None):
+        """Position des als Nächstes fälligen Verses und ob er heute fällig ist.
+
+        Reihenfolge: heute fällige Wiederholungen, dann neue Verse (zählen als
+        fällig), zuletzt der am frühesten fällige Vers (Vorauslernen).
+        ``(None, False)`` für einen leeren Text.
+        """
+        day = today() if day is None else day
+        heap, new_positions = self._heap, self._new_positions
+        while heap and not self._is_current(*heap[0]):
+            heapq.heappop(heap) # Veralteter Eintrag
+        if heap and heap[0][0] <= day:
+            return heap[0][1], True
+        while new_positions and new_positions[0] in self.cards:
+            heapq.heappop(new_positions) # Inzwischen gelernt
+        if new_positions:
+            return new_positions[0], True
+        if not heap:
+            return None, False
+        return heap[0][1], False
+
+    def review(self, position, quality, day=None):
+        """Bewertet den Vers an ``position`` und liefert die neue Karte."""
+        day = today() if day is None else day
+        old = self.cards.get(position)
+        if old is None:
+            old = Card(self.refs[position], START_EASE, 0, 0, NEW)
+            self._new -= 1
+        else:
+            self._due_per_day[old.due] -= 1
+            if not self._due_per_day[old.due]:
+                del self._due_per_day[old.due]
+        card = schedule(old, quality, day)
+        self.cards[position] = card
+        self._due_per_day[card.due] += 1
+        heapq.heappush(self._heap, (card.due, position))
+        # Der Heap wächst um veraltete Einträge; ab doppelter Größe neu aufbauen
+        if len(self._heap) > 2 * len(self.refs):
+            self._heap = [entry for entry in set(self._heap) if self._is_current(*entry)]
+            heapq.heapify(self._heap)
+        return card
+
+    def due_count(self, day=None):
+        """``(fällige Wiederholungen, neue Verse)`` am Tag ``day``.
+
+        Kostet O(Anzahl verschiedener Fälligkeitstage), nicht O(Verse).
+        """
+        day = today() if day is None else day
+        return sum(count for due, count in self._due_per_day.items() if due <= day), self._new
+
+
+def quality_for(correct, mistakes=0):
+    """Bewertung für SM-2 aus dem Ergebnis einer Übung."""
+    if not correct:
+        return 1
+    if mistakes:
+        return 3 # Richtig, aber mit Fehlgriffen
+    return 5
+
+
+def card_to_json(card):
+    return {"ref": card.ref, "e": round(card.ease, 3), "i": card.interval, "n": card.reps, "d": card.due}
+
+
+def card_from_json(data):
+    return Card(data["ref"], data["e"], data["i"], data["n"], data["d"])
@@ -0,0 +1,219 @@
+"""Prozessweiter Cache für die JSON-Dateien unter ``user_data``.
+
+Streamlit führt bei jedem Klick das ganze Skript neu aus. Damit dabei nicht
+jedes Mal ``users.json``, ``public_verses.json`` und die Versdateien der
+Benutzer neu geparst werden, hält dieses Modul den geparsten Inhalt pro
+Dateipfad im Speicher. Ein Eintrag wird nur verworfen, wenn sich mtime oder
+Größe der Datei ändern oder die App die Datei selbst schreibt.
+
+Außerdem stellt es die Bausteine für prozessübergreifend sichere Schreibzugriffe
+bereit: Dateisperren, atomares Ersetzen und gesperrtes Read-Modify-Write.
+"""
+import contextlib
+import json
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: nur Sperren innerhalb des Prozesses
+    fcntl = None
+
+_cache = {}  # Pfad -> ((mtime_ns, size), geparste Daten)
+_cache_lock = threading.Lock()
+
+# Zähler für Benchmarks und Metriken: geparste bzw. geschriebene Dateien und Bytes
+_io_counters = {"reads": 0, "cache_hits": 0, "bytes_read": 0, "writes": 0, "bytes_written": 0}
+_io_lock = threading.Lock()
+
+
+def count_io(**increments):
+    """Erhöht die I/O-Zähler, z.B. ``count_io(writes=1, bytes_written=n)``."""
+    with _io_lock:
+        for name, value in increments.items():
+            _io_counters[name] += value
+
+
+def io_counters():
+    """Kopie der I/O-Zähler seit Prozessstart bzw. ``reset_io_counters``."""
+    with _io_lock:
+        return dict(_io_counters)
+
+
+def reset_io_counters():
+    with _io_lock:
+        for name in _io_counters:
+            _io_counters[name] = 0
+
+
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def read_json(path, prepare=None):
+    """Liefert den geparsten Inhalt von ``path`` oder ``None``, wenn die Datei fehlt.
+
+    Das Ergebnis wird zwischen allen Sessions geteilt und darf vom Aufrufer
+    nicht verändert werden; wer ändern will, muss vorher kopieren.
+    ``prepare`` wird einmal pro Parsen auf die Daten angewendet, bevor sie in
+    den Cache kommen (z.B. um ältere Formate nachzurüsten).
+    Lese- und Parse-Fehler (``OSError``, ``json.JSONDecodeError``) werden
+    unverändert weitergereicht.
+    """
+    signature = file_signature(path)
+    if signature is None:
+        invalidate(path)
+        return None
+    with _cache_lock:
+        entry = _cache.get(path)
+    if entry is not None and entry[0] == signature:
+        count_io(cache_hits=1)
+        return entry[1]
+
+    with open(path, "r", encoding='utf-8') as f:
+        data = json.load(f)
+    count_io(reads=1, bytes_read=signature[1])
+    if prepare is not None:
+        data = prepare(data)
+    # Signatur erneut lesen: wurde die Datei während des Parsens ersetzt,
+    # wird nichts gecacht und der nächste Aufruf liest neu.
+    if file_signature(path) == signature:
+        with _cache_lock:
+            _cache[path] = (signature, data)
+    return data
+
+
+def write_json(path, data):
+    """Schreibt ``data`` atomar als JSON nach ``path`` und verwirft den Cache-Eintrag."""
+    write_json_atomic(path, data)
+
+
+def invalidate(path=None):
+    """Verwirft den Cache-Eintrag für ``path`` bzw. den gesamten Cache."""
+    with _cache_lock:
+        if path is None:
+            _cache.clear()
+        else:
+            _cache.pop(path, None)
+
+
+# --- Sperren und atomares Schreiben ---
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+def _thread_lock(path):
+    with _thread_locks_guard:
+        return _thread_locks.setdefault(path, threading.Lock())
+
+
+@contextlib.contextmanager
+def file_lock(path, shared=False):
+    """Sperrt ``path + '.lock'`` über Prozesse und Threads hinweg.
+
+    ``shared=True`` erlaubt mehrere gleichzeitige Leser. Innerhalb eines
+    Prozesses sind Sperren auf denselben Pfad immer exklusiv.
+    """
+    lock_path = path + ".lock"
+    with _thread_lock(lock_path):
+        with open(lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# Online-Snapshots (backup.py): jeder Schreibzugriff hält die Sperre geteilt,
+# aber nur für das Umbenennen bzw. Anhängen selbst; der Snapshot hält sie
+# exklusiv, solange er die Dateien verlinkt. So sieht er alle Dateien zu genau
+# einem Zeitpunkt, ohne die Schreiber länger als Millisekunden aufzuhalten.
+SNAPSHOT_LOCK = "snapshot"
+_snapshot_barrier = None
+
+
+def use_snapshot_barrier(data_dir):
+    """Schreibzugriffe dieses Prozesses warten künftig auf Snapshots von ``data_dir``."""
+    global _snapshot_barrier
+    _snapshot_barrier = os.path.join(data_dir, SNAPSHOT_LOCK)
+
+
+@contextlib.contextmanager
+def write_barrier():
+    """Geteilte Snapshot-Sperre um einen einzelnen Schreibzugriff (falls aktiviert)."""
+    if _snapshot_barrier is None:
+        yield
+        return
+    with file_lock(_snapshot_barrier, shared=True):
+        yield
+
+
+@contextlib.contextmanager
+def snapshot_barrier(data_dir):
+    """Exklusive Snapshot-Sperre: solange sie gehalten wird, ändert sich keine Datei unter ``data_dir``."""
+    with file_lock(os.path.join(data_dir, SNAPSHOT_LOCK)):
+        yield
+
+
+def fsync_dir(directory):
+    """Macht ein Umbenennen/Löschen in ``directory`` crashsicher (wo möglich)."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(directory or ".", os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_json_atomic(path, data, indent=2):
+    """Schreibt ``data`` in eine temporäre Datei, fsynct und benennt sie um.
+
+    Leser sehen so immer entweder die alte oder die neue, vollständige Datei.
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        encoded = json.dumps(data, indent=indent, ensure_ascii=False).encode('utf-8')
+        with os.fdopen(fd, "wb") as f:
+            f.write(encoded)
+            f.flush()
+            os.fsync(f.fileno())
+        count_io(writes=1, bytes_written=len(encoded))
+        with write_barrier():
+            os.replace(tmp_path, path)
+        fsync_dir(directory)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp_path)
+        raise
+    finally:
+        invalidate(path)
+
+
+def update_json(path, mutate, prepare=None, dump=None):
+    """Gesperrtes Read-Modify-Write einer JSON-Datei.
+
+    ``mutate`` bekommt eine flache Kopie des aktuellen Inhalts (``{}``, wenn
+    die Datei fehlt) und gibt ``True`` zurück, wenn geschrieben werden soll.
+    Liefert den Rückgabewert von ``mutate``. ``prepare`` wie bei ``read_json``;
+    wer die Datei sonst mit ``prepare`` liest, muss es auch hier angeben,
+    damit der Cache nicht mit unvorbereiteten Daten gefüllt wird. ``dump`` ist
+    das Gegenstück: es bringt die vorbereiteten Daten zurück in die Form auf
+    der Platte.
+    """
+    with file_lock(path):
+        invalidate(path)  # Unter der Sperre immer den Stand auf der Platte lesen
+        data = dict(read_json(path, prepare=prepare) or {})
+        changed = mutate(data)
+        if changed:
+            write_json_atomic(path, dump(data) if dump is not None else data)
+        return changed
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# Module liegen flach im Projektordner; userdata liest VERSER_DATA_DIR beim Import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("VERSER_DATA_DIR", tempfile.mkdtemp(prefix="verser-tests-"))
+os.environ.setdefault("VERSER_BCRYPT_ROUNDS", "4")
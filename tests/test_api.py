@@ -0,0 +1,125 @@
+import asyncio
+import json
+
+import pytest
+
+import userdata
+from api import ApiError, ApiServer, Request, TokenError, TokenSigner, read_request
+from practice import shuffle_chunks
+from verses import parse_verses_from_text
+
+TEXT = "1) Eph. 1:1 Paulus ein Apostel Christi Jesu durch den Willen Gottes an die Heiligen\n" \
+       "2) Eph. 1:2 Gnade sei mit euch und Friede von Gott unserem Vater"
+
+
+@pytest.fixture(scope="module")
+def signer():
+    verses = parse_verses_from_text(TEXT)
+    userdata.register_user("anna", "unused")
+    userdata.save_user_verses("anna", "DE", {"Eph 1": {"verses": verses, "mode": "random", "last_index": 0}})
+    return TokenSigner("test-secret")
+
+
+def call(server, method, path, token=None, query=None, body=None):
+    headers = {"authorization": f"Bearer {token}"} if token else {}
+    payload = json.dumps(body).encode("utf-8") if body is not None else b""
+    request = Request(method, path, query or {}, headers, payload, "127.0.0.1")
+    return asyncio.run(server.dispatch(request))
+
+
+def solve(server, session):
+    verse = call(server, "GET", "/verse", session, {"lang": "DE", "title": "Eph 1", "index": "0"})
+    expected = userdata.load_user_verses("anna", "DE")["Eph 1"]["verses"][0]["chunks"]
+    order = [verse["chunks"].index(chunk) for chunk in expected]
+    return verse["challenge"], order
+
+
+def test_challenge_pays_out_once(signer):
+    server = ApiServer(signer)
+    session = signer.sign("session", {"u": "anna"}, 60)
+    challenge, order = solve(server, session)
+    before = userdata.get_points_ledger().balance("anna")
+
+    awards = [call(server, "POST", "/submit", session, body={"challenge": challenge, "order": order})["award"]
+              for _ in range(3)]
+    first = call(server, "POST", "/award", session, body={"award": awards[0]})
+    assert first["balance"] == before + first["points"]
+    for award in awards:
+        with pytest.raises(ApiError) as error:
+            call(server, "POST", "/award", session, body={"award": award})
+        assert error.value.status == 409
+    # Eine zweite Instanz kennt die eingelösten Tokens ebenfalls
+    with pytest.raises(ApiError) as error:
+        call(ApiServer(signer), "POST", "/award", session, body={"award": awards[1]})
+    assert error.value.status == 409
+    assert userdata.get_points_ledger().balance("anna") == first["balance"]
+
+
+def test_new_challenge_pays_again(signer):
+    server = ApiServer(signer)
+    session = signer.sign("session", {"u": "anna"}, 60)
+    ledger = userdata.get_points_ledger()
+    for _ in range(2):
+        before = ledger.balance("anna")
+        challenge, order = solve(server, session)
+        award = call(server, "POST", "/submit", session, body={"challenge": challenge, "order": order})["award"]
+        result = call(server, "POST", "/award", session, body={"award": award})
+        assert result["balance"] == before + result["points"] > before
+
+
+def test_challenge_does_not_reveal_shuffle_seed(signer):
+    server = ApiServer(signer)
+    session = signer.sign("session", {"u": "anna"}, 60)
+    verse = call(server, "GET", "/verse", session, {"lang": "DE", "title": "Eph 1", "index": "0"})
+    claims = signer.verify(verse["challenge"], "verse")
+    assert "s" not in claims
+    # Ohne Schlüssel liefert die Nonce eine andere Reihenfolge
+    chunks = userdata.load_user_verses("anna", "DE")["Eph 1"]["verses"][0]["chunks"]
+    assert shuffle_chunks(chunks, signer.derive("shuffle", claims["n"])) == verse["chunks"]
+    assert TokenSigner("other-secret").derive("shuffle", claims["n"]) != signer.derive("shuffle", claims["n"])
+
+
+def test_wrong_answer_spends_challenge(signer):
+    server = ApiServer(signer)
+    session = signer.sign("session", {"u": "anna"}, 60)
+    challenge, order = solve(server, session)
+    wrong = call(server, "POST", "/submit", session, body={"challenge": challenge, "order": order[::-1]})
+    assert wrong == {"correct": False, "next_index": 1}
+    right = call(server, "POST", "/submit", session, body={"challenge": challenge, "order": order})
+    assert right["correct"] and right["text"]
+    with pytest.raises(ApiError) as error:
+        call(server, "POST", "/award", session, body={"award": right["award"]})
+    assert error.value.status == 409
+
+
+def test_award_of_other_user_is_rejected(signer):
+    server = ApiServer(signer)
+    challenge, order = solve(server, signer.sign("session", {"u": "anna"}, 60))
+    award = call(server, "POST", "/submit", signer.sign("session", {"u": "anna"}, 60),
+                 body={"challenge": challenge, "order": order})["award"]
+    with pytest.raises(ApiError) as error:
+        call(server, "POST", "/award", signer.sign("session", {"u": "ben"}, 60), body={"award": award})
+    assert error.value.status == 403
+
+
+def test_tokens_are_kind_bound_and_tamper_proof(signer):
+    session = signer.sign("session", {"u": "anna"}, 60)
+    with pytest.raises(TokenError):
+        signer.verify(session, "award")
+    body, signature = session.split(".")
+    with pytest.raises(TokenError):
+        signer.verify(body[:-2] + "xx." + signature, "session")
+    with pytest.raises(TokenError):
+        signer.verify(signer.sign("session", {"u": "anna"}, -1), "session")
+
+
+def test_truncated_body_is_bad_request():
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"POST /login HTTP/1.1\r\nContent-Length: 50\r\n\r\n{\"username\":")
+        reader.feed_eof()
+        return await read_request(reader, "127.0.0.1")
+
+    with pytest.raises(ApiError) as error:
+        asyncio.run(read())
+    assert error.value.status == 400
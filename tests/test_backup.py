@@ -0,0 +1,107 @@
+import io
+import json
+import os
+import tarfile
+
+import pytest
+
+from backup import BackupError, restore, snapshot, verify
+from points import PointsLedger
+from sqlite_store import SQLiteStore
+from textstore import TextStore
+from verses import parse_verses_from_text
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    data_dir = tmp_path / "user_data"
+    data_dir.mkdir()
+    with open(data_dir / "users.json", "w", encoding="utf-8") as f:
+        json.dump({"anna": {"password_hash": "x", "points": 0}}, f)
+    verses = parse_verses_from_text("1) Eph. 2:8 Denn aus Gnade seid ihr gerettet durch den Glauben")
+    stored = TextStore(str(data_dir / "texts")).externalize({"verses": verses, "schema": 1, "mode": "linear"})
+    with open(data_dir / "anna_verses_v2.json", "w", encoding="utf-8") as f:
+        json.dump({"DE": {"Eph 2": stored}}, f)
+    ledger = PointsLedger(str(data_dir), seed=lambda: {})
+    ledger.award("anna", 7, lang="DE")
+    SQLiteStore(str(data_dir / "verser.db")).add_user("anna", "x")
+    (data_dir / "metrics.prom").write_text("# nicht gesichert\n")
+    return data_dir
+
+
+def take_snapshot(data_dir, tmp_path):
+    archive = tmp_path / "verser.tar.gz"
+    with open(archive, "wb") as f:
+        stats = snapshot(str(data_dir), f)
+    return archive, stats
+
+
+def rewrite_archive(archive, change):
+    """Schreibt das Archiv neu, wobei ``change(name, data)`` den Inhalt jedes Eintrags liefert."""
+    members = []
+    with tarfile.open(archive, mode="r:gz") as tar:
+        for member in tar:
+            members.append((member, tar.extractfile(member).read()))
+    with tarfile.open(archive, mode="w:gz") as tar:
+        for member, data in members:
+            data = change(member.name, data)
+            member.size = len(data)
+            tar.addfile(member, io.BytesIO(data))
+
+
+def test_snapshot_verify_restore_round_trip(data_dir, tmp_path):
+    archive, stats = take_snapshot(data_dir, tmp_path)
+    manifest, problems = verify(str(archive))
+    assert problems == []
+    assert "metrics.prom" not in manifest["files"]
+    assert {"users.json", "anna_verses_v2.json", "verser.db"} <= manifest["files"].keys()
+    assert stats["files"] == len(manifest["files"])
+
+    target = tmp_path / "restored"
+    restore(str(archive), str(target))
+    assert json.loads((target / "users.json").read_text(encoding="utf-8")) == {"anna": {"password_hash": "x", "points": 0}}
+    assert PointsLedger(str(target)).balances() == {"anna": 7}
+    assert SQLiteStore(str(target / "verser.db")).get_user("anna") == {"password_hash": "x", "points": 0}
+    texts = json.loads((target / "anna_verses_v2.json").read_text(encoding="utf-8"))
+    assert TextStore(str(target / "texts")).resolve(texts["DE"]["Eph 2"])["verses"][0]["ref"] == "Eph. 2:8"
+
+
+def test_restore_keeps_previous_data_dir(data_dir, tmp_path):
+    archive, _ = take_snapshot(data_dir, tmp_path)
+    with pytest.raises(BackupError):
+        restore(str(archive), str(data_dir))
+    _, previous = restore(str(archive), str(data_dir), force=True)
+    assert os.path.isfile(os.path.join(previous, "users.json"))
+    assert (data_dir / "users.json").is_file()
+
+
+def test_verify_rejects_changed_file(data_dir, tmp_path):
+    archive, _ = take_snapshot(data_dir, tmp_path)
+    rewrite_archive(archive, lambda name, data: data.replace(b"anna", b"otto") if name == "users.json" else data)
+    _, problems = verify(str(archive))
+    assert problems == ["users.json: Prüfsumme oder Größe weicht ab"]
+
+    target = tmp_path / "restored"
+    with pytest.raises(BackupError):
+        restore(str(archive), str(target))
+    assert not target.exists()
+
+
+def test_verify_rejects_text_not_matching_its_name(data_dir, tmp_path):
+    archive, _ = take_snapshot(data_dir, tmp_path)
+
+    def tamper(name, data):
+        if name.startswith("texts/"):
+            return data.replace("Gnade".encode("utf-8"), "Werke".encode("utf-8"))
+        return data
+    rewrite_archive(archive, tamper)
+    _, problems = verify(str(archive))
+    assert any(problem.endswith("Inhalt passt nicht zum Dateinamen") for problem in problems)
+
+
+def test_verify_rejects_truncated_archive(data_dir, tmp_path):
+    archive, _ = take_snapshot(data_dir, tmp_path)
+    data = archive.read_bytes()
+    archive.write_bytes(data[:len(data) // 2])
+    manifest, problems = verify(str(archive))
+    assert manifest is None and problems
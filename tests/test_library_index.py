@@ -0,0 +1,58 @@
+import sys
+import threading
+
+from library_index import LibraryIndex
+
+
+def text(*lines):
+    return {"verses": [{"ref": ref, "text": verse} for ref, verse in lines]}
+
+
+def test_search_ranks_title_matches_first():
+    index = LibraryIndex({
+        "Epheser 2": text(("Eph. 2:8", "Denn aus Gnade seid ihr gerettet")),
+        "Römer": text(("Röm. 3:24", "und werden ohne Verdienst gerecht aus seiner Gnade")),
+        "Gnade": text(("Tit. 2:11", "Denn es ist erschienen die heilsame Gnade Gottes")),
+    })
+    assert index.search("gnad") == (["Gnade", "Epheser 2", "Römer"], 3)
+    assert index.search("eph 2") == (["Epheser 2"], 1)
+    assert index.search("") == (["Epheser 2", "Gnade", "Römer"], 3)
+
+
+def test_concurrent_add_and_search():
+    index = LibraryIndex({"Basis": text(("Joh. 3:16", "Also hat Gott die Welt geliebt"))})
+    errors = []
+    done = threading.Event()
+
+    def write():
+        try:
+            for number in range(300):
+                index.add(f"Text {number}", text(("Ps. 23:1", f"Der Herr ist mein Hirte wort{number}")))
+                if number % 3 == 0:
+                    index.remove(f"Text {number}")
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    def read():
+        try:
+            while not done.is_set():
+                index.search("wort")
+                index.search("herr w")
+        except Exception as e:
+            errors.append(e)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6) # häufige Threadwechsel, damit Überschneidungen auch auftreten
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(3)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert errors == []
+    assert index.search("wort")[1] == 200
+    assert len(index) == 201
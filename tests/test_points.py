@@ -0,0 +1,88 @@
+import json
+import os
+import threading
+
+from points import LOG_NAME, SNAPSHOT_NAME, PointsLedger
+
+
+def read_snapshot(data_dir):
+    with open(os.path.join(data_dir, SNAPSHOT_NAME), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_seed_only_on_first_start(tmp_path):
+    ledger = PointsLedger(str(tmp_path), seed=lambda: {"anna": 10})
+    assert ledger.balance("anna") == 10
+    ledger.award("anna", 5)
+    again = PointsLedger(str(tmp_path), seed=lambda: {"anna": 999})
+    assert again.balance("anna") == 15
+
+
+def test_replay_log_in_new_instance(tmp_path):
+    ledger = PointsLedger(str(tmp_path))
+    ledger.award("anna", 3, lang="DE")
+    ledger.award("ben", 4)
+    ledger.award("anna", 2, lang="EN")
+    replayed = PointsLedger(str(tmp_path))
+    assert replayed.balances() == {"anna": 5, "ben": 4}
+
+
+def test_other_instance_sees_new_awards(tmp_path):
+    first, second = PointsLedger(str(tmp_path)), PointsLedger(str(tmp_path))
+    assert second.balance("anna") == 0
+    first.award("anna", 7)
+    assert second.balance("anna") == 7
+    assert second.award("anna", 1) == 8
+    assert first.balance("anna") == 8
+
+
+def test_compaction_moves_log_into_snapshot(tmp_path):
+    ledger = PointsLedger(str(tmp_path), compact_every=3)
+    for _ in range(7):
+        ledger.award("anna", 1)
+    snapshot = read_snapshot(tmp_path)
+    assert snapshot["generation"] == 3
+    assert snapshot["balances"] == {"anna": 6}
+    logs = sorted(name for name in os.listdir(tmp_path) if name.endswith(".log"))
+    assert logs == [LOG_NAME.format(generation=3)]
+    assert PointsLedger(str(tmp_path)).balance("anna") == 7
+
+
+def test_crash_between_snapshot_and_log_delete_counts_once(tmp_path):
+    ledger = PointsLedger(str(tmp_path), compact_every=1000)
+    ledger.award("anna", 5)
+    old_log = os.path.join(tmp_path, LOG_NAME.format(generation=1))
+    with open(old_log, "rb") as f:
+        content = f.read()
+    ledger.compact()
+    # Absturz nach dem neuen Snapshot, bevor das alte Log gelöscht wurde
+    with open(old_log, "wb") as f:
+        f.write(content)
+    assert PointsLedger(str(tmp_path)).balance("anna") == 5
+
+
+def test_torn_last_line_is_skipped_and_closed(tmp_path):
+    ledger = PointsLedger(str(tmp_path))
+    ledger.award("anna", 2)
+    log_path = os.path.join(tmp_path, LOG_NAME.format(generation=1))
+    with open(log_path, "ab") as f:
+        f.write(b'{"u": "anna", "p": 10')  # Absturz mitten in der Zeile
+    fresh = PointsLedger(str(tmp_path))
+    assert fresh.balance("anna") == 2
+    assert fresh.award("anna", 1) == 3
+    assert PointsLedger(str(tmp_path)).balance("anna") == 3
+
+
+def test_concurrent_awards_are_not_lost(tmp_path):
+    ledgers = [PointsLedger(str(tmp_path), compact_every=50) for _ in range(4)]
+
+    def award_many(ledger):
+        for _ in range(100):
+            ledger.award("anna", 1)
+
+    threads = [threading.Thread(target=award_many, args=(ledger,)) for ledger in ledgers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert PointsLedger(str(tmp_path)).balance("anna") == 400
@@ -0,0 +1,53 @@
+import pytest
+
+from practice import PracticeState, derive_seed, shuffle_chunks, shuffle_order
+
+
+@pytest.mark.parametrize("count", [0, 1, 2, 7, 64, 200])
+@pytest.mark.parametrize("seed", [0, 1, 42, 2**63, 2**64 - 1])
+def test_shuffle_order_is_permutation(count, seed):
+    assert sorted(shuffle_order(count, seed)) == list(range(count))
+
+
+def test_shuffle_order_is_stable():
+    # Feste Werte: jede Replika und Python-Version muss dieselbe Mischung liefern
+    assert shuffle_order(10, 42) == [0, 9, 5, 8, 6, 4, 7, 2, 1, 3]
+    assert shuffle_order(10, 2**64 - 1) == [3, 4, 2, 7, 5, 0, 8, 1, 9, 6]
+    assert shuffle_order(10, 42) == shuffle_order(10, 42 + 2**64) # nur die unteren 64 Bit zählen
+
+
+def test_seeds_give_different_orders():
+    orders = {tuple(shuffle_order(12, seed)) for seed in range(50)}
+    assert len(orders) == 50
+
+
+def test_derive_seed_is_deterministic():
+    seed = derive_seed(7, ("DE", "Eph 1"), 0, "Eph. 1:1")
+    assert seed == derive_seed(7, ("DE", "Eph 1"), 0, "Eph. 1:1")
+    assert 0 <= seed < 2**64
+    assert seed != derive_seed(8, ("DE", "Eph 1"), 0, "Eph. 1:1")
+    assert seed != derive_seed(7, ("DE", "Eph 1"), 1, "Eph. 1:1")
+
+
+def test_picks_and_used_bitmask():
+    verse = {"ref": "Eph. 2:8", "chunks": ["Denn aus", "Gnade seid", "ihr gerettet"], "text": "Denn aus Gnade seid ihr gerettet"}
+    practice = PracticeState(("DE", "Eph 2"), 0, verse, seed=5)
+    assert sorted(practice.shuffled) == sorted(verse["chunks"])
+    assert practice.shuffled == shuffle_chunks(verse["chunks"], 5)
+    order = [practice.shuffled.index(chunk) for chunk in verse["chunks"]]
+    assert not practice.pick(order[0])
+    assert practice.is_used(order[0]) and not practice.is_used(order[1])
+    practice.undo()
+    assert practice.used == 0 and not practice.picks
+    assert [practice.pick(position) for position in order] == [False, False, True]
+    assert practice.selected_texts() == verse["chunks"]
+
+
+def test_strict_pick_rejects_wrong_chunk():
+    verse = {"ref": "Eph. 2:8", "chunks": ["Denn aus", "Gnade seid", "ihr gerettet"]}
+    practice = PracticeState(("DE", "Eph 2"), 0, verse, seed=5, strict=True)
+    wrong = practice.shuffled.index("ihr gerettet")
+    assert not practice.pick(wrong)
+    assert practice.mistakes == 1 and practice.last_wrong == wrong and not practice.picks
+    assert not practice.pick(practice.shuffled.index("Denn aus"))
+    assert practice.last_wrong is None and len(practice.picks) == 1
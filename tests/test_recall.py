@@ -0,0 +1,52 @@
+import random
+
+from recall import edit_distance, highlight_recall, partial_points, score_recall, word_diff
+
+
+def reference_distance(expected, typed):
+    """Quadratische DP als Vergleich für den bitparallelen Algorithmus."""
+    previous = list(range(len(typed) + 1))
+    for i, word in enumerate(expected, 1):
+        current = [i]
+        for j, other in enumerate(typed, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (word != other)))
+        previous = current
+    return previous[-1]
+
+
+def test_matches_reference_dp():
+    rng = random.Random(7)
+    vocabulary = ["a", "b", "c", "d"]
+    for _ in range(500):
+        expected = [rng.choice(vocabulary) for _ in range(rng.randrange(0, 80))]
+        typed = [rng.choice(vocabulary) for _ in range(rng.randrange(0, 80))]
+        assert edit_distance(expected, typed) == reference_distance(expected, typed)
+
+
+def test_diff_is_consistent_with_distance():
+    rng = random.Random(11)
+    for _ in range(300):
+        expected = [rng.choice("abc") for _ in range(rng.randrange(0, 30))]
+        typed = [rng.choice("abc") for _ in range(rng.randrange(0, 30))]
+        distance, edits = word_diff(expected, typed)
+        assert distance == reference_distance(expected, typed)
+        assert sum(edit.tag != "equal" for edit in edits) == distance
+        assert [edit.expected for edit in edits if edit.tag != "insert"] == expected
+        assert [edit.typed for edit in edits if edit.tag != "delete"] == typed
+
+
+def test_case_and_punctuation_are_ignored():
+    result = score_recall("Denn also hat Gott die Welt geliebt,", "denn also hat gott die welt geliebt")
+    assert result.distance == 0 and result.accuracy == 1.0
+
+
+def test_swapped_words_are_delete_and_insert():
+    _, edits = word_diff("denn also hat Gott".split(), "denn hat also Gott".split())
+    assert [edit.tag for edit in edits].count("replace") == 0
+
+
+def test_partial_points_and_highlight_escape_html():
+    result = score_recall("eins zwei drei vier", "eins zwei <b>drei</b>")
+    assert result.distance == 2
+    assert partial_points(result, 10) == 5
+    assert "<b>" not in highlight_recall(result.edits)
@@ -0,0 +1,52 @@
+import pytest
+
+from refs import RefIndex, RefRange, parse_range, parse_ref
+
+
+@pytest.mark.parametrize("ref, expected", [
+    ("Eph. 1:3", ("eph", 1, 3)),
+    ("1 Kor. 13:4", ("1kor", 13, 4)),
+    ("Röm 8:28", ("röm", 8, 28)),
+    ("Eph 1024:1", None),
+    ("kein Vers", None),
+    (None, None),
+])
+def test_parse_ref(ref, expected):
+    assert parse_ref(ref) == expected
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("Eph 1:3-14", RefRange("eph", (1, 3), (1, 14))),
+    ("Eph. 1:3–2:5", RefRange("eph", (1, 3), (2, 5))),
+    ("2:8", RefRange(None, (2, 8), (2, 8))),
+    ("Eph 2", RefRange("eph", (2, 0), (2, 1023))),
+    ("2-3", RefRange(None, (2, 0), (3, 1023))),
+    ("Eph 1:14-3", None),
+    ("Eph 1-1100", None),
+    ("Eph 1:1-1024", None),
+    ("1024:1", None),
+    ("", None),
+])
+def test_parse_range(query, expected):
+    assert parse_range(query) == expected
+
+
+def test_lookup_in_bible_order_across_texts():
+    texts = {
+        "Epheser 2": [{"ref": "Eph. 2:8"}, {"ref": "Eph. 2:9"}, {"ref": "Überschrift"}],
+        "Epheser 1": [{"ref": "Eph. 1:14"}, {"ref": "Eph. 1:3"}, {"ref": "Eph. 1:4"}],
+        "Johannes": [{"ref": "Joh. 3:16"}],
+    }
+    index = RefIndex(texts)
+    assert len(index) == 6
+    assert index.lookup(parse_range("Eph 1:3-14")) == {"Epheser 1": [1, 2, 0]}
+    assert index.lookup(parse_range("Epheser 1:4-2:8")) == {"Epheser 1": [2, 0], "Epheser 2": [0]}
+    assert index.lookup(parse_range("3:16")) == {"Johannes": [0]}
+    assert index.lookup(parse_range("Eph 2"), title="Epheser 1") == {}
+    assert index.lookup(parse_range("Eph 2"), title="Unbekannt") == {}
+
+
+def test_large_numbers_do_not_reach_other_books():
+    index = RefIndex({"A": [{"ref": "Eph. 1:1"}], "B": [{"ref": "Kol. 2:1"}]})
+    assert parse_range("Eph 1-1100") is None
+    assert index.lookup(parse_range("Eph 1-1023")) == {"A": [0]}
@@ -0,0 +1,38 @@
+import json
+import os
+
+import pytest
+
+from points import PointsLedger
+from sqlite_store import SQLitePointsLedger, SQLiteStore, migrate_from_json
+
+
+def awarded(store):
+    return dict(store.connection().execute("SELECT username, SUM(points) FROM point_awards GROUP BY username"))
+
+
+def test_award_to_unknown_user_changes_nothing(tmp_path):
+    store = SQLiteStore(str(tmp_path / "verser.db"))
+    store.add_user("anna", "x")
+    ledger = SQLitePointsLedger(store)
+    assert ledger.award("anna", 5, lang="DE") == 5
+    with pytest.raises(KeyError):
+        ledger.award("anan", 5, lang="DE")
+    assert awarded(store) == {"anna": 5}
+    assert ledger.balances() == {"anna": 5}
+
+
+def test_migrating_twice_keeps_awards(tmp_path):
+    data_dir = str(tmp_path)
+    with open(os.path.join(data_dir, "users.json"), "w", encoding="utf-8") as f:
+        json.dump({"anna": {"password_hash": "x", "points": 0}, "ben": {"password_hash": "y", "points": 0}}, f)
+    ledger = PointsLedger(data_dir, seed=lambda: {})
+    ledger.award("anna", 3, lang="DE")
+    ledger.award("ben", 4)
+    db_path = os.path.join(data_dir, "verser.db")
+
+    assert migrate_from_json(data_dir, db_path) == (2, 0)
+    migrate_from_json(data_dir, db_path)
+    store = SQLiteStore(db_path)
+    assert awarded(store) == {"anna": 3, "ben": 4}
+    assert {name: details["points"] for name, details in store.load_users().items()} == {"anna": 3, "ben": 4}
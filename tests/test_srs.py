@@ -0,0 +1,72 @@
+import pytest
+
+from srs import START_EASE, Card, ReviewQueue, quality_for, schedule
+
+DAY = 700000
+
+
+def verses(count):
+    return [{"ref": f"Ps. 119:{number}"} for number in range(1, count + 1)]
+
+
+def test_schedule_intervals():
+    card = Card("Ps. 119:1", START_EASE, 0, 0, -1)
+    card = schedule(card, 5, DAY)
+    assert (card.reps, card.interval, card.due) == (1, 1, DAY + 1)
+    card = schedule(card, 5, DAY + 1)
+    assert (card.reps, card.interval, card.due) == (2, 6, DAY + 7)
+    card = schedule(card, 5, DAY + 7)
+    assert (card.reps, card.interval) == (3, round(6 * (START_EASE + 0.2)))
+    assert card.ease == pytest.approx(START_EASE + 0.3)
+
+
+def test_failure_resets_and_ease_has_floor():
+    card = Card("Ps. 119:1", 1.35, 20, 5, DAY)
+    card = schedule(card, 1, DAY)
+    assert (card.reps, card.interval, card.due) == (0, 1, DAY + 1)
+    assert card.ease == 1.3
+
+
+def test_due_reviews_come_before_new_verses():
+    learned = {position: Card(f"Ps. 119:{position + 1}", START_EASE, 1, 1, DAY) for position in range(10)}
+    queue = ReviewQueue("Ps 119", verses(1000), learned)
+    assert queue.due_count(DAY) == (10, 990)
+    served = []
+    for _ in range(10):
+        position, due = queue.next(DAY)
+        assert due
+        served.append(position)
+        queue.review(position, 5, DAY)
+    assert sorted(served) == list(range(10))
+    # Erst jetzt die neuen Verse, in Textreihenfolge
+    assert queue.next(DAY) == (10, True)
+    queue.review(10, 5, DAY)
+    assert queue.next(DAY) == (11, True)
+
+
+def test_new_verses_before_reviews_of_later_days():
+    learned = {0: Card("Ps. 119:1", START_EASE, 1, 1, DAY + 1)}
+    queue = ReviewQueue("Ps 119", verses(3), learned)
+    assert queue.next(DAY) == (1, True)
+
+
+def test_learning_ahead_when_nothing_is_due():
+    queue = ReviewQueue("Ps 119", verses(3))
+    for _ in range(3):
+        position, _ = queue.next(DAY)
+        queue.review(position, 5, DAY)
+    assert queue.due_count(DAY) == (0, 0)
+    assert queue.next(DAY) == (0, False)
+    assert queue.next(DAY + 1) == (0, True)
+
+
+def test_cards_of_replaced_verses_are_dropped():
+    stale = {0: Card("Joh. 3:16", START_EASE, 1, 1, DAY)}
+    queue = ReviewQueue("Ps 119", verses(2), stale)
+    assert queue.due_count(DAY) == (0, 2)
+
+
+def test_quality_for():
+    assert quality_for(False) == 1
+    assert quality_for(True, mistakes=2) == 3
+    assert quality_for(True) == 5
@@ -0,0 +1,64 @@
+import json
+import os
+
+from storage import io_counters, read_json, update_json, write_json_atomic
+
+
+def test_cache_hit_returns_parsed_data_without_reading(tmp_path):
+    path = str(tmp_path / "users.json")
+    write_json_atomic(path, {"anna": {"points": 1}})
+    first = read_json(path)
+    before = io_counters()
+    again = read_json(path)
+    after = io_counters()
+    assert again is first
+    assert after["cache_hits"] == before["cache_hits"] + 1
+    assert after["reads"] == before["reads"]
+
+
+def test_write_json_atomic_invalidates(tmp_path):
+    path = str(tmp_path / "users.json")
+    write_json_atomic(path, {"anna": {"points": 1}})
+    assert read_json(path) == {"anna": {"points": 1}}
+    write_json_atomic(path, {"anna": {"points": 2}})
+    assert read_json(path) == {"anna": {"points": 2}}
+
+
+def test_outside_change_is_detected_by_mtime(tmp_path):
+    path = str(tmp_path / "users.json")
+    write_json_atomic(path, {"anna": 1})
+    assert read_json(path) == {"anna": 1}
+    # Gleiche Größe, nur die mtime verrät die Änderung
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"anna": 2}, f, indent=2)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert read_json(path) == {"anna": 2}
+
+
+def test_prepare_runs_once_per_parse(tmp_path):
+    path = str(tmp_path / "texts.json")
+    write_json_atomic(path, {"DE": {}})
+    calls = []
+
+    def prepare(data):
+        calls.append(1)
+        return {**data, "prepared": True}
+    assert read_json(path, prepare=prepare)["prepared"]
+    assert read_json(path, prepare=prepare)["prepared"]
+    assert len(calls) == 1
+
+
+def test_missing_file_and_update_json(tmp_path):
+    path = str(tmp_path / "spent.json")
+    assert read_json(path) is None
+
+    def add(data):
+        data["a"] = 1
+        return True
+    assert update_json(path, add)
+    assert read_json(path) == {"a": 1}
+    # Ohne Änderung wird nicht geschrieben
+    before = io_counters()["writes"]
+    assert not update_json(path, lambda data: False)
+    assert io_counters()["writes"] == before
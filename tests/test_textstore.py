@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+from textstore import TextStore, content_id
+from verses import VERSE_SCHEMA_VERSION, parse_verses_from_text
+
+TEXT = "1) Eph. 2:8 Denn aus Gnade seid ihr gerettet durch den Glauben\n" \
+       "2) Eph. 2:9 nicht aus Werken damit sich nicht jemand rühme"
+
+
+def test_put_deduplicates_equal_content(tmp_path):
+    store = TextStore(str(tmp_path))
+    verses = parse_verses_from_text(TEXT)
+    first = store.put(verses, VERSE_SCHEMA_VERSION)
+    # Gleicher Inhalt aus einer anderen Quelle: gleicher Schlüssel, eine Datei
+    assert store.put(parse_verses_from_text(TEXT), VERSE_SCHEMA_VERSION) == first
+    assert os.listdir(tmp_path) == [f"{first}.json"]
+    assert store.put(verses[:1], VERSE_SCHEMA_VERSION) != first
+    assert content_id(verses, VERSE_SCHEMA_VERSION) != content_id(verses, VERSE_SCHEMA_VERSION + 1)
+
+
+def test_externalize_resolve_round_trip(tmp_path):
+    store = TextStore(str(tmp_path))
+    details = {"verses": parse_verses_from_text(TEXT), "schema": VERSE_SCHEMA_VERSION, "mode": "linear", "last_index": 1}
+    stored = store.externalize(details)
+    assert "verses" not in stored and "schema" not in stored
+    assert stored["mode"] == "linear" and stored["last_index"] == 1
+
+    # Ein neuer Prozess liest die Verse aus der Datei
+    resolved = TextStore(str(tmp_path)).resolve(stored)
+    assert resolved["verses"] == details["verses"]
+    assert resolved["schema"] == VERSE_SCHEMA_VERSION
+    assert resolved["last_index"] == 1
+
+    # Unverändert wieder gespeichert: dieselbe Datei, dieselbe Liste im Speicher
+    again = store.resolve(stored)
+    assert store.externalize(again)["verses_id"] == stored["verses_id"]
+    assert store.resolve(stored)["verses"] is again["verses"]
+    assert len(os.listdir(tmp_path)) == 1
+
+
+def test_resolve_without_verses_id_and_missing_file(tmp_path):
+    store = TextStore(str(tmp_path))
+    plain = {"verses": [], "mode": "random"}
+    assert store.resolve(plain) is plain
+    with pytest.raises(FileNotFoundError):
+        store.resolve({"verses_id": "0" * 64})
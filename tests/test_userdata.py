@@ -0,0 +1,18 @@
+import userdata
+
+
+def test_get_user_without_loading_all_users():
+    assert userdata.get_user("niemand") is None
+    userdata.register_user("carla", "hash")
+    assert userdata.has_users()
+    user = userdata.get_user("carla")
+    assert user == {"password_hash": "hash", "points": 0}
+    # Eine Kopie: Änderungen berühren den geteilten Cache nicht
+    user["points"] = 99
+    assert userdata.get_user("carla")["points"] == 0
+
+
+def test_new_user_appears_in_leaderboard():
+    board = userdata.get_leaderboard()
+    userdata.register_user("dora", "hash")
+    assert board.points("dora") == 0
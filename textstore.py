@@ -0,0 +1,91 @@
+"""Inhaltsadressierte Ablage der Verslisten (ein Text = eine Datei pro Inhalt).
+
+Statt jede Versdatei (privat wie öffentlich) die vollständigen Verse tragen zu
+lassen, liegt jede unterschiedliche Versliste genau einmal unter
+``<Verzeichnis>/<sha256>.json``; die Texte verweisen mit ``verses_id`` darauf.
+Speichern zehn Benutzer dasselbe Kapitel, gibt es eine Datei und - weil
+geladene Listen pro Prozess geteilt werden - auch nur eine Kopie im Speicher.
+
+Der Schlüssel ist der Hash über Schema-Version, Referenzen und Verstexte. Eine
+Datei ändert sich also nie: gelesen wird sie einmal pro Prozess, geschrieben
+nur, wenn es sie noch nicht gibt. Nicht mehr referenzierte Dateien bleiben
+liegen.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from storage import read_json, write_json_atomic
+from verses import VERSE_SCHEMA_VERSION
+
+
+def content_id(verses, schema=VERSE_SCHEMA_VERSION):
+    """Inhaltsschlüssel einer Versliste (Pläne sind aus Referenz und Text abgeleitet)."""
+    canonical = json.dumps([schema, [[verse.get("ref", ""), verse.get("text", "")] for verse in verses]],
+                           ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class TextStore:
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._bodies = {} # verses_id -> (Schema, Versliste), von allen Texten geteilt
+
+    def _path(self, verses_id):
+        return os.path.join(self.directory, f"{verses_id}.json")
+
+    def get(self, verses_id):
+        """``(Schema, Versliste)`` zu ``verses_id`` oder None, wenn die Datei fehlt."""
+        with self._lock:
+            body = self._bodies.get(verses_id)
+        if body is not None:
+            return body
+        data = read_json(self._path(verses_id))
+        if data is None:
+            return None
+        body = (data.get("schema", 1), data.get("verses", []))
+        with self._lock:
+            return self._bodies.setdefault(verses_id, body)
+
+    def put(self, verses, schema=VERSE_SCHEMA_VERSION):
+        """Legt ``verses`` ab (falls neu) und liefert den Schlüssel."""
+        verses_id = content_id(verses, schema)
+        with self._lock:
+            if verses_id in self._bodies:
+                return verses_id
+        path = self._path(verses_id)
+        if not os.path.exists(path):
+            os.makedirs(self.directory, exist_ok=True)
+            write_json_atomic(path, {"schema": schema, "verses": verses})
+        with self._lock:
+            self._bodies.setdefault(verses_id, (schema, verses))
+        return verses_id
+
+    def resolve(self, details):
+        """Text mit ``verses_id`` -> Text mit (geteilter) ``verses``-Liste; andere unverändert."""
+        verses_id = details.get("verses_id")
+        if verses_id is None:
+            return details
+        body = self.get(verses_id)
+        if body is None:
+            raise FileNotFoundError(self._path(verses_id))
+        schema, verses = body
+        return {**details, "verses": verses, "schema": schema}
+
+    def externalize(self, details):
+        """Text mit ``verses`` -> Text mit ``verses_id`` (für die Versdatei); legt die Verse bei Bedarf ab."""
+        if "verses" not in details:
+            return details
+        verses, schema = details["verses"], details.get("schema", 1)
+        verses_id = details.get("verses_id")
+        with self._lock:
+            body = self._bodies.get(verses_id)
+        # Unverändert geladener Text: dasselbe Listenobjekt, kein erneutes Hashen
+        if body is None or body[1] is not verses or body[0] != schema:
+            verses_id = self.put(verses, schema)
+        stored = {key: value for key, value in details.items() if key not in ("verses", "schema")}
+        stored["verses_id"] = verses_id
+        return stored
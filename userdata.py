@@ -0,0 +1,582 @@
+"""Laden und Speichern von Benutzern, Texten und Fortschritt.
+
+Die Funktionen hier kennen kein Streamlit, damit sie auch von Kommandozeilen-
+werkzeugen genutzt werden können. Fehler werden als ``StorageError`` mit einer
+anzeigbaren Meldung gemeldet; ``app.py`` zeigt sie in der Oberfläche an.
+
+Als Speicher dienen entweder die JSON-Dateien unter ``USER_DATA_DIR`` (Standard)
+oder eine SQLite-Datenbank (``VERSER_STORAGE=sqlite``, siehe sqlite_store.py).
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from storage import file_signature, read_json, use_snapshot_barrier, write_json, update_json
+from metrics import timed
+from points import PointsLedger
+from leaderboard import LeaderboardIndex, WindowedLeaderboard
+from library_index import LibraryIndex
+from refs import RefIndex
+from verses import upgrade_text
+from srs import card_from_json, card_to_json
+from textstore import TextStore
+from writebehind import WriteBehindBuffer, FLUSH_INTERVAL
+
+# --- Konstanten ---
+USER_DATA_DIR = os.environ.get("VERSER_DATA_DIR", "user_data")
+USERS_FILE = os.path.join(USER_DATA_DIR, "users.json")
+PUBLIC_VERSES_FILE = os.path.join(USER_DATA_DIR, "public_verses.json")
+DB_FILE = os.path.join(USER_DATA_DIR, "verser.db")
+TEXTS_DIR = os.path.join(USER_DATA_DIR, "texts") # Inhaltsadressierte Verslisten
+SPENT_TOKENS_FILE = os.path.join(USER_DATA_DIR, "spent_tokens.json") # Eingelöste Punkt-Tokens der API
+STORAGE_BACKEND = os.environ.get("VERSER_STORAGE", "json") # "json" oder "sqlite"
+PROGRESS_FLUSH_INTERVAL = float(os.environ.get("VERSER_FLUSH_INTERVAL", FLUSH_INTERVAL)) # Sekunden
+METRICS_FILE = os.environ.get("VERSER_METRICS_FILE", os.path.join(USER_DATA_DIR, "metrics.prom"))
+
+logger = logging.getLogger(__name__)
+
+os.makedirs(USER_DATA_DIR, exist_ok=True)
+use_snapshot_barrier(USER_DATA_DIR) # Konsistente Online-Snapshots, siehe backup.py
+
+
+class StorageError(Exception):
+    """Lesen oder Schreiben ist fehlgeschlagen; die Meldung ist für Benutzer gedacht."""
+
+
+_sqlite_store = None
+_points_ledger = None
+_leaderboard = None
+_windowed_leaderboard = None
+_library_indexes = {} # Sprache -> LibraryIndex
+_ref_indexes = {} # Sprache -> RefIndex der öffentlichen Texte
+_progress_buffer = None
+_text_store = None
+_singleton_lock = threading.RLock()
+
+
+def use_sqlite():
+    return STORAGE_BACKEND == "sqlite"
+
+
+def get_sqlite_store():
+    """Die prozessweite SQLite-Verbindungsverwaltung (nur im SQLite-Betrieb)."""
+    global _sqlite_store
+    with _singleton_lock:
+        if _sqlite_store is None:
+            from sqlite_store import SQLiteStore
+            _sqlite_store = SQLiteStore(DB_FILE)
+        return _sqlite_store
+
+
+# --- Benutzer ---
+
+@timed("load_users")
+def load_users():
+    """Alle Benutzer als ``{name: {"password_hash": ..., "points": ...}}``.
+
+    Kopiert jeden Benutzer; für Login und Anzeige reichen ``get_user`` und ``has_users``.
+    """
+    if use_sqlite():
+        return get_sqlite_store().load_users()
+    try:
+        cached = read_json(USERS_FILE)
+    except (json.JSONDecodeError, IOError):
+        raise StorageError("Benutzerdatei konnte nicht gelesen werden.")
+    if cached is None:
+        return {}
+    # Flache Kopie pro Benutzer, damit Änderungen den geteilten Cache nicht berühren
+    data = {user: dict(details) for user, details in cached.items()}
+    for user, details in data.items():
+        if 'points' not in details or not isinstance(details['points'], (int, float)):
+            data[user]['points'] = 0
+    return data
+
+
+def _read_users():
+    try:
+        return read_json(USERS_FILE) or {}
+    except (json.JSONDecodeError, IOError):
+        raise StorageError("Benutzerdatei konnte nicht gelesen werden.")
+
+
+@timed("get_user")
+def get_user(username):
+    """``{"password_hash": ..., "points": ...}`` von ``username`` oder None; ein Zugriff statt aller Benutzer."""
+    if use_sqlite():
+        return get_sqlite_store().get_user(username)
+    details = _read_users().get(username)
+    if details is None:
+        return None
+    user = dict(details)
+    if not isinstance(user.get("points"), (int, float)):
+        user["points"] = 0
+    return user
+
+
+@timed("has_users")
+def has_users():
+    if use_sqlite():
+        return get_sqlite_store().has_users()
+    return bool(_read_users())
+
+
+@timed("register_user")
+def register_user(username, password_hash):
+    """Legt einen Benutzer atomar an. False, wenn der Name bereits vergeben ist."""
+    if use_sqlite():
+        added = get_sqlite_store().add_user(username, password_hash)
+    else:
+        def add_user(users):
+            if username in users:
+                return False
+            users[username] = {"password_hash": password_hash, "points": 0}
+            return True
+        try:
+            added = update_json(USERS_FILE, add_user)
+        except (json.JSONDecodeError, IOError):
+            raise StorageError("Fehler beim Speichern der Benutzerdaten.")
+    with _singleton_lock:
+        if added and _leaderboard is not None:
+            _leaderboard.add(username) # Sonst erst mit den ersten Punkten im Leaderboard
+    return added
+
+
+@timed("set_password_hash")
+def set_password_hash(username, password_hash):
+    """Ersetzt den Hash eines bestehenden Benutzers (z.B. nach Änderung des bcrypt-Kostenfaktors)."""
+    if use_sqlite():
+        get_sqlite_store().set_password_hash(username, password_hash)
+        return
+
+    def replace_hash(users):
+        if username not in users:
+            return False
+        users[username]["password_hash"] = password_hash
+        return True
+    try:
+        update_json(USERS_FILE, replace_hash)
+    except (json.JSONDecodeError, IOError):
+        raise StorageError("Fehler beim Speichern der Benutzerdaten.")
+
+
+# --- Punkte ---
+
+def get_points_ledger():
+    """Ein Ledger pro Prozess, geteilt von allen Sessions."""
+    global _points_ledger
+    with _singleton_lock:
+        if _points_ledger is None:
+            if use_sqlite():
+                from sqlite_store import SQLitePointsLedger
+                _points_ledger = SQLitePointsLedger(get_sqlite_store())
+            else:
+                # Beim allerersten Start werden die Punkte aus users.json übernommen
+                seed = lambda: {user: details["points"] for user, details in load_users().items()}
+                _points_ledger = PointsLedger(USER_DATA_DIR, seed=seed)
+        return _points_ledger
+
+
+@timed("spend_token")
+def spend_token(nonce, expires):
+    """Merkt ``nonce`` bis ``expires`` (Unix-Zeit) als eingelöst; True nur beim ersten Mal.
+
+    Geteilt über alle Prozesse und API-Instanzen auf demselben Datenordner
+    bzw. derselben Datenbank. Abgelaufene Einträge werden dabei entfernt.
+    """
+    if use_sqlite():
+        return get_sqlite_store().spend_token(nonce, expires)
+    now = time.time()
+
+    def spend(tokens):
+        for spent in [spent for spent, until in tokens.items() if until < now]:
+            del tokens[spent]
+        if nonce in tokens:
+            return False
+        tokens[nonce] = expires
+        return True
+    try:
+        return update_json(SPENT_TOKENS_FILE, spend)
+    except (json.JSONDecodeError, IOError):
+        raise StorageError("Eingelöste Punkte konnten nicht gespeichert werden.")
+
+
+@timed("get_leaderboard")
+def get_leaderboard():
+    """Der prozessweite Leaderboard-Index, aktuell gehalten durch den Ledger.
+
+    Registrierte Benutzer ohne Punkte werden einmal beim Aufbau und danach bei
+    ``register_user`` ergänzt; in anderen Prozessen Registrierte erscheinen mit
+    ihren ersten Punkten.
+    """
+    global _leaderboard
+    ledger = get_points_ledger()
+    with _singleton_lock:
+        if _leaderboard is None:
+            leaderboard = LeaderboardIndex(ledger.balances())
+            for username in load_users():
+                leaderboard.add(username)
+            ledger.add_listener(leaderboard.update)
+            _leaderboard = leaderboard
+    ledger.refresh() # Vergaben anderer Prozesse übernehmen
+    return _leaderboard
+
+
+@timed("get_windowed_leaderboard")
+def get_windowed_leaderboard():
+    """Prozessweite Top-Listen für heute, 7 und 30 Tage (gesamt und pro Sprache), vom Ledger aktuell gehalten."""
+    global _windowed_leaderboard
+    ledger = get_points_ledger()
+    with _singleton_lock:
+        if _windowed_leaderboard is None:
+            _windowed_leaderboard = WindowedLeaderboard()
+            ledger.add_window_listener(_windowed_leaderboard)
+    ledger.refresh() # Vergaben anderer Prozesse übernehmen
+    return _windowed_leaderboard
+
+
+# --- Verse ---
+
+def get_text_store():
+    """Die inhaltsadressierte Ablage der Verslisten (prozessweit, siehe textstore.py)."""
+    global _text_store
+    with _singleton_lock:
+        if _text_store is None:
+            _text_store = TextStore(TEXTS_DIR)
+        return _text_store
+
+
+def _map_texts_file(all_lang_data, convert):
+    converted = {}
+    for language_code, texts in all_lang_data.items():
+        if not isinstance(texts, dict) or "verses" in texts:
+            converted[language_code] = texts # Altes Format ohne Sprachebene: unverändert lassen
+            continue
+        converted[language_code] = {title: convert(details) for title, details in texts.items()}
+    return converted
+
+
+def prepare_texts_file(all_lang_data):
+    """Löst ``verses_id`` auf und rüstet fehlende Bausteinpläne nach (einmal pro Parsen).
+
+    Die Verslisten kommen aus der geteilten Ablage, gleiche Texte verschiedener
+    Benutzer sind also ein Objekt. Ältere Dateien mit eingebetteten Versen
+    werden unverändert gelesen und beim nächsten Schreiben umgestellt.
+    """
+    store = get_text_store()
+    return _map_texts_file(all_lang_data, lambda details: upgrade_text(store.resolve(details)))
+
+
+def dump_texts_file(all_lang_data):
+    """Gegenstück zu ``prepare_texts_file``: Verse in die Ablage, in der Datei nur ``verses_id``."""
+    return _map_texts_file(all_lang_data, get_text_store().externalize)
+
+def safe_filename(username):
+    return "".join(c for c in username if c.isalnum() or c in ('_', '-')).rstrip()
+
+
+def get_user_verse_file(username):
+    safe_username = safe_filename(username)
+    if not safe_username:
+        safe_username = f"user_{random.randint(1000, 9999)}"
+    return os.path.join(USER_DATA_DIR, f"{safe_username}_verses_v2.json") # v2 wegen Sprachstruktur
+
+
+@timed("load_user_verses")
+def load_user_verses(username, language_code):
+    """Lädt die privaten Verse eines Benutzers für eine bestimmte Sprache."""
+    if use_sqlite():
+        lang_data = get_sqlite_store().load_texts(username, language_code)
+    else:
+        filepath = get_user_verse_file(username)
+        try:
+            all_lang_data = read_json(filepath, prepare=prepare_texts_file)
+        except (json.JSONDecodeError, IOError):
+            raise StorageError(f"Private Versdatei für {username} konnte nicht gelesen werden.")
+        if all_lang_data is None:
+            return {}
+        # Flache Kopie pro Text: mode/last_index dürfen geändert werden, die Verslisten bleiben geteilt
+        lang_data = {title: dict(details) for title, details in all_lang_data.get(language_code, {}).items()}
+        # Noch nicht geschriebener Fortschritt aus dem Write-Behind-Puffer
+        for title, fields in get_progress_buffer().overlay(username, language_code).items():
+            if title in lang_data:
+                lang_data[title].update(fields)
+    # Stelle sicher, dass interne Flags korrekt sind (optional)
+    for title, details in lang_data.items():
+        details['public'] = False # Sollten alle privat sein
+        details['language'] = language_code
+    return lang_data
+
+
+@timed("save_user_verses")
+def save_user_verses(username, language_code, lang_specific_data):
+    """Speichert die privaten Verse eines Benutzers für eine bestimmte Sprache."""
+    # Stelle sicher, dass nur wirklich private Daten gespeichert werden (mit Bausteinplänen)
+    private_data = {title: upgrade_text(details) for title, details in lang_specific_data.items() if not details.get('public', False)}
+    if use_sqlite():
+        get_sqlite_store().save_texts(username, language_code, private_data)
+        return
+
+    filepath = get_user_verse_file(username)
+    # Die Daten enthalten gepufferten Fortschritt dieser Sprache bereits (load_user_verses)
+    get_progress_buffer().discard(username, language_code)
+
+    def replace_language(all_data):
+        # Update die spezifische Sprache, die anderen bleiben wie auf der Platte
+        all_data[language_code] = private_data
+        return True
+    try:
+        update_json(filepath, replace_language, prepare=prepare_texts_file, dump=dump_texts_file)
+    except json.JSONDecodeError:
+        logger.warning("Konnte alte Daten für %s nicht laden, überschreibe evtl.", username)
+        try:
+            write_json(filepath, dump_texts_file({language_code: private_data}))
+        except IOError as e:
+            raise StorageError(f"Fehler beim Speichern der privaten Verse für {username}: {e}")
+    except IOError as e:
+        raise StorageError(f"Fehler beim Speichern der privaten Verse für {username}: {e}")
+
+
+@timed("save_progress")
+def save_progress(username, language_code, title, last_index=None, mode=None):
+    """Speichert ``last_index`` und/oder ``mode`` eines privaten Textes.
+
+    Im SQLite-Betrieb ist das ein einzelnes Zeilen-Update. Bei JSON-Dateien
+    landet die Änderung im Write-Behind-Puffer und wird gesammelt geschrieben
+    (siehe writebehind.py). False, wenn der Text nicht (mehr) existiert.
+    """
+    if use_sqlite():
+        return get_sqlite_store().save_progress(username, language_code, title, last_index=last_index, mode=mode)
+    try:
+        all_lang_data = read_json(get_user_verse_file(username), prepare=prepare_texts_file)
+    except (json.JSONDecodeError, IOError):
+        raise StorageError(f"Private Versdatei für {username} konnte nicht gelesen werden.")
+    if title not in ((all_lang_data or {}).get(language_code) or {}):
+        return False
+    fields = {}
+    if last_index is not None:
+        fields["last_index"] = last_index
+    if mode is not None:
+        fields["mode"] = mode
+    get_progress_buffer().put(username, language_code, title, **fields)
+    return True
+
+
+@timed("write_progress")
+def _write_progress(username, changes):
+    """Schreibt gepufferten Fortschritt eines Benutzers mit einem atomaren Read-Modify-Write."""
+    def apply_changes(all_data):
+        changed = False
+        for (language_code, title), fields in changes.items():
+            texts = all_data.get(language_code)
+            if not isinstance(texts, dict) or title not in texts:
+                continue # Text inzwischen gelöscht
+            texts = dict(texts) # Kopien, der Cache bleibt unverändert
+            texts[title] = {**texts[title], **fields}
+            all_data[language_code] = texts
+            changed = True
+        return changed
+    update_json(get_user_verse_file(username), apply_changes, prepare=prepare_texts_file, dump=dump_texts_file)
+
+
+def get_progress_buffer():
+    """Der prozessweite Write-Behind-Puffer für ``save_progress``."""
+    global _progress_buffer
+    with _singleton_lock:
+        if _progress_buffer is None:
+            _progress_buffer = WriteBehindBuffer(_write_progress, interval=PROGRESS_FLUSH_INTERVAL)
+        return _progress_buffer
+
+
+def flush_progress(username=None):
+    """Schreibt gepufferten Fortschritt sofort (z.B. beim Logout)."""
+    if _progress_buffer is not None:
+        _progress_buffer.flush(username)
+
+
+@timed("load_public_verses")
+def load_public_verses(language_code):
+    """Lädt alle öffentlichen Verse für eine bestimmte Sprache."""
+    if use_sqlite():
+        lang_data = get_sqlite_store().load_texts(None, language_code)
+    else:
+        try:
+            all_lang_data = read_json(PUBLIC_VERSES_FILE, prepare=prepare_texts_file)
+        except (json.JSONDecodeError, IOError):
+            raise StorageError("Öffentliche Versdatei konnte nicht gelesen werden.")
+        if all_lang_data is None:
+            return {}
+        lang_data = {title: dict(details) for title, details in all_lang_data.get(language_code, {}).items()}
+    # Stelle sicher, dass interne Flags korrekt sind
+    for title, details in lang_data.items():
+        details['public'] = True
+        details['language'] = language_code
+    return lang_data
+
+
+@timed("load_public_text")
+def load_public_text(language_code, title):
+    """Ein einzelner öffentlicher Text (oder None), ohne alle Texte der Sprache zu kopieren."""
+    if use_sqlite():
+        details = get_sqlite_store().load_text(None, language_code, title)
+    else:
+        try:
+            all_lang_data = read_json(PUBLIC_VERSES_FILE, prepare=prepare_texts_file)
+        except (json.JSONDecodeError, IOError):
+            raise StorageError("Öffentliche Versdatei konnte nicht gelesen werden.")
+        details = ((all_lang_data or {}).get(language_code) or {}).get(title)
+        details = dict(details) if details is not None else None
+    if details is not None:
+        details['public'] = True
+        details['language'] = language_code
+    return details
+
+
+def public_texts_version(language_code):
+    """Günstiger Änderungsstand der öffentlichen Texte (stat bzw. eine Aggregat-Abfrage)."""
+    if use_sqlite():
+        return get_sqlite_store().texts_version(None, language_code)
+    return file_signature(PUBLIC_VERSES_FILE)
+
+
+@timed("get_library_index")
+def get_library_index(language_code):
+    """Der Suchindex der öffentlichen Texte einer Sprache.
+
+    Wird einmal pro Prozess und Sprache gebaut und nur neu aufgebaut, wenn ein
+    anderer Prozess die öffentlichen Texte geändert hat.
+    """
+    version = public_texts_version(language_code)
+    with _singleton_lock:
+        index = _library_indexes.get(language_code)
+        if index is None or index.version != version:
+            index = LibraryIndex(load_public_verses(language_code), version)
+            _library_indexes[language_code] = index
+        return index
+
+
+@timed("get_ref_index")
+def get_ref_index(language_code):
+    """Referenzindex über alle öffentlichen Texte einer Sprache (Sprünge in andere Texte desselben Buches).
+
+    Wie der Suchindex einmal pro Prozess und Sprache gebaut; nach einer
+    Änderung der öffentlichen Texte beim nächsten Zugriff neu.
+    """
+    version = public_texts_version(language_code)
+    with _singleton_lock:
+        index = _ref_indexes.get(language_code)
+        if index is None or index.version != version:
+            texts = {title: details.get("verses", []) for title, details in load_public_verses(language_code).items()}
+            index = RefIndex(texts, version)
+            _ref_indexes[language_code] = index
+        return index
+
+
+def _update_library_index(language_code, public_data):
+    with _singleton_lock:
+        index = _library_indexes.get(language_code)
+        if index is not None:
+            index.sync(public_data)
+            index.version = public_texts_version(language_code)
+
+
+def _index_added_texts(language_code, added):
+    with _singleton_lock:
+        index = _library_indexes.get(language_code)
+        if index is not None:
+            for title, details in added.items():
+                index.add(title, details)
+            index.version = public_texts_version(language_code)
+
+
+@timed("add_public_texts")
+def add_public_texts(language_code, texts):
+    """Fügt öffentliche Texte hinzu, ohne vorhandene zu berühren; liefert die neu angelegten Titel.
+
+    Titel, die es (inzwischen) schon gibt, werden übersprungen. Gelesen und
+    geschrieben wird unter einer Sperre bzw. in einer Transaktion, gleichzeitig
+    hinzugefügte Texte gehen also nicht verloren.
+    """
+    public_data = {title: upgrade_text({**details, "public": True}) for title, details in texts.items()}
+    if use_sqlite():
+        added = get_sqlite_store().add_texts(None, language_code, public_data)
+    else:
+        added = []
+
+        def add(all_data):
+            lang_data = dict(all_data.get(language_code, {}))
+            for title, details in public_data.items():
+                if title not in lang_data:
+                    lang_data[title] = details
+                    added.append(title)
+            all_data[language_code] = lang_data
+            return bool(added)
+        try:
+            update_json(PUBLIC_VERSES_FILE, add, prepare=prepare_texts_file, dump=dump_texts_file)
+        except (json.JSONDecodeError, IOError) as e:
+            raise StorageError(f"Fehler beim Speichern der öffentlichen Verse: {e}")
+    _index_added_texts(language_code, {title: public_data[title] for title in added})
+    return added
+
+
+@timed("save_public_verses")
+def save_public_verses(language_code, lang_specific_data):
+    """Speichert alle öffentlichen Verse für eine bestimmte Sprache."""
+    # Stelle sicher, dass nur als public markierte gespeichert werden (mit Bausteinplänen)
+    public_data = {title: upgrade_text(details) for title, details in lang_specific_data.items() if details.get('public', False)}
+    if use_sqlite():
+        get_sqlite_store().save_texts(None, language_code, public_data)
+        _update_library_index(language_code, public_data)
+        return
+
+    def replace_language(all_data):
+        all_data[language_code] = public_data
+        return True
+    # Gesperrt gelesen und geschrieben: die übrigen Sprachen bleiben auf dem neuesten Stand
+    try:
+        update_json(PUBLIC_VERSES_FILE, replace_language, prepare=prepare_texts_file, dump=dump_texts_file)
+    except (json.JSONDecodeError, IOError) as e:
+        raise StorageError(f"Fehler beim Speichern der öffentlichen Verse: {e}")
+    _update_library_index(language_code, public_data)
+
+
+# --- Wiederholung (SM-2) ---
+
+def get_user_review_file(username):
+    return os.path.join(USER_DATA_DIR, f"{safe_filename(username) or 'user'}_reviews.json")
+
+
+@timed("load_review_cards")
+def load_review_cards(username, language_code, deck):
+    """Gespeicherte Karten eines Textes (``deck``: angezeigter Titel) als ``{position: Card}``."""
+    if use_sqlite():
+        return get_sqlite_store().load_review_cards(username, language_code, deck)
+    try:
+        data = read_json(get_user_review_file(username))
+    except (json.JSONDecodeError, IOError):
+        raise StorageError(f"Wiederholungsdaten für {username} konnten nicht gelesen werden.")
+    cards = ((data or {}).get(language_code) or {}).get(deck, {})
+    return {int(position): card_from_json(card) for position, card in cards.items()}
+
+
+@timed("save_review_card")
+def save_review_card(username, language_code, deck, position, card):
+    """Speichert eine Karte nach einer Bewertung (im SQLite-Betrieb eine Zeile)."""
+    if use_sqlite():
+        get_sqlite_store().save_review_card(username, language_code, deck, position, card)
+        return
+
+    def put_card(data):
+        # Verschachtelte Dicts kopieren, der Cache bleibt unverändert
+        language_cards = dict(data.get(language_code) or {})
+        deck_cards = dict(language_cards.get(deck) or {})
+        deck_cards[str(position)] = card_to_json(card)
+        language_cards[deck] = deck_cards
+        data[language_code] = language_cards
+        return True
+    try:
+        update_json(get_user_review_file(username), put_card)
+    except (json.JSONDecodeError, IOError) as e:
+        raise StorageError(f"Fehler beim Speichern der Wiederholungsdaten für {username}: {e}")
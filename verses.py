@@ -1,11 +1,94 @@
+import io
 import re
+from collections import namedtuple
 
-def parse_verses_from_text(raw_text):
-    lines = raw_text.strip().split("\n")
-    verses = []
-    for line in lines:
-        match = re.match(r"\d+\)\s*(\w+\.\s*\d+:\d+)\s+(.*)", line.strip())
-        if match:
-            ref, text = match.groups()
-            verses.append({"ref": ref.strip(), "text": text.strip()})
-    return verses
+from metrics import timed
+
+MAX_CHUNKS = 8
+# Version des Vers-Formats. Erhöhen, wenn sich die Aufteilung (z.B. MAX_CHUNKS) ändert,
+# damit gespeicherte Pläne beim Laden neu berechnet werden.
+VERSE_SCHEMA_VERSION = 2
+
+# "12) 1 Kor. 13:4  Text...": Nummer, Referenz (optionale Buchnummer, Buchname mit
+# oder ohne Punkt, Kapitel:Vers) und Text. Einmal kompiliert statt pro Zeile.
+VERSE_LINE_RE = re.compile(
+    r"\s*\d+\)\s*(?P<ref>(?:\d+\.?\s*)?[^\W\d_]+\.?\s*\d+:\d+)\s+(?P<text>.*?)\s*$"
+)
+NUMBERED_LINE_RE = re.compile(r"\s*\d+\)")
+
+ParseError = namedtuple("ParseError", "line_number line reason")
+
+def iter_verses(lines, errors=None):
+    """Liest Verse zeilenweise aus einem beliebigen Iterable (z.B. einer offenen Datei).
+
+    Liefert jeden Vers sofort (mit Bausteinplan), der Speicherbedarf hängt also
+    nicht von der Textlänge ab. Zeilen, die nicht passen, werden als
+    ``ParseError`` mit Zeilennummer an ``errors`` angehängt; Leerzeilen werden
+    übersprungen.
+    """
+    match_line = VERSE_LINE_RE.match
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        match = match_line(line)
+        if match is None:
+            if errors is not None:
+                if NUMBERED_LINE_RE.match(line):
+                    reason = "Referenz nicht erkannt (erwartet z.B. 'Eph. 1:1' oder '1 Kor 13:4')"
+                else:
+                    reason = "Zeile beginnt nicht mit 'Nummer)'"
+                errors.append(ParseError(line_number, line.strip(), reason))
+            continue
+        text = match.group("text")
+        if not text:
+            if errors is not None:
+                errors.append(ParseError(line_number, line.strip(), "Kein Verstext"))
+            continue
+        yield plan_verse({"ref": " ".join(match.group("ref").split()), "text": text})
+
+@timed("parse_verses")
+def parse_verses_from_text(raw_text, errors=None):
+    """Wie ``iter_verses``, aber für einen String und als Liste."""
+    return list(iter_verses(io.StringIO(raw_text), errors))
+
+def group_words_into_chunks(words, max_chunks=MAX_CHUNKS):
+    n_words = len(words)
+    if n_words == 0: return []
+    num_chunks = min(n_words, max_chunks)
+    base_chunk_size = n_words // num_chunks
+    remainder = n_words % num_chunks
+    chunks = []
+    current_index = 0
+    for i in range(num_chunks):
+        chunk_size = base_chunk_size + (1 if i < remainder else 0)
+        chunk_words = words[current_index : current_index + chunk_size]
+        chunks.append(" ".join(chunk_words))
+        current_index += chunk_size
+    return chunks
+
+def plan_verse(verse):
+    """Ergänzt einen Vers um seine Bausteine, die Wortanzahl und den Punktwert.
+
+    Wird einmal beim Speichern berechnet, damit die Lernschleife nur noch
+    auf fertige Daten zugreift. Liefert ein neues Dict.
+    """
+    tokens = verse.get("text", "").split()
+    return {
+        **verse,
+        "chunks": group_words_into_chunks(tokens, MAX_CHUNKS),
+        "tokens": len(tokens),
+        "points": len(tokens), # Ein Punkt pro Wort
+    }
+
+def upgrade_text(details):
+    """Bringt einen gespeicherten Text auf VERSE_SCHEMA_VERSION (fehlende Pläne nachrechnen).
+
+    Ändert ``details`` nicht, sondern liefert bei Bedarf ein neues Dict.
+    """
+    if details.get("schema", 1) >= VERSE_SCHEMA_VERSION:
+        return details
+    return {
+        **details,
+        "verses": [plan_verse(verse) for verse in details.get("verses", [])],
+        "schema": VERSE_SCHEMA_VERSION,
+    }
@@ -0,0 +1,97 @@
+"""Write-Behind-Puffer für kleine Fortschrittsänderungen (``last_index``, ``mode``).
+
+Ohne Puffer schreibt jeder Verswechsel die komplette Versdatei des Benutzers
+(alle Sprachen, alle Texte) neu, nur um eine Zahl zu ändern. Der Puffer
+sammelt die Änderungen pro Benutzer im Speicher; spätere Werte für denselben
+Text überschreiben frühere. Ein Hintergrund-Thread schreibt sie alle
+``interval`` Sekunden gesammelt weg, außerdem beim Logout (``flush(user)``)
+und beim Beenden des Prozesses (atexit).
+
+Bis zum Schreiben liefert ``overlay`` die gepufferten Werte, damit Leser im
+selben Prozess den neuesten Stand sehen.
+"""
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 15 # Sekunden
+
+
+class WriteBehindBuffer:
+    """``write(username, changes)`` schreibt ``{(sprache, titel): {feld: wert}}`` eines Benutzers."""
+
+    def __init__(self, write, interval=FLUSH_INTERVAL):
+        self._write = write
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock() # Nur ein Flush gleichzeitig
+        self._pending = {} # Benutzer -> {(Sprache, Titel): Felder}
+        self._in_flight = {} # Werden gerade geschrieben, für overlay weiter sichtbar
+        self._thread = None
+        self._stop = threading.Event()
+
+    def put(self, username, language_code, title, **fields):
+        with self._lock:
+            self._pending.setdefault(username, {}).setdefault((language_code, title), {}).update(fields)
+            if self._thread is None:
+                self._start()
+
+    def overlay(self, username, language_code):
+        """Gepufferte Felder pro Titel für einen Benutzer und eine Sprache."""
+        result = {}
+        with self._lock:
+            for changes in (self._in_flight.get(username), self._pending.get(username)):
+                for (language, title), fields in (changes or {}).items():
+                    if language == language_code:
+                        result.setdefault(title, {}).update(fields)
+        return result
+
+    def discard(self, username, language_code):
+        """Verwirft gepufferte Änderungen, z.B. weil die Sprache gerade komplett gespeichert wurde."""
+        with self._lock:
+            changes = self._pending.get(username)
+            if changes:
+                for key in [key for key in changes if key[0] == language_code]:
+                    del changes[key]
+
+    def pending_count(self):
+        with self._lock:
+            return sum(len(changes) for changes in self._pending.values())
+
+    def flush(self, username=None):
+        """Schreibt die Änderungen eines (oder aller) Benutzer jetzt; eine Datei pro Benutzer."""
+        with self._flush_lock:
+            with self._lock:
+                users = [username] if username is not None else list(self._pending)
+                batch = {user: self._pending.pop(user) for user in users if self._pending.get(user)}
+                self._in_flight = batch
+            try:
+                for user, changes in batch.items():
+                    try:
+                        self._write(user, changes)
+                    except Exception:
+                        logger.exception("Fortschritt von %s konnte nicht gespeichert werden", user)
+                        with self._lock:
+                            # Für den nächsten Versuch zurücklegen; neuere Werte gewinnen
+                            newer = self._pending.setdefault(user, {})
+                            for key, fields in changes.items():
+                                newer[key] = {**fields, **newer.get(key, {})}
+            finally:
+                with self._lock:
+                    self._in_flight = {}
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def close(self):
+        """Beendet den Hintergrund-Thread und schreibt alles Ausstehende."""
+        self._stop.set()
+        self.flush()